@@ -83,21 +83,31 @@ class RecordingCursorWrapper:
         except UnicodeDecodeError:
             return repr(param)
 
+    def _explain(self, sql, params):
+        explain_prefix = self.db.ops.explain_query_prefix()
+        self.cursor.execute(f'{explain_prefix} {sql}', params)
+        result = self.cursor.fetchall()
+
+        # Convert the result in the same way as Django, see: SQLCompiler.explain_query():
+        explain = []
+        for row in result:
+            if not isinstance(row, str):
+                explain.append(' '.join(str(c) for c in row))
+            else:
+                explain.append(row)
+        return explain
+
+    def _decode_params(self, params):
+        try:
+            return json.dumps(self._decode(params), cls=DjangoJSONEncoder)
+        except TypeError:
+            return ''  # object not JSON serializable, we have to live with that
+
     def _record(self, method, sql, params):
         if not self.query_explain:
             explain = None
         else:
-            explain_prefix = self.db.ops.explain_query_prefix()
-            self.cursor.execute(f'{explain_prefix} {sql}', params)
-            result = self.cursor.fetchall()
-
-            # Convert the result in the same way as Django, see: SQLCompiler.explain_query():
-            explain = []
-            for row in result:
-                if not isinstance(row, str):
-                    explain.append(' '.join(str(c) for c in row))
-                else:
-                    explain.append(row)
+            explain = self._explain(sql, params)
 
         start = time.monotonic()
         try:
@@ -106,10 +116,7 @@ class RecordingCursorWrapper:
             stop = time.monotonic()
             duration = (stop - start) * 1000
 
-            try:
-                _params_decoded = json.dumps(self._decode(params), cls=DjangoJSONEncoder)
-            except TypeError:
-                _params_decoded = ''  # object not JSON serializable, we have to live with that
+            _params_decoded = self._decode_params(params)
 
             sql = str(sql)  # is sometimes an object, e.g. psycopg Composed, so ensure string
             stacktrace = self.get_stacktrace()
@@ -134,3 +141,54 @@ class RecordingCursorWrapper:
 
     def executemany(self, sql, param_list):
         return self._record(self.cursor.executemany, sql, param_list)
+
+
+class LightweightCursorWrapper(RecordingCursorWrapper):
+    """
+    A RecordingCursorWrapper with a low overhead, e.g.: to record queries in production.
+
+    The full SQL, the decoded parameters and the stack trace are only collected for queries
+    that took at least "slow_query_threshold" milliseconds. All other queries are recorded
+    with the raw SQL, the raw parameters and the duration.
+    EXPLAIN is never captured: It has to run before the query, but the duration is only known afterwards.
+    """
+
+    def __init__(
+        self,
+        cursor,
+        db,
+        logger,
+        collect_stacktrace=None,
+        query_explain: bool = False,
+        *,
+        slow_query_threshold: float = 100,  # milliseconds
+    ):
+        assert not query_explain, 'EXPLAIN is not supported'
+        super().__init__(cursor, db, logger, collect_stacktrace=collect_stacktrace, query_explain=False)
+        self.slow_query_threshold = slow_query_threshold
+
+    def _record(self, method, sql, params):
+        start = time.monotonic()
+        try:
+            return method(sql, params)
+        finally:
+            duration = (time.monotonic() - start) * 1000
+            sql = str(sql)  # is sometimes an object, e.g. psycopg Composed, so ensure string
+
+            if duration < self.slow_query_threshold:
+                details = {}
+            else:
+                details = {
+                    'sql': self.db.ops.last_executed_query(self.cursor, sql, self._quote_params(params)),
+                    'params': self._decode_params(params),
+                    'stacktrace': self.get_stacktrace(),
+                }
+
+            self.logger.record(
+                alias=getattr(self.db, 'alias', 'default'),
+                vendor=getattr(self.db.connection, 'vendor', 'unknown'),
+                raw_sql=sql,
+                raw_params=params,
+                duration=duration,
+                **details,
+            )
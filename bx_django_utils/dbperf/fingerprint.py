@@ -0,0 +1,36 @@
+"""
+    Normalize SQL statements to fingerprints, to group similar queries.
+"""
+import functools
+import re
+
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_SAVEPOINT_RE = re.compile(r'\b(SAVEPOINT)\s+(?:"[^"]*"|\w+)', re.IGNORECASE)
+_NUMBER_RE = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.IGNORECASE)
+_PLACEHOLDER_RE = re.compile(r'%s|%\([^)]+\)s|\?|\$\d+')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_VALUES_RE = re.compile(r'(\(\?(?:, \?)*\))(?:, \1)+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=2048)
+def get_fingerprint(sql: str) -> str:
+    """
+    Returns the normalized SQL statement: String and number literals and all placeholders
+    are replaced by "?", IN-lists and multi-row VALUES are collapsed, savepoint names are
+    removed and whitespace is normalized, e.g.:
+
+        SELECT * FROM "foo" WHERE "id" IN (%s, %s) AND "name" = 'bar'
+        -> SELECT * FROM "foo" WHERE "id" IN (...) AND "name" = ?
+
+    Cached by the raw SQL, because the same statements are executed again and again.
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _SAVEPOINT_RE.sub(r'\1 ?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _WHITESPACE_RE.sub(' ', sql).strip()
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _VALUES_RE.sub(r'\1, ...', sql)
+    return sql
@@ -0,0 +1,113 @@
+from functools import partial
+import logging
+import random
+
+from django.conf import settings
+from django.db import connections
+
+from bx_django_utils.dbperf.cursor import LightweightCursorWrapper
+from bx_django_utils.dbperf.query_recorder import Logger, SQLQueryRecorder
+
+
+logger = logging.getLogger(__name__)
+
+
+class QuerySamplingMiddleware:
+    """
+    Record the SQL queries of a sample of requests and log a compact summary per request.
+
+    Records SAMPLE_RATE of all requests. Set HEADER (e.g. to 'X-Record-Queries') to record every request
+    with this header, too. The header is only honored with settings.DEBUG or for staff users, because
+    the summary contains SQL and recording costs extra time.
+    The overhead is low, because only queries slower than SLOW_QUERY_THRESHOLD milliseconds
+    are recorded with stack trace and parameters, see: LightweightCursorWrapper.
+    Override emit_summary() to send the summary to another sink than the log.
+
+    Only the sync request path is recorded (Django adapts async views), and queries in
+    a streaming response after the middleware returned are not included.
+    """
+
+    SAMPLE_RATE = 0.01  # Record 1% of all requests
+    HEADER = None  # Opt-in, e.g.: 'X-Record-Queries'
+    SLOW_QUERY_THRESHOLD = 100  # milliseconds
+    TOP_SLOWEST = 3  # Number of the slowest queries in the summary
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def header_allowed(self, request) -> bool:
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)  # Only set after AuthenticationMiddleware
+        return bool(user is not None and user.is_staff)
+
+    def should_record(self, request) -> bool:
+        if self.HEADER and self.HEADER in request.headers and self.header_allowed(request):
+            return True
+        return random.random() < self.SAMPLE_RATE
+
+    def __call__(self, request):
+        if not self.should_record(request):
+            return self.get_response(request)
+
+        if any(hasattr(connection, '_recording_cursor') for connection in connections.all()):
+            # Another SQLQueryRecorder is active, e.g.: AssertQueries in tests
+            return self.get_response(request)
+
+        recorder = SQLQueryRecorder(
+            max_queries=self.TOP_SLOWEST,
+            keep_slowest=True,
+            count_duplicates=False,  # Duplicates are reported by fingerprint
+            cursor_wrapper_class=partial(LightweightCursorWrapper, slow_query_threshold=self.SLOW_QUERY_THRESHOLD),
+        )
+        with recorder:
+            response = self.get_response(request)
+
+        summary = self.get_summary(request=request, response=response, query_logger=recorder.logger)
+        self.emit_summary(summary)
+        return response
+
+    def get_summary(self, *, request, response, query_logger: Logger) -> dict:
+        results = query_logger.dump(aggregate_queries=False)
+        slowest = sorted(
+            (query for _alias, query in results['queries']),
+            key=lambda query: query['duration'],
+            reverse=True,
+        )
+        return {
+            'method': request.method,
+            'path': request.path,
+            'status_code': response.status_code,
+            'num_queries': results['num_queries'],
+            'sql_time': results['sql_time'],
+            'duplicates': [
+                {
+                    'fingerprint': stats['fingerprint'],
+                    'num_queries': stats['num_queries'],
+                    'time_spent': stats['time_spent'],
+                }
+                for stats in query_logger.get_fingerprint_stats()
+                if stats['num_queries'] > 1
+            ],
+            'slowest': [
+                {
+                    'duration': query['duration'],
+                    'sql': query.get('sql', query['raw_sql']),
+                    'stacktrace': [str(frameinfo) for frameinfo in query.get('stacktrace', ())[-3:]],
+                }
+                for query in slowest
+            ],
+        }
+
+    def emit_summary(self, summary: dict) -> None:
+        lines = [
+            '{method} {path} ({status_code}): {num_queries} queries in {sql_time:.1f} ms'.format(**summary),
+        ]
+        for duplicate in summary['duplicates']:
+            lines.append(
+                f' * {duplicate["num_queries"]}x in {duplicate["time_spent"]:.1f} ms: {duplicate["fingerprint"]}'
+            )
+        for query in summary['slowest']:
+            lines.append(f' * slow {query["duration"]:.1f} ms: {query["sql"]}')
+            lines.extend(f'     {frameinfo}' for frameinfo in query['stacktrace'])
+        logger.info('\n'.join(lines), extra={'query_summary': summary})
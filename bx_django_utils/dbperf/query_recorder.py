@@ -1,38 +1,156 @@
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
 from collections.abc import Callable, Iterable
 from functools import partial
+import heapq
+import math
+from operator import itemgetter
 from pprint import saferepr
+import random
 
 from django.db import connections
 
 from bx_django_utils.dbperf.cursor import RecordingCursorWrapper
+from bx_django_utils.dbperf.fingerprint import get_fingerprint
 
 
-class Logger:
+class QueryStats:
+    """
+    Execution count and durations (in milliseconds) of all queries with the same fingerprint.
+    The 95th percentile is calculated from a random sample of at most MAX_SAMPLES durations,
+    so it's exact up to this count and the memory usage is bounded.
+    """
+
+    MAX_SAMPLES = 1000
+
+    __slots__ = ('num_queries', 'samples', 'time_spent')
+
     def __init__(self):
-        self._queries = []  # list of (dbname, metrics) tuples for each query that was run
+        self.num_queries = 0
+        self.time_spent = 0
+        self.samples = []
+
+    def add(self, duration):
+        self.num_queries += 1
+        self.time_spent += duration
+        if len(self.samples) < self.MAX_SAMPLES:
+            self.samples.append(duration)
+        elif (index := random.randrange(self.num_queries)) < self.MAX_SAMPLES:
+            # Reservoir sampling: Every duration has the same chance to be in the samples
+            self.samples[index] = duration
+
+    @property
+    def mean(self):
+        return self.time_spent / self.num_queries
+
+    @property
+    def p95(self):
+        samples = sorted(self.samples)
+        return samples[math.ceil(len(samples) * 0.95) - 1]  # nearest-rank method
+
+
+class Logger:
+    """
+    Collects the queries recorded by RecordingCursorWrapper.
+
+    Similar queries are grouped by their fingerprint, see: dbperf.fingerprint.get_fingerprint()
+    With "max_queries" only the last N full query records (or the N slowest ones, if
+    "keep_slowest" is set) are retained, so the memory usage is bounded e.g.: when recording
+    a long-running management command.
+
+    The per alias totals and similar query counts are always exact. The duplicated query counts
+    are exact without "max_queries". With "max_queries" only the MAX_DUPLICATE_KEYS most recently
+    executed distinct queries per alias are counted (LRU), so duplicates that are executed
+    far apart from each other may be counted too low or missed.
+    Set "count_duplicates" to False to skip the duplicated query counting, e.g.: if only the
+    timings are needed, because building the duplicate key is the most expensive part of record().
+    """
+
+    MAX_DUPLICATE_KEYS = 10_000
+
+    def __init__(self, *, max_queries: int | None = None, keep_slowest: bool = False, count_duplicates: bool = True):
+        assert max_queries is None or max_queries >= 0, f'invalid max_queries: {max_queries!r}'
+        self.max_queries = max_queries
+        self.keep_slowest = keep_slowest
+        self.count_duplicates = count_duplicates
+
+        if keep_slowest and max_queries is not None:
+            self._slowest = []  # heap of (duration, number, dbname, metrics) tuples
+        else:
+            self._slowest = None
+            # (dbname, metrics) tuples for each query that was run:
+            self._records = deque(maxlen=max_queries)
+
         self._databases = {}  # short summary
         self._sql_time = 0  # total execution time of all queries in milliseconds
         self._num_queries = 0  # total count of queries executed
+        self._similar = defaultdict(lambda: defaultdict(QueryStats))  # per alias: similar key -> stats
+        if max_queries is None:
+            self._duplicated = defaultdict(lambda: defaultdict(int))  # per alias: duplicate key -> count
+        else:
+            self._duplicated = defaultdict(OrderedDict)  # per alias: duplicate key -> count, in LRU order
+
+    @property
+    def queries(self) -> list[tuple[str, dict]]:
+        """
+        The retained (dbname, metrics) tuples in execution order.
+        """
+        if self._slowest is None:
+            return list(self._records)
+        return [(alias, query) for _duration, _number, alias, query in sorted(self._slowest, key=itemgetter(1))]
+
+    @property
+    def _queries(self):
+        # Backwards compatibility
+        return self.queries
+
+    @property
+    def num_dropped(self) -> int:
+        """
+        Count of queries that are only included in the aggregates, because of "max_queries"
+        """
+        return self._num_queries - (len(self._records) if self._slowest is None else len(self._slowest))
 
     def record(self, alias, **kwargs):
-        self._queries.append((alias, kwargs))
+        duration = kwargs['duration']
+        if self._slowest is None:
+            self._records.append((alias, kwargs))
+        elif self.max_queries:
+            entry = (duration, self._num_queries, alias, kwargs)
+            if len(self._slowest) < self.max_queries:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
 
         if alias not in self._databases:
             self._databases[alias] = {
-                "time_spent": kwargs["duration"],
+                "time_spent": duration,
                 "num_queries": 1,
             }
         else:
-            self._databases[alias]["time_spent"] += kwargs["duration"]
+            self._databases[alias]["time_spent"] += duration
             self._databases[alias]["num_queries"] += 1
 
-        self._sql_time += kwargs['duration']
+        self._similar[alias][self._similar_key(kwargs)].add(duration)
+        if self.count_duplicates:
+            self._count_duplicate(self._duplicated[alias], self._duplicate_key(kwargs))
+
+        self._sql_time += duration
         self._num_queries += 1
 
+    def _count_duplicate(self, duplicated, key):
+        if self.max_queries is None:
+            duplicated[key] += 1
+        elif key in duplicated:
+            duplicated[key] += 1
+            duplicated.move_to_end(key)
+        else:
+            if len(duplicated) >= self.MAX_DUPLICATE_KEYS:
+                duplicated.popitem(last=False)  # Forget the least recently executed query
+            duplicated[key] = 1
+
     @staticmethod
     def _similar_key(query):
-        return query['raw_sql']
+        return get_fingerprint(query['raw_sql'])
 
     @staticmethod
     def _duplicate_key(query):
@@ -41,47 +159,50 @@ class Logger:
         # (e.g. lists) when used as dictionary keys.
         return query['raw_sql'], saferepr(raw_params)
 
+    def get_fingerprint_stats(self) -> list[dict]:
+        """
+        Execution count, total/mean/p95 duration in milliseconds of all queries, grouped by alias and
+        fingerprint. Ordered by the total duration, so the most expensive queries are the first ones.
+        """
+        fingerprint_stats = [
+            {
+                'alias': alias,
+                'fingerprint': fingerprint,
+                'num_queries': stats.num_queries,
+                'time_spent': stats.time_spent,
+                'mean': stats.mean,
+                'p95': stats.p95,
+            }
+            for alias, similar in self._similar.items()
+            for fingerprint, stats in similar.items()
+        ]
+        fingerprint_stats.sort(key=itemgetter('time_spent'), reverse=True)
+        return fingerprint_stats
+
     def _aggregate(self, results):
-        aliases = set()
         # todo: defaultdicts handle very awkwardly (e.g. with Django Templates),
         #  is collections.Counter a good replacement?
         queries_similar = defaultdict(lambda: defaultdict(int))
         queries_duplicated = defaultdict(lambda: defaultdict(int))
-        num_queries_similar = 0
-        num_queries_duplicated = 0
-
-        # put every query into similar/duplicated dicts to aggregate their execution count
-        for alias, query in self._queries:
-            aliases.add(alias)
-            queries_similar[alias][self._similar_key(query)] += 1
-            queries_duplicated[alias][self._duplicate_key(query)] += 1
-
-        # now that the aggregation is done we must strip all queries in the
-        # aggregation dicts that were executed only once.
-        for agg_dict in (queries_similar, queries_duplicated):
-            for queries in agg_dict.values():
-                del_keys = []
-                for query, count in queries.items():
-                    if count == 1:
-                        del_keys.append(query)
-
-                for key in del_keys:
-                    del queries[key]
 
-        # for convenience, make a total for each aggregation across all databases and queries
-        for db in queries_similar:
-            num_queries_similar += len(queries_similar[db])
-        for db in queries_duplicated:
-            num_queries_duplicated += len(queries_duplicated[db])
+        # Only queries that were executed more than once are similar/duplicated:
+        for alias, similar in self._similar.items():
+            queries_similar[alias] = defaultdict(
+                int, {key: stats.num_queries for key, stats in similar.items() if stats.num_queries > 1}
+            )
+        for alias, duplicated in self._duplicated.items():
+            queries_duplicated[alias] = defaultdict(int, {key: count for key, count in duplicated.items() if count > 1})
 
+        # for convenience, make a total for each aggregation across all databases and queries
         results['queries_similar'] = queries_similar
         results['queries_duplicated'] = queries_duplicated
-        results['num_queries_similar'] = num_queries_similar
-        results['num_queries_duplicated'] = num_queries_duplicated
+        results['num_queries_similar'] = sum(len(queries) for queries in queries_similar.values())
+        results['num_queries_duplicated'] = sum(len(queries) for queries in queries_duplicated.values())
+        results['fingerprint_stats'] = self.get_fingerprint_stats()
 
     def dump(self, aggregate_queries=True):
         results = {
-            'queries': self._queries,
+            'queries': self.queries,
             'databases': self._databases,
             'sql_time': self._sql_time,
             'num_queries': self._num_queries,
@@ -93,8 +214,8 @@ class Logger:
         return results
 
 
-def _get_cursor_wrapper(*, cursor, connection, logger, collect_stacktrace, query_explain):
-    return RecordingCursorWrapper(
+def _get_cursor_wrapper(*, cursor, connection, logger, collect_stacktrace, query_explain, cursor_wrapper_class):
+    return cursor_wrapper_class(
         cursor(),
         connection,
         logger,
@@ -118,6 +239,10 @@ class SQLQueryRecorder:
             func_that_makes_queries()
         print(rec.results(aggregate_results=True))
 
+    Use "max_queries" to bound the memory usage in long-running processes: Only the last
+    (or with "keep_slowest" the slowest) queries are retained. The aggregates include all queries,
+    but the duplicated query counts are approximated, see: Logger
+    Use "count_duplicates=False" to skip the duplicated query counting, if only the timings are needed.
     """
     running = None
 
@@ -126,9 +251,14 @@ class SQLQueryRecorder:
         databases: Iterable[str] | None = None,
         collect_stacktrace: Callable | None = None,
         query_explain: bool = False,  # Capture EXPLAIN SQL information?
+        max_queries: int | None = None,  # Retain only this number of full query records?
+        keep_slowest: bool = False,  # Retain the slowest instead of the last queries?
+        cursor_wrapper_class: Callable = RecordingCursorWrapper,
+        count_duplicates: bool = True,  # Count the duplicated queries (same SQL and parameters)?
     ):
-        self.logger = Logger()
+        self.logger = Logger(max_queries=max_queries, keep_slowest=keep_slowest, count_duplicates=count_duplicates)
         self.query_explain = query_explain
+        self.cursor_wrapper_class = cursor_wrapper_class
 
         if databases:
             self.databases = [db for db in connections.all() if db.alias in databases]
@@ -150,7 +280,8 @@ class SQLQueryRecorder:
                 'connection': connection,
                 'logger': self.logger,
                 'collect_stacktrace': self.collect_stacktrace,
-                'query_explain': self.query_explain
+                'query_explain': self.query_explain,
+                'cursor_wrapper_class': self.cursor_wrapper_class,
             }
 
             connection.cursor = partial(
@@ -9,7 +9,7 @@ from django.views.generic import FormView
 
 from bx_django_utils.admin_extra_views.base_view import AdminExtraViewMixin
 from bx_django_utils.admin_extra_views.datatypes import AdminExtraMeta
-from bx_django_utils.feature_flags.data_classes import FeatureFlag
+from bx_django_utils.feature_flags.data_classes import FeatureFlag, PercentageFeatureFlag
 from bx_django_utils.feature_flags.models import FeatureFlagModel
 from bx_django_utils.feature_flags.state import State
 
@@ -25,7 +25,14 @@ class ManageFeatureFlagsForm(forms.Form):
     cache_key = forms.ChoiceField(
         choices=get_feature_flag_choices,  # Assign lazy
     )
-    new_value = forms.ChoiceField(choices=State.choices)
+    new_value = forms.ChoiceField(choices=State.choices, required=False)
+    percentage = forms.IntegerField(min_value=0, max_value=100, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('new_value') and cleaned_data.get('percentage') is None:
+            raise forms.ValidationError('Either a new state or a percentage is required.')
+        return cleaned_data
 
 
 class ManageFeatureFlagsBaseView(AdminExtraViewMixin, FormView):
@@ -59,6 +66,8 @@ class ManageFeatureFlagsBaseView(AdminExtraViewMixin, FormView):
                     'state': instance.state,
                     'initial_state': instance.initial_state,
                     'opposite_state': instance.opposite_state,
+                    'percentage': instance.percentage if isinstance(instance, PercentageFeatureFlag) else None,
+                    'metrics': FeatureFlag.metrics_sink.get_metrics(instance) if FeatureFlag.metrics_sink else None,
                     'last_change': last_change_qs.last(),
                 }
             )
@@ -70,6 +79,8 @@ class ManageFeatureFlagsBaseView(AdminExtraViewMixin, FormView):
     def form_valid(self, form):
         cache_key = form.cleaned_data['cache_key']
         new_value_str = form.cleaned_data['new_value']
+        if not new_value_str:
+            return self.set_percentage(cache_key=cache_key, percentage=form.cleaned_data['percentage'])
 
         new_sate_value = int(new_value_str)
         new_state = State(new_sate_value)
@@ -88,19 +99,37 @@ class ManageFeatureFlagsBaseView(AdminExtraViewMixin, FormView):
                 eta = int(feature_flag._cache_duration.total_seconds())
                 change_message += f' (will take up to {eta} seconds to take full effect)'
 
-            # Create a LogEntry for this action:
-            content_type_id = ContentType.objects.get_for_model(FeatureFlagModel).id
-            log_entry = LogEntry(
-                user_id=self.request.user.id,
-                content_type_id=content_type_id,
-                action_flag=CHANGE,
-                change_message=f'Changed feature flag "{feature_flag.human_name}"',
-                object_id=cache_key,
-                object_repr=change_message,  # Rendered in Django log list on index page!
-            )
-            log_entry.full_clean()
-            log_entry.save(force_insert=True)
+            self.log_change(feature_flag=feature_flag, change_message=change_message)
+
+        return HttpResponseRedirect('.')
+
+    def set_percentage(self, *, cache_key, percentage):
+        feature_flag = FeatureFlag.get_by_cache_key(cache_key)
+        if not isinstance(feature_flag, PercentageFeatureFlag):
+            messages.error(self.request, f'"{feature_flag.human_name}" has no rollout percentage')
+        else:
+            feature_flag.set_percentage(percentage)
+            change_message = f'Set "{feature_flag.human_name}" rollout percentage to {percentage}%'
+            eta = int(feature_flag._percentage_cache_duration)
+            if eta:
+                change_message += f' (will take up to {eta} seconds to take full effect)'
 
-            messages.success(self.request, change_message)
+            self.log_change(feature_flag=feature_flag, change_message=change_message)
 
         return HttpResponseRedirect('.')
+
+    def log_change(self, *, feature_flag, change_message):
+        # Create a LogEntry for this action:
+        content_type_id = ContentType.objects.get_for_model(FeatureFlagModel).id
+        log_entry = LogEntry(
+            user_id=self.request.user.id,
+            content_type_id=content_type_id,
+            action_flag=CHANGE,
+            change_message=f'Changed feature flag "{feature_flag.human_name}"',
+            object_id=feature_flag.cache_key,
+            object_repr=change_message,  # Rendered in Django log list on index page!
+        )
+        log_entry.full_clean()
+        log_entry.save(force_insert=True)
+
+        messages.success(self.request, change_message)
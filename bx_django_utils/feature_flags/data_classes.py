@@ -1,11 +1,19 @@
-from collections.abc import Callable, Iterable, Iterator
+from collections.abc import Callable, Iterable, Iterator, Mapping
 from contextlib import contextmanager
 import datetime
 import logging
+import random
+import threading
 import time
+import zlib
+
+from django.db import transaction
+from django.utils import timezone
 
 from bx_django_utils.feature_flags.exceptions import NotUniqueFlag
+from bx_django_utils.feature_flags.metrics import MetricsSink
 from bx_django_utils.feature_flags.models import FeatureFlagModel
+from bx_django_utils.feature_flags.registry import FeatureFlagRegistry, get_pinned_states
 from bx_django_utils.feature_flags.state import State
 from bx_django_utils.models.manipulate import create_or_update2
 
@@ -20,7 +28,8 @@ class FeatureFlag:
     A feature flag that persistent the state into django cache/database.
     """
 
-    registry = {}
+    registry = FeatureFlagRegistry()
+    metrics_sink: MetricsSink | None = None  # Collect evaluation metrics, e.g.: InMemoryMetricsSink()
 
     def __init__(
         self,
@@ -31,9 +40,12 @@ class FeatureFlag:
         description: str | None = None,
         cache_key_prefix: str = 'feature-flags',
         cache_duration: datetime.timedelta = DEFAULT_DURATION,
+        cache_jitter: datetime.timedelta = DEFAULT_DURATION,
     ):
         """
         :param cache_duration: how long the state of the flag should be cached in-process
+        :param cache_jitter: add a random duration (up to this value) to each cache period,
+            so that the caches of all processes don't expire at the same time
         """
         self.human_name = human_name
         self.description = description
@@ -53,9 +65,19 @@ class FeatureFlag:
 
         if cache_duration:
             self._cache_duration: datetime.timedelta = cache_duration
+            self._cache_jitter: float = cache_jitter.total_seconds()
             self._cache_time_func: Callable[[], float] = time.monotonic
             self._cache_from: float | None = None
             self._cache_value: State | None = None
+            self._cache_period: float = self._get_cache_period()
+            # Only one thread should refresh an expired state:
+            self._cache_lock = threading.Lock()
+
+    def _get_cache_period(self) -> float:
+        period = self._cache_duration.total_seconds()
+        if self._cache_jitter:
+            period += random.uniform(0, self._cache_jitter)
+        return period
 
     def enable(self) -> bool:
         return self.set_state(new_state=State.ENABLED)
@@ -75,37 +97,197 @@ class FeatureFlag:
         )
 
         if hasattr(self, '_cache_duration'):
-            self._cache_from = self._cache_time_func()
-            self._cache_value = new_state
+            self._set_cache_value(new_state)
+
+        if isinstance(self.registry, FeatureFlagRegistry):
+            self.registry.notify_state_change(cache_key=self.cache_key, state=new_state)
 
         return bool(obj.instance.state)
 
     def reset(self) -> None:
         FeatureFlagModel.objects.filter(cache_key=self.cache_key).delete()
+        if isinstance(self.registry, FeatureFlagRegistry):
+            self.registry.notify_state_change(cache_key=self.cache_key, state=None)
+
+    @classmethod
+    def bulk_set_states(cls, states: Mapping["FeatureFlag", State]) -> set["FeatureFlag"]:
+        """
+        Set the states of multiple flags in one transaction, e.g.:
+
+            changed = FeatureFlag.bulk_set_states({foo_feature_flag: State.DISABLED, bar_feature_flag: State.DISABLED})
+
+        Needs one SELECT and one upsert statement for all flags, and the cache version is increased only once.
+        Returns the flags whose state actually changed.
+        """
+        for feature_flag, new_state in states.items():
+            assert isinstance(
+                new_state, State
+            ), f'Given {new_state!r} (type: {type(new_state).__name__}) for {feature_flag} is not a State object!'
+
+        new_states = {feature_flag.cache_key: (feature_flag, new_state) for feature_flag, new_state in states.items()}
+        with transaction.atomic():
+            stored_states = dict(
+                FeatureFlagModel.objects.select_for_update()
+                .filter(cache_key__in=list(new_states))
+                .values_list('cache_key', 'state')
+            )
+            now = timezone.now()  # bulk_create() doesn't call save() that set the TimetrackingBaseModel fields
+            instances = [
+                FeatureFlagModel(cache_key=cache_key, state=new_state, create_dt=now, update_dt=now)
+                for cache_key, (feature_flag, new_state) in sorted(new_states.items())
+                if stored_states.get(cache_key) != new_state
+            ]
+            if instances:
+                FeatureFlagModel.objects.bulk_create(
+                    instances,
+                    update_conflicts=True,
+                    unique_fields=['cache_key'],
+                    update_fields=['state', 'update_dt'],
+                )
+
+        changed = set()
+        for cache_key, (feature_flag, new_state) in new_states.items():
+            if hasattr(feature_flag, '_cache_duration'):
+                feature_flag._set_cache_value(new_state)
+            old_state = stored_states.get(cache_key, feature_flag.initial_state)
+            if old_state != new_state:
+                changed.add(feature_flag)
+
+        if instances and isinstance(cls.registry, FeatureFlagRegistry):
+            cls.registry.notify_state_changes({instance.cache_key: State(instance.state) for instance in instances})
+
+        return changed
 
     @property
     def is_enabled(self) -> bool:
+        if self.metrics_sink is not None:
+            self.metrics_sink.record_evaluation(self)
+
+        if pinned_states := get_pinned_states():
+            # States are pinned, e.g.: for the current request
+            return bool(pinned_states.get_state(self))
+
         if not hasattr(self, '_cache_duration'):  # caching is disabled
             return self._compute_is_enabled()
 
         if self._cache_from is not None:
             elapsed = self._cache_time_func() - self._cache_from
             # cache is still valid
-            if elapsed <= self._cache_duration.total_seconds():
+            if elapsed <= self._cache_period:
                 return bool(self._cache_value.value)
 
-        # cache is empty or expired -> recompute
-        state = self._compute_is_enabled()
-        self._cache_from = self._cache_time_func()
-        self._cache_value = State(state)
+            # cache is expired -> Only one thread recomputes, all others use the stale value in the meantime:
+            if not self._cache_lock.acquire(blocking=False):
+                return bool(self._cache_value.value)
+        else:
+            # cache is empty -> There is no value to use, so wait for the thread that computes it:
+            self._cache_lock.acquire()
+
+        try:
+            if self._cache_from is not None and self._cache_time_func() - self._cache_from <= self._cache_period:
+                # Another thread refreshed the cache in the meantime
+                return bool(self._cache_value.value)
+            state = self._compute_is_enabled()
+            self._set_cache_value(State(state))
+        finally:
+            self._cache_lock.release()
+        return state
+
+    async def ais_enabled(self) -> bool:
+        """
+        Async version of "is_enabled": Uses the async ORM and cache API, e.g.:
+
+            if await foo_feature_flag.ais_enabled():
+                ...
+
+        Never blocks the event loop: If another thread or task refreshes the in-process cache,
+        the stale state is used or the state is computed without waiting.
+        The thread lock of the cache is never held across an await.
+        """
+        if self.metrics_sink is not None:
+            self.metrics_sink.record_evaluation(self)
+
+        if pinned_states := get_pinned_states():
+            # States are pinned, e.g.: for the current request
+            return bool(pinned_states.get_state(self))
+
+        if not hasattr(self, '_cache_duration'):  # caching is disabled
+            return await self._acompute_is_enabled()
+
+        cache_from = self._cache_from
+        if cache_from is not None:
+            elapsed = self._cache_time_func() - cache_from
+            # cache is still valid
+            if elapsed <= self._cache_period:
+                return bool(self._cache_value.value)
+
+            # cache is expired -> Claim the refresh, but never hold the thread lock across an await:
+            if not self._cache_lock.acquire(blocking=False):
+                return bool(self._cache_value.value)  # Another thread refreshes: Use the stale value
+            try:
+                if self._cache_from != cache_from:
+                    # Another thread or task refreshed (or claimed) the cache in the meantime
+                    return bool(self._cache_value.value)
+                # Other threads and tasks use the stale value, until the refresh is done:
+                self._cache_from = self._cache_time_func()
+            finally:
+                self._cache_lock.release()
+
+        try:
+            state = await self._acompute_is_enabled()
+        except BaseException:
+            if cache_from is not None:
+                self._cache_from = cache_from  # The next check should retry the refresh
+            raise
+        self._set_cache_value(State(state))
         return state
 
+    def _set_cache_value(self, state: State) -> None:
+        # Set the value before the timestamp, so other threads never see a new timestamp with an old value:
+        self._cache_value = state
+        self._cache_period = self._get_cache_period()
+        self._cache_from = self._cache_time_func()
+
     def _compute_is_enabled(self) -> bool:
-        obj, _ = FeatureFlagModel.objects.get_or_create(
-            cache_key=self.cache_key,
-            defaults={'state': self.initial_state},
-        )
-        return bool(obj.state)
+        registry = self.registry
+        if isinstance(registry, FeatureFlagRegistry) and registry.snapshot_enabled:
+            # Answer from the process-wide snapshot of all states:
+            return bool(registry.get_state(self))
+
+        # Note: Only read the state. Missing entries can be created via FeatureFlag.registry.materialize_missing()
+        if self.metrics_sink is None:
+            state = self._load_state()
+        else:
+            start_time = time.perf_counter()
+            state = self._load_state()
+            self.metrics_sink.record_load(self, duration=time.perf_counter() - start_time)
+        if state is None:
+            return bool(self.initial_state)
+        return bool(state)
+
+    async def _acompute_is_enabled(self) -> bool:
+        registry = self.registry
+        if isinstance(registry, FeatureFlagRegistry) and registry.snapshot_enabled:
+            return bool(await registry.aget_state(self))
+
+        if self.metrics_sink is None:
+            state = await self._aload_state()
+        else:
+            start_time = time.perf_counter()
+            state = await self._aload_state()
+            self.metrics_sink.record_load(self, duration=time.perf_counter() - start_time)
+        if state is None:
+            return bool(self.initial_state)
+        return bool(state)
+
+    def _get_state_queryset(self):
+        return FeatureFlagModel.objects.filter(cache_key=self.cache_key).values_list('state', flat=True)
+
+    def _load_state(self) -> int | None:
+        return self._get_state_queryset().first()
+
+    async def _aload_state(self) -> int | None:
+        return await self._get_state_queryset().afirst()
 
     @property
     def is_disabled(self) -> bool:
@@ -167,6 +349,17 @@ class FeatureFlag:
     def get_by_cache_key(cls, cache_key) -> "FeatureFlag":
         return cls.registry[cache_key]
 
+    def __getstate__(self):
+        # Locks can't be copied/pickled: Every copy gets its own lock
+        state = self.__dict__.copy()
+        state.pop('_cache_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if hasattr(self, '_cache_duration'):
+            self._cache_lock = threading.Lock()
+
     def __bool__(self):
         return self.is_enabled
 
@@ -176,3 +369,136 @@ class FeatureFlag:
     def __repr__(self):
         initial = self.initial_state == State.ENABLED
         return f'FeatureFlag(cache_key={self.name!r}, human_name={self.human_name!r}, initial_enabled={initial!r})'
+
+
+def get_rollout_bucket(*, key: int | str | bytes, seed: int) -> int:
+    """
+    Returns the stable rollout bucket (0-99) of the given key, e.g.: a user or tenant id.
+    The same key and seed results in the same bucket in all processes (unlike the randomized hash()).
+    Pass bytes to avoid the encoding of the key.
+    """
+    if not isinstance(key, bytes):
+        key = str(key).encode()
+    return zlib.crc32(key, seed) % 100
+
+
+class PercentageFeatureFlag(FeatureFlag):
+    """
+    A feature flag for gradual rollouts: If enabled, it's only active for "percentage" percent of all keys.
+    e.g.:
+
+        if expensive_flag.is_enabled_for(request.user.pk):
+            ...
+
+    Every key is mapped to a stable bucket via a fast hash, so no per-key storage or query is needed
+    (only int and str keys are encoded into a short-lived bytes object).
+    The buckets of every flag are independent, because the cache key is used as seed.
+    The percentage is pinned via pin_states() and part of the registry snapshot, just like the state.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial_percentage: int = 0,
+        percentage_cache_duration: datetime.timedelta = datetime.timedelta(seconds=30),
+        **kwargs,
+    ):
+        """
+        :param initial_percentage: rollout percentage (0-100), if no percentage is stored
+        :param percentage_cache_duration: how long the percentage should be cached in-process
+        """
+        assert 0 <= initial_percentage <= 100, f'Invalid percentage: {initial_percentage!r}'
+        super().__init__(**kwargs)
+        self.initial_percentage = initial_percentage
+        self.seed = zlib.crc32(self.cache_key.encode())
+
+        self._percentage_cache_duration: float = percentage_cache_duration.total_seconds()
+        self._percentage_time_func: Callable[[], float] = time.monotonic
+        self._percentage_from: float | None = None
+        self._percentage: int | None = None
+
+    @property
+    def percentage(self) -> int:
+        """
+        The current rollout percentage: Pinned, from the registry snapshot or cached in-process
+        for "percentage_cache_duration"
+        """
+        if pinned_states := get_pinned_states():
+            return pinned_states.get_percentage(self)
+
+        registry = self.registry
+        if isinstance(registry, FeatureFlagRegistry) and registry.snapshot_enabled:
+            return registry.get_percentage(self)
+
+        percentage = self._get_cached_percentage()
+        if percentage is None:
+            percentage = (
+                FeatureFlagModel.objects.filter(cache_key=self.cache_key).values_list('percentage', flat=True).first()
+            )
+            if percentage is None:
+                percentage = self.initial_percentage
+            self._set_cached_percentage(percentage)
+        return percentage
+
+    def _get_cached_percentage(self) -> int | None:
+        """
+        Returns the percentage from the in-process cache, if it's still valid.
+        """
+        percentage_from = self._percentage_from
+        if percentage_from is not None and (
+            self._percentage_time_func() - percentage_from <= self._percentage_cache_duration
+        ):
+            return self._percentage
+        return None
+
+    def _set_cached_percentage(self, percentage: int) -> None:
+        self._percentage = percentage
+        self._percentage_from = self._percentage_time_func()
+
+    def set_percentage(self, percentage: int) -> None:
+        """
+        Store a new rollout percentage (0-100). A missing database entry is created with the initial state.
+        Only the percentage is updated, so a concurrent state change will not be overwritten.
+        """
+        FeatureFlagModel._meta.get_field('percentage').clean(percentage, None)
+        now = timezone.now()  # bulk_create() doesn't call save() that set the TimetrackingBaseModel fields
+        # One upsert statement, so concurrent calls can't fail with an IntegrityError:
+        FeatureFlagModel.objects.bulk_create(
+            [
+                FeatureFlagModel(
+                    cache_key=self.cache_key,
+                    state=self.initial_state,
+                    percentage=percentage,
+                    create_dt=now,
+                    update_dt=now,
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=['cache_key'],
+            update_fields=['percentage', 'update_dt'],
+        )
+
+        self._set_cached_percentage(percentage)
+
+        if isinstance(self.registry, FeatureFlagRegistry):
+            self.registry.notify_percentage_changes({self.cache_key: percentage})
+
+    def reset(self) -> None:
+        super().reset()
+        self._percentage_from = None
+
+    def is_enabled_for(self, key: int | str | bytes) -> bool:
+        """
+        Is the flag enabled and the key in the rollout percentage?
+        Note: Use "cache_duration", pin_states() or the registry snapshot to check the state without a query.
+        """
+        if not self.is_enabled:
+            return False
+        return get_rollout_bucket(key=key, seed=self.seed) < self.percentage
+
+    def __repr__(self):
+        initial = self.initial_state == State.ENABLED
+        return (
+            f'PercentageFeatureFlag(cache_key={self.name!r}, human_name={self.human_name!r},'
+            f' initial_enabled={initial!r}, initial_percentage={self.initial_percentage!r})'
+        )
@@ -0,0 +1,29 @@
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+
+from bx_django_utils.feature_flags.data_classes import FeatureFlag
+
+
+class Command(BaseCommand):
+    """
+    Manage command "materialize_feature_flags": Create missing database entries of all registered feature flags
+    """
+
+    help = 'Create missing database entries of all registered feature flags with their initial state'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'modules',
+            nargs='*',
+            help='Modules to import, that define feature flags (if they are not imported at startup)',
+        )
+
+    def handle(self, *args, modules, **options):
+        for module in modules:
+            import_module(module)
+
+        created = FeatureFlag.registry.materialize_missing()
+        for cache_key in created:
+            self.stdout.write(f' * {cache_key!r} created')
+        self.stdout.write(f'{len(created)} of {len(FeatureFlag.registry)} feature flags created.')
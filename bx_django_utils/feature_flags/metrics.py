@@ -0,0 +1,91 @@
+import dataclasses
+from typing import TYPE_CHECKING
+
+
+if TYPE_CHECKING:
+    from bx_django_utils.feature_flags.data_classes import FeatureFlag
+
+
+@dataclasses.dataclass(slots=True)
+class FlagMetrics:
+    """
+    Counters of one feature flag, collected by InMemoryMetricsSink
+    """
+
+    evaluations: int = 0
+    db_loads: int = 0
+    load_time_total: float = 0.0  # seconds
+    load_time_max: float = 0.0  # seconds
+
+    @property
+    def cache_hits(self) -> int:
+        """
+        Evaluations that were answered without a database query of this flag
+        (e.g.: in-process cache, pinned states or registry snapshot)
+        """
+        return self.evaluations - self.db_loads
+
+    @property
+    def load_time_mean(self) -> float:
+        if not self.db_loads:
+            return 0.0
+        return self.load_time_total / self.db_loads
+
+
+class MetricsSink:
+    """
+    Receives metrics of all feature flag evaluations, if set as `FeatureFlag.metrics_sink`.
+    Subclass it to send the metrics to e.g.: statsd or Prometheus. This base class ignores all metrics.
+    """
+
+    def record_evaluation(self, feature_flag: "FeatureFlag") -> None:
+        """
+        Called on every FeatureFlag.is_enabled access: Must be fast!
+        """
+
+    def record_load(self, feature_flag: "FeatureFlag", *, duration: float) -> None:
+        """
+        Called after the state of the flag was loaded from the database in "duration" seconds.
+        A load of all states (registry snapshot or pinned states) is recorded for the flag that triggered it.
+        For pinned states, that's the first flag whose state or rollout percentage is read.
+        """
+
+    def get_metrics(self, feature_flag: "FeatureFlag") -> FlagMetrics | None:
+        """
+        Returns the collected metrics of the flag, e.g.: to display them in the admin.
+        """
+        return None
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """
+    Collect the feature flag metrics per process in memory, e.g.:
+
+        FeatureFlag.metrics_sink = InMemoryMetricsSink()
+
+    Note: The counters are not synchronized between threads, so they are approximate in threaded servers.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, FlagMetrics] = {}
+
+    def _get(self, cache_key: str) -> FlagMetrics:
+        try:
+            return self.metrics[cache_key]
+        except KeyError:
+            return self.metrics.setdefault(cache_key, FlagMetrics())
+
+    def record_evaluation(self, feature_flag: "FeatureFlag") -> None:
+        self._get(feature_flag.cache_key).evaluations += 1
+
+    def record_load(self, feature_flag: "FeatureFlag", *, duration: float) -> None:
+        metrics = self._get(feature_flag.cache_key)
+        metrics.db_loads += 1
+        metrics.load_time_total += duration
+        metrics.load_time_max = max(metrics.load_time_max, duration)
+
+    def get_metrics(self, feature_flag: "FeatureFlag") -> FlagMetrics | None:
+        return self.metrics.get(feature_flag.cache_key)
+
+    def reset(self) -> None:
+        self.metrics.clear()
@@ -0,0 +1,33 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from bx_django_utils.feature_flags.registry import apin_states, pin_states
+
+
+class FeatureFlagMiddleware:
+    """
+    Pin the states of all feature flags for each request (WSGI and ASGI)
+
+    All states are loaded at the start of the request: From the registry snapshot (if enabled) or with one query.
+    So every flag check in the request is a dict lookup (also the sync "is_enabled" in async views)
+    and sees the same state, even if a flag is changed by another process in the meantime.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        with pin_states():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        async with apin_states():
+            return await self.get_response(request)
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.9 on 2026-10-18 06:43
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feature_flags", "0002_alter_featureflagmodel_cache_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="featureflagmodel",
+            name="percentage",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text="FeatureFlagModel.percentage.help_text",
+                null=True,
+                validators=[django.core.validators.MaxValueValidator(100)],
+                verbose_name="FeatureFlagModel.percentage.verbose_name",
+            ),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.validators import MaxValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -19,6 +20,13 @@ class FeatureFlagModel(TimetrackingBaseModel):
         verbose_name=_('FeatureFlagModel.state.verbose_name'),
         help_text=_('FeatureFlagModel.state.help_text'),
     )
+    percentage = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MaxValueValidator(100)],
+        verbose_name=_('FeatureFlagModel.percentage.verbose_name'),
+        help_text=_('FeatureFlagModel.percentage.help_text'),
+    )
 
     def __str__(self):
         return f'{self.cache_key} {self.state}'
@@ -0,0 +1,158 @@
+"""
+    Push feature flag state changes to all processes via PostgreSQL LISTEN/NOTIFY
+"""
+from collections.abc import Iterator, Mapping
+import functools
+import inspect
+import json
+import logging
+import select
+import threading
+from typing import TYPE_CHECKING
+
+from django.db import connections, router
+
+from bx_django_utils.feature_flags.models import FeatureFlagModel
+from bx_django_utils.feature_flags.state import State
+
+
+if TYPE_CHECKING:
+    from bx_django_utils.feature_flags.registry import FeatureFlagRegistry
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'feature_flags'
+MAX_PAYLOAD_SIZE = 7000  # PostgreSQL limit is 8000 bytes
+RELOAD_ALL = ''  # Payload if the changes are too big: All receivers reload all states
+
+
+def get_connection():
+    return connections[router.db_for_write(FeatureFlagModel)]
+
+
+def is_supported() -> bool:
+    return get_connection().vendor == 'postgresql'
+
+
+def send_notification(*, channel: str, changes: Mapping[str, State | None] | None) -> None:
+    """
+    Send the state changes (cache key -> new state, None means reset) via NOTIFY.
+    changes=None lets all receivers reload all states.
+    PostgreSQL delivers it after the transaction is committed. Does nothing on other database backends.
+    """
+    connection = get_connection()
+    if connection.vendor != 'postgresql':
+        return
+
+    if changes is None:
+        payload = RELOAD_ALL
+    else:
+        payload = json.dumps(
+            {cache_key: None if state is None else state.value for cache_key, state in changes.items()}
+        )
+        if len(payload.encode('utf-8')) > MAX_PAYLOAD_SIZE:
+            payload = RELOAD_ALL
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [channel, payload])
+
+
+def parse_payload(payload: str) -> dict[str, State | None] | None:
+    """
+    Returns the changes from the notification payload or None if all states should be reloaded
+    """
+    if payload == RELOAD_ALL:
+        return None
+    return {cache_key: None if value is None else State(value) for cache_key, value in json.loads(payload).items()}
+
+
+@functools.cache
+def _has_notifies_timeout(connection_class: type) -> bool:
+    # Connection.notifies(timeout=...) is new in psycopg 3.2
+    return 'timeout' in inspect.signature(connection_class.notifies).parameters
+
+
+def _iter_payloads(raw_connection, *, timeout: float) -> Iterator[str]:
+    if not callable(raw_connection.notifies):
+        # psycopg2
+        if select.select([raw_connection], [], [], timeout) != ([], [], []):
+            raw_connection.poll()
+            while raw_connection.notifies:
+                yield raw_connection.notifies.pop(0).payload
+    elif _has_notifies_timeout(type(raw_connection)):
+        # psycopg >= 3.2: Yields all notifications that arrive within the timeout
+        for notify in raw_connection.notifies(timeout=timeout):
+            yield notify.payload
+    else:
+        # psycopg < 3.2: notifies() blocks without a timeout -> Wait via select() and read them via libpq
+        pgconn = raw_connection.pgconn
+        if select.select([pgconn.socket], [], [], timeout) != ([], [], []):
+            pgconn.consume_input()
+            while (notify := pgconn.notifies()) is not None:
+                yield notify.extra.decode(raw_connection.info.encoding)
+
+
+class FeatureFlagListener(threading.Thread):
+    """
+    Background thread that LISTENs on its own database connection and applies all state changes to the registry.
+    Started via FeatureFlagRegistry.enable_notifications()
+    """
+
+    def __init__(self, *, registry: "FeatureFlagRegistry", channel: str, timeout: float = 1.0, retry_delay=5.0):
+        super().__init__(name='feature-flag-listener', daemon=True)
+        self.registry = registry
+        self.channel = channel
+        self.timeout = timeout  # How often the stop event is checked
+        self.retry_delay = retry_delay  # Delay before reconnecting after an error
+        self.listening = threading.Event()
+        self.stopped = threading.Event()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self.stopped.set()
+        self.join(timeout=timeout)
+
+    def listen(self) -> None:
+        connection = get_connection()  # A new connection, because connections are thread local
+        try:
+            with connection.cursor() as cursor:
+                # The channel name is an identifier and can't be passed as parameter:
+                cursor.execute(f'LISTEN {connection.ops.quote_name(self.channel)}')
+            self.listening.set()
+            logger.debug('Listen for feature flag changes on channel %r', self.channel)
+            while not self.stopped.is_set():
+                for payload in _iter_payloads(connection.connection, timeout=self.timeout):
+                    self.handle_payload(payload)
+        finally:
+            self.listening.clear()
+            connection.close()
+
+    def handle_payload(self, payload: str) -> None:
+        try:
+            changes = parse_payload(payload)
+        except (ValueError, TypeError, AttributeError):
+            # e.g.: Sent by another application on the same channel
+            logger.warning('Ignore invalid feature flag notification: %r', payload)
+            return
+        self.registry.apply_changes(changes)
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except Exception:
+                logger.exception('Feature flag listener failed: Retry in %s seconds', self.retry_delay)
+                # Notifications may be lost in the meantime:
+                self.registry.apply_changes(None)
+                self.stopped.wait(self.retry_delay)
+
+
+def start_listener(*, registry: "FeatureFlagRegistry", channel: str) -> FeatureFlagListener | None:
+    """
+    Start a FeatureFlagListener thread. Returns None on other database backends than PostgreSQL.
+    """
+    if not is_supported():
+        logger.info('Feature flag notifications are only supported with PostgreSQL: Use polling')
+        return None
+    listener = FeatureFlagListener(registry=registry, channel=channel)
+    listener.start()
+    return listener
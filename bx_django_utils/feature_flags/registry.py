@@ -0,0 +1,602 @@
+from collections.abc import AsyncGenerator, Callable, Generator, Iterable, Mapping
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from copy import deepcopy
+import datetime
+import logging
+import math
+import time
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from bx_django_utils.feature_flags import notify
+from bx_django_utils.feature_flags.models import FeatureFlagModel
+from bx_django_utils.feature_flags.state import State
+
+
+if TYPE_CHECKING:
+    from bx_django_utils.feature_flags.data_classes import FeatureFlag, PercentageFeatureFlag
+
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'feature-flags-version'
+NOT_STORED = -1  # Cache value for flags without a database entry
+
+
+class StoredValues(NamedTuple):
+    """"""  # noqa - Don't add to README
+
+    states: Mapping[str, State]
+    percentages: Mapping[str, int]  # Only the entries with a rollout percentage
+
+
+def _get_stored_values(rows: Iterable[tuple[str, int, int | None]]) -> StoredValues:
+    states = {}
+    percentages = {}
+    for cache_key, state, percentage in rows:
+        states[cache_key] = State(state)
+        if percentage is not None:
+            percentages[cache_key] = percentage
+    return StoredValues(states=MappingProxyType(states), percentages=MappingProxyType(percentages))
+
+
+def fetch_stored_values() -> StoredValues:
+    """
+    Fetch all stored states and rollout percentages with one query into immutable mappings
+    """
+    rows = FeatureFlagModel.objects.values_list('cache_key', 'state', 'percentage')
+    return _get_stored_values(rows)
+
+
+async def afetch_stored_values() -> StoredValues:
+    """
+    Async version of fetch_stored_values()
+    """
+    rows = FeatureFlagModel.objects.values_list('cache_key', 'state', 'percentage')
+    return _get_stored_values([row async for row in rows])
+
+
+def _record_load(feature_flag: "FeatureFlag | None", *, start_time: float) -> None:
+    """
+    Record the load of all states as database load of the evaluated flag, that triggered it.
+    A load without a flag (e.g.: of the snapshot for pin_states()) is recorded for the first flag,
+    that is evaluated with the pinned states.
+    """
+    if feature_flag is None:
+        if pinned_states := get_pinned_states():
+            pinned_states._load_duration = time.perf_counter() - start_time
+    elif feature_flag.metrics_sink is not None:
+        feature_flag.metrics_sink.record_load(feature_flag, duration=time.perf_counter() - start_time)
+
+
+def _replace_values(values: Mapping[str, Any], changes: Mapping[str, Any | None]) -> Mapping[str, Any]:
+    values = dict(values)
+    for cache_key, value in changes.items():
+        if value is None:
+            values.pop(cache_key, None)
+        else:
+            values[cache_key] = value
+    return MappingProxyType(values)
+
+
+class PinnedStates:
+    """
+    Consistent states and rollout percentages of all flags, e.g.: for one request.
+    All of them are loaded at once via load()/aload(): From the registry snapshot (if enabled)
+    or with one query. So every check is a dict lookup, in sync and async code.
+    """
+
+    __slots__ = ('_load_duration', '_percentages', '_states')
+
+    def __init__(self):
+        self._states: dict[str, State | None] = {}  # Pinned states (None -> reset: initial state)
+        self._percentages: dict[str, int | None] = {}  # Pinned rollout percentages (None -> initial percentage)
+        self._load_duration: float | None = None  # Database load, that is not recorded in the metrics yet
+
+    def load(self, registry: Mapping[str, "FeatureFlag"]) -> None:
+        if isinstance(registry, FeatureFlagRegistry) and registry.snapshot_enabled:
+            stored_values = registry.get_stored_values()  # A database load is recorded via _record_load()
+        else:
+            start_time = time.perf_counter()
+            stored_values = fetch_stored_values()
+            self._load_duration = time.perf_counter() - start_time
+        self._set_stored_values(stored_values)
+
+    async def aload(self, registry: Mapping[str, "FeatureFlag"]) -> None:
+        """
+        Async version of load()
+        """
+        if isinstance(registry, FeatureFlagRegistry) and registry.snapshot_enabled:
+            stored_values = await registry.aget_stored_values()  # A database load is recorded via _record_load()
+        else:
+            start_time = time.perf_counter()
+            stored_values = await afetch_stored_values()
+            self._load_duration = time.perf_counter() - start_time
+        self._set_stored_values(stored_values)
+
+    def _set_stored_values(self, stored_values: StoredValues) -> None:
+        self._states.update(stored_values.states)
+        self._percentages.update(stored_values.percentages)
+
+    def _record_load(self, feature_flag: "FeatureFlag") -> None:
+        # The load of all states is recorded for the first evaluated flag:
+        duration, self._load_duration = self._load_duration, None
+        if feature_flag.metrics_sink is not None:
+            feature_flag.metrics_sink.record_load(feature_flag, duration=duration)
+
+    def get_state(self, feature_flag: "FeatureFlag") -> State:
+        if self._load_duration is not None:
+            self._record_load(feature_flag)
+        state = self._states.get(feature_flag.cache_key)
+        return feature_flag.initial_state if state is None else state
+
+    def get_percentage(self, feature_flag: "PercentageFeatureFlag") -> int:
+        if self._load_duration is not None:
+            self._record_load(feature_flag)
+        percentage = self._percentages.get(feature_flag.cache_key)
+        return feature_flag.initial_percentage if percentage is None else percentage
+
+    def update(self, changes: Mapping[str, State | None]) -> None:
+        self._states.update(changes)
+        for cache_key, state in changes.items():
+            if state is None:
+                self._percentages[cache_key] = None  # A reset removes the stored percentage, too
+
+    def update_percentages(self, changes: Mapping[str, int]) -> None:
+        self._percentages.update(changes)
+
+
+_pinned_states: ContextVar[PinnedStates | None] = ContextVar('feature_flag_pinned_states', default=None)
+
+
+def get_pinned_states() -> PinnedStates | None:
+    return _pinned_states.get()
+
+
+def _get_registry() -> Mapping[str, "FeatureFlag"]:
+    from bx_django_utils.feature_flags.data_classes import FeatureFlag  # Avoid a circular import
+
+    return FeatureFlag.registry
+
+
+@contextmanager
+def pin_states() -> Generator[PinnedStates, None, None]:
+    """
+    Pin the states of all feature flags in the current context (thread or asyncio task), e.g.:
+
+        with pin_states():
+            ...  # Every "is_enabled" is a dict lookup and returns the same state
+
+    All states are loaded at the start: From the registry snapshot (if enabled) or with one query.
+    State changes in the current context are applied to the pinned states.
+    In async code use apin_states(), because the states are loaded with the sync ORM here.
+    """
+    pinned_states = PinnedStates()
+    token = _pinned_states.set(pinned_states)
+    try:
+        pinned_states.load(_get_registry())
+        yield pinned_states
+    finally:
+        _pinned_states.reset(token)
+
+
+@asynccontextmanager
+async def apin_states() -> AsyncGenerator[PinnedStates, None]:
+    """
+    Async version of pin_states(): Loads the states with the async ORM and cache API, e.g.:
+
+        async with apin_states():
+            ...  # Every "is_enabled" and "ais_enabled" is a dict lookup and returns the same state
+    """
+    pinned_states = PinnedStates()
+    token = _pinned_states.set(pinned_states)
+    try:
+        await pinned_states.aload(_get_registry())
+        yield pinned_states
+    finally:
+        _pinned_states.reset(token)
+
+
+class FeatureFlagRegistry(dict):  # noqa FURB189 Must be compatible with the previous plain dict
+    """
+    Registry of all FeatureFlag instances (cache key -> FeatureFlag) used as `FeatureFlag.registry`.
+
+    Optional it holds a process-wide snapshot of all feature flag states, loaded with one query.
+    Activate it with e.g.: `FeatureFlag.registry.enable_snapshot(duration=timedelta(seconds=30))`
+
+    With a "cache_alias" the states are shared via Django's cache between all processes:
+    An expired snapshot is revalidated with one cache read of a global version, that will be
+    increased on every state change. Only after a change, all states are fetched with one get_many()
+    and only the first process fetches them from the database.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.snapshot_duration: datetime.timedelta | None = None  # None -> snapshot is disabled
+        self.snapshot_time_func: Callable[[], float] = time.monotonic
+        self.cache_alias: str | None = None  # None -> Don't use Django's cache
+        self.cache_timeout: int | None = None  # Timeout of the state cache entries
+        self._snapshot: Mapping[str, State] | None = None
+        self._snapshot_percentages: Mapping[str, int] | None = None
+        self._snapshot_from: float | None = None
+        self._snapshot_version: int | None = None
+        self.notify_channel: str | None = None  # None -> Don't send state changes via PostgreSQL NOTIFY
+        self._listener: notify.FeatureFlagListener | None = None
+
+    @property
+    def snapshot_enabled(self) -> bool:
+        return self.snapshot_duration is not None
+
+    def enable_snapshot(
+        self,
+        *,
+        duration: datetime.timedelta,
+        cache_alias: str | None = None,
+        cache_timeout: int | None = 60 * 60,
+    ) -> None:
+        """
+        Answer FeatureFlag.is_enabled from a snapshot of all states, that will be revalidated after "duration".
+        Share the states via the Django cache "cache_alias", if given.
+        """
+        self.snapshot_duration = duration
+        self.cache_alias = cache_alias
+        self.cache_timeout = cache_timeout
+        self.invalidate_snapshot()
+
+    def disable_snapshot(self) -> None:
+        self.snapshot_duration = None
+        self.cache_alias = None
+        self.invalidate_snapshot()
+
+    def invalidate_snapshot(self) -> None:
+        """
+        The next access will reload the snapshot.
+        """
+        self._snapshot = None
+        self._snapshot_percentages = None
+        self._snapshot_from = None
+        self._snapshot_version = None
+
+    def get_version(self) -> int:
+        """
+        Returns the global version of all states from Django's cache.
+        """
+        cache = caches[self.cache_alias]
+        version = cache.get(VERSION_CACHE_KEY)
+        if version is None:
+            # Use a new, unique start value, so no process will see a version twice:
+            cache.add(VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+            version = cache.get(VERSION_CACHE_KEY)
+        return version
+
+    async def aget_version(self) -> int:
+        """
+        Async version of get_version()
+        """
+        cache = caches[self.cache_alias]
+        version = await cache.aget(VERSION_CACHE_KEY)
+        if version is None:
+            await cache.aadd(VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+            version = await cache.aget(VERSION_CACHE_KEY)
+        return version
+
+    def bump_version(self) -> None:
+        """
+        Increase the global version: All processes will fetch the states again after their snapshot expired.
+        """
+        cache = caches[self.cache_alias]
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            # Key doesn't exist (anymore)
+            cache.add(VERSION_CACHE_KEY, time.time_ns(), timeout=None)
+
+    def notify_state_change(self, *, cache_key: str, state: State | None) -> None:
+        """
+        Called after the state of a flag was changed in this process. state=None means the flag was reset.
+        """
+        self.notify_state_changes({cache_key: state})
+
+    def notify_state_changes(self, changes: Mapping[str, State | None]) -> None:
+        """
+        Called after the states of flags (cache key -> new state) were changed in this process.
+        The global version will be increased only once.
+        """
+        self.update_snapshot(changes)
+        if pinned_states := get_pinned_states():
+            pinned_states.update(changes)
+        if self.cache_alias is not None:
+            # Other processes should not fetch the old state, before the transaction is committed:
+            transaction.on_commit(self.bump_version)
+        if self.notify_channel is not None:
+            notify.send_notification(channel=self.notify_channel, changes=changes)
+
+    def notify_percentage_changes(self, changes: Mapping[str, int]) -> None:
+        """
+        Called after the rollout percentages of flags (cache key -> new percentage) were changed in this process.
+        Same as notify_state_changes(), but the notification lets all other processes reload
+        the states and percentages, because rollout changes are rare.
+        """
+        if self._snapshot_percentages is not None:
+            self._snapshot_percentages = _replace_values(self._snapshot_percentages, changes)
+        if pinned_states := get_pinned_states():
+            pinned_states.update_percentages(changes)
+        if self.cache_alias is not None:
+            transaction.on_commit(self.bump_version)
+        if self.notify_channel is not None:
+            notify.send_notification(channel=self.notify_channel, changes=None)
+
+    def enable_notifications(self, *, channel: str = notify.DEFAULT_CHANNEL, listen: bool = True) -> None:
+        """
+        PostgreSQL only: Send all state changes via NOTIFY on "channel" and (if "listen" is set)
+        start a background thread, that applies the changes of all processes immediately.
+        So the snapshot and cache durations can be very long. Other database backends use only the polling.
+        Note: Call it after forking the worker processes, because threads don't survive a fork.
+        """
+        self.notify_channel = channel
+        if listen and self._listener is None:
+            self._listener = notify.start_listener(registry=self, channel=channel)
+
+    def disable_notifications(self) -> None:
+        self.notify_channel = None
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def apply_changes(self, changes: Mapping[str, State | None] | None) -> None:
+        """
+        Apply the state changes of another process (e.g.: received via notification) to the snapshot
+        and the in-process caches. changes=None -> all states may have changed: Reload them on next access.
+        """
+        if changes is None:
+            # Only expire the caches: Other threads may read them in the meantime
+            self._snapshot_version = None
+            self._snapshot_from = -math.inf
+            for feature_flag in list(self.values()):
+                if getattr(feature_flag, '_cache_from', None) is not None:
+                    feature_flag._cache_from = -math.inf
+                if getattr(feature_flag, '_percentage_from', None) is not None:
+                    feature_flag._percentage_from = -math.inf
+            return
+
+        self.update_snapshot(changes)
+        for cache_key, state in changes.items():
+            feature_flag = self.get(cache_key)
+            if feature_flag is not None and hasattr(feature_flag, '_cache_duration'):
+                feature_flag._set_cache_value(feature_flag.initial_state if state is None else state)
+            if state is None and hasattr(feature_flag, 'initial_percentage'):
+                feature_flag._set_cached_percentage(feature_flag.initial_percentage)
+
+    def load_snapshot(self, *, feature_flag: "FeatureFlag | None" = None) -> Mapping[str, State]:
+        """
+        Load all stored states (and rollout percentages) with one query into an immutable mapping.
+        The load is recorded in the metrics of the given "feature_flag", that triggered it.
+        """
+        start_time = time.perf_counter()
+        snapshot = self._set_snapshot(fetch_stored_values())
+        _record_load(feature_flag, start_time=start_time)
+        logger.debug('Feature flag snapshot loaded with %i states', len(snapshot))
+        return snapshot
+
+    async def aload_snapshot(self, *, feature_flag: "FeatureFlag | None" = None) -> Mapping[str, State]:
+        """
+        Async version of load_snapshot()
+        """
+        start_time = time.perf_counter()
+        snapshot = self._set_snapshot(await afetch_stored_values())
+        _record_load(feature_flag, start_time=start_time)
+        logger.debug('Feature flag snapshot loaded with %i states', len(snapshot))
+        return snapshot
+
+    def _set_snapshot(self, stored_values: StoredValues) -> Mapping[str, State]:
+        self._snapshot_percentages = stored_values.percentages
+        self._snapshot = stored_values.states
+        self._snapshot_from = self.snapshot_time_func()
+        return stored_values.states
+
+    def get_snapshot(self, *, feature_flag: "FeatureFlag | None" = None) -> Mapping[str, State]:
+        """
+        Returns the snapshot of all stored states and revalidate it, if it's expired.
+        A database load is recorded in the metrics of the given "feature_flag".
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            elapsed = self.snapshot_time_func() - self._snapshot_from
+            if elapsed <= self.snapshot_duration.total_seconds():
+                return snapshot
+        if self.cache_alias is None:
+            return self.load_snapshot(feature_flag=feature_flag)
+        return self._revalidate_snapshot(feature_flag=feature_flag)
+
+    async def aget_snapshot(self, *, feature_flag: "FeatureFlag | None" = None) -> Mapping[str, State]:
+        """
+        Async version of get_snapshot(): Uses the async ORM and cache API.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            elapsed = self.snapshot_time_func() - self._snapshot_from
+            if elapsed <= self.snapshot_duration.total_seconds():
+                return snapshot
+        if self.cache_alias is None:
+            return await self.aload_snapshot(feature_flag=feature_flag)
+        return await self._arevalidate_snapshot(feature_flag=feature_flag)
+
+    def _revalidate_snapshot(self, *, feature_flag: "FeatureFlag | None") -> Mapping[str, State]:
+        version = self.get_version()
+        if self._snapshot is not None and version == self._snapshot_version:
+            # Nothing changed since the last load -> use the current snapshot for the next period
+            self._snapshot_from = self.snapshot_time_func()
+            return self._snapshot
+
+        cache = caches[self.cache_alias]
+        versioned_keys = self._get_versioned_keys(version)
+        values = cache.get_many(versioned_keys)
+        if len(values) == len(versioned_keys):
+            # All states found in the cache
+            snapshot = self._set_cached_snapshot(versioned_keys, values)
+        else:
+            snapshot = self.load_snapshot(feature_flag=feature_flag)
+            cache.set_many(self._get_cache_values(versioned_keys), timeout=self.cache_timeout)
+        self._snapshot_version = version
+        return snapshot
+
+    async def _arevalidate_snapshot(self, *, feature_flag: "FeatureFlag | None") -> Mapping[str, State]:
+        version = await self.aget_version()
+        if self._snapshot is not None and version == self._snapshot_version:
+            # Nothing changed since the last load -> use the current snapshot for the next period
+            self._snapshot_from = self.snapshot_time_func()
+            return self._snapshot
+
+        cache = caches[self.cache_alias]
+        versioned_keys = self._get_versioned_keys(version)
+        values = await cache.aget_many(versioned_keys)
+        if len(values) == len(versioned_keys):
+            # All states found in the cache
+            snapshot = self._set_cached_snapshot(versioned_keys, values)
+        else:
+            snapshot = await self.aload_snapshot(feature_flag=feature_flag)
+            await cache.aset_many(self._get_cache_values(versioned_keys), timeout=self.cache_timeout)
+        self._snapshot_version = version
+        return snapshot
+
+    def _get_versioned_keys(self, version: int) -> dict[str, tuple[str, bool]]:
+        # versioned cache key -> (cache key, is it the rollout percentage?)
+        versioned_keys = {f'{cache_key}-v{version}': (cache_key, False) for cache_key in self}
+        versioned_keys.update(
+            (f'{cache_key}-percentage-v{version}', (cache_key, True))
+            for cache_key, feature_flag in self.items()
+            if hasattr(feature_flag, 'initial_percentage')
+        )
+        return versioned_keys
+
+    def _set_cached_snapshot(self, versioned_keys: dict[str, tuple[str, bool]], values: dict) -> Mapping[str, State]:
+        states = {}
+        percentages = {}
+        for versioned_key, value in values.items():
+            if value != NOT_STORED:
+                cache_key, is_percentage = versioned_keys[versioned_key]
+                if is_percentage:
+                    percentages[cache_key] = value
+                else:
+                    states[cache_key] = State(value)
+        return self._set_snapshot(
+            StoredValues(states=MappingProxyType(states), percentages=MappingProxyType(percentages))
+        )
+
+    def _get_cache_values(self, versioned_keys: dict[str, tuple[str, bool]]) -> dict[str, int]:
+        cache_values = {}
+        for versioned_key, (cache_key, is_percentage) in versioned_keys.items():
+            if is_percentage:
+                cache_values[versioned_key] = self._snapshot_percentages.get(cache_key, NOT_STORED)
+            elif cache_key in self._snapshot:
+                cache_values[versioned_key] = self._snapshot[cache_key].value
+            else:
+                cache_values[versioned_key] = NOT_STORED
+        return cache_values
+
+    def get_state(self, feature_flag: "FeatureFlag") -> State:
+        """
+        Returns the state of the given flag from the snapshot. Not stored states are the initial state.
+        """
+        return self.get_snapshot(feature_flag=feature_flag).get(feature_flag.cache_key, feature_flag.initial_state)
+
+    async def aget_state(self, feature_flag: "FeatureFlag") -> State:
+        """
+        Async version of get_state()
+        """
+        snapshot = await self.aget_snapshot(feature_flag=feature_flag)
+        return snapshot.get(feature_flag.cache_key, feature_flag.initial_state)
+
+    def get_stored_values(self) -> StoredValues:
+        """
+        Returns all stored states and rollout percentages from the snapshot, revalidated if it's expired.
+        """
+        states = self.get_snapshot()
+        return StoredValues(states=states, percentages=self._snapshot_percentages)
+
+    async def aget_stored_values(self) -> StoredValues:
+        """
+        Async version of get_stored_values()
+        """
+        states = await self.aget_snapshot()
+        return StoredValues(states=states, percentages=self._snapshot_percentages)
+
+    def get_percentage(self, feature_flag: "PercentageFeatureFlag") -> int:
+        """
+        Returns the rollout percentage of the given flag from the snapshot. Not stored ones are the initial percentage.
+        """
+        self.get_snapshot()
+        return self._snapshot_percentages.get(feature_flag.cache_key, feature_flag.initial_percentage)
+
+    def update_snapshot(self, changes: Mapping[str, State | None]) -> None:
+        """
+        Update the states (cache key -> new state) in the current snapshot, e.g.: after changing them in this process.
+        A None state will remove the flag (and its rollout percentage) from the snapshot, e.g.: after a reset.
+        """
+        if self._snapshot is not None:
+            self._snapshot_percentages = _replace_values(
+                self._snapshot_percentages,
+                {cache_key: None for cache_key, state in changes.items() if state is None},
+            )
+            self._snapshot = _replace_values(self._snapshot, changes)
+
+    def preload(self) -> Mapping[str, State]:
+        """
+        Load the states of all flags with one query, e.g.: at process startup.
+        Fills the snapshot (if enabled) and the in-process caches of all flags with a "cache_duration"
+        and the rollout percentages.
+        """
+        if self.snapshot_enabled:
+            states = self.get_snapshot()
+            percentages = self._snapshot_percentages
+        else:
+            states, percentages = fetch_stored_values()
+        for cache_key, feature_flag in self.items():
+            if hasattr(feature_flag, '_cache_duration'):
+                feature_flag._set_cache_value(states.get(cache_key, feature_flag.initial_state))
+            if hasattr(feature_flag, 'initial_percentage'):
+                feature_flag._set_cached_percentage(percentages.get(cache_key, feature_flag.initial_percentage))
+        return states
+
+    def materialize_missing(self) -> list[str]:
+        """
+        Create the missing database entries of all registered flags with their initial state.
+        e.g.: Call it at startup or via the "materialize_feature_flags" manage command.
+        Returns the cache keys of the created entries.
+        """
+        existing = set(
+            FeatureFlagModel.objects.filter(cache_key__in=list(self)).values_list('cache_key', flat=True)
+        )
+        now = timezone.now()  # bulk_create() doesn't call save() that set the TimetrackingBaseModel fields
+        instances = [
+            FeatureFlagModel(cache_key=cache_key, state=feature_flag.initial_state, create_dt=now, update_dt=now)
+            for cache_key, feature_flag in sorted(self.items())
+            if cache_key not in existing
+        ]
+        if instances:
+            # Another process may create the same entries in the meantime:
+            FeatureFlagModel.objects.bulk_create(instances, ignore_conflicts=True)
+            logger.debug('Materialized %i feature flags', len(instances))
+        return [instance.cache_key for instance in instances]
+
+    def clear(self) -> None:
+        super().clear()
+        self.invalidate_snapshot()
+
+    def __deepcopy__(self, memo):
+        # Copy the flags and the configuration, but not the snapshot (it will be loaded on demand) and the listener.
+        registry = type(self)()
+        memo[id(self)] = registry
+        for cache_key, feature_flag in self.items():
+            registry[deepcopy(cache_key, memo)] = deepcopy(feature_flag, memo)
+        registry.snapshot_duration = self.snapshot_duration
+        registry.snapshot_time_func = self.snapshot_time_func
+        registry.cache_alias = self.cache_alias
+        registry.cache_timeout = self.cache_timeout
+        registry.notify_channel = self.notify_channel
+        return registry
@@ -27,7 +27,7 @@ class FeatureFlagTestCaseMixin(ClearCacheMixin):
 
     * Restore `FeatureFlag.registry` between tests.
     * Restore all feature flags to the initial stage between tests.
-    * Warm-up the cache with the initial state of all feature flags.
+    * Warm-up the cache and database with the initial state of all feature flags.
 
     Used ClearCacheMixin to remove persistent data in Django's cache.
     Should be used with django.test.TestCase so that persistent data in database also be removed!
@@ -60,6 +60,7 @@ class FeatureFlagTestCaseMixin(ClearCacheMixin):
         FeatureFlag.registry = deepcopy(self._origin_feature_flag_registry)
 
         if self.warum_up_feature_flag_cache:
+            FeatureFlag.registry.materialize_missing()
             for feature_flag in FeatureFlag.registry.values():
                 feature_flag.is_enabled  # noqa B018 Will fill the cache with the initial state
 
@@ -0,0 +1,138 @@
+import datetime
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from bx_django_utils.feature_flags.data_classes import FeatureFlag
+from bx_django_utils.feature_flags.exceptions import FeatureFlagDisabled
+from bx_django_utils.feature_flags.models import FeatureFlagModel
+from bx_django_utils.feature_flags.registry import VERSION_CACHE_KEY, apin_states
+from bx_django_utils.feature_flags.state import State
+from bx_django_utils.feature_flags.test_utils import FeatureFlagTestCaseMixin
+from bx_django_utils.feature_flags.utils import if_feature
+
+
+class AsyncFeatureFlagTestCase(FeatureFlagTestCaseMixin, TestCase):
+    """"""  # noqa - Don't add to README
+
+    warum_up_feature_flag_cache = False
+
+    def setUp(self):
+        super().setUp()
+        FeatureFlag.registry.clear()
+        self.enabled_flag = FeatureFlag(cache_key='async-enabled', human_name='Async enabled', initial_enabled=True)
+        self.disabled_flag = FeatureFlag(cache_key='async-disabled', human_name='Async disabled', initial_enabled=False)
+
+    async def test_ais_enabled(self):
+        # A sync database query would raise SynchronousOnlyOperation here
+        self.assertIs(await self.enabled_flag.ais_enabled(), True)
+        self.assertIs(await self.disabled_flag.ais_enabled(), False)
+
+        await FeatureFlagModel.objects.acreate(cache_key='feature-flags-async-enabled', state=State.DISABLED)
+        self.assertIs(await self.enabled_flag.ais_enabled(), False)
+
+        async with apin_states():
+            self.assertIs(await self.enabled_flag.ais_enabled(), False)
+            await FeatureFlagModel.objects.filter(cache_key='feature-flags-async-enabled').aupdate(state=State.ENABLED)
+            self.assertIs(await self.enabled_flag.ais_enabled(), False)  # pinned
+        self.assertIs(await self.enabled_flag.ais_enabled(), True)
+
+    async def test_cache(self):
+        now = 100.0
+        flag = FeatureFlag(
+            cache_key='async-cached',
+            human_name='Async cached',
+            initial_enabled=True,
+            cache_duration=datetime.timedelta(seconds=60),
+        )
+        flag._cache_time_func = lambda: now
+        self.assertIs(await flag.ais_enabled(), True)
+        await FeatureFlagModel.objects.acreate(cache_key='feature-flags-async-cached', state=State.DISABLED)
+        self.assertIs(await flag.ais_enabled(), True)  # cached
+
+        now = 161.0
+        # Another thread refreshes the cache -> use the stale value without waiting:
+        with flag._cache_lock:
+            self.assertIs(await flag.ais_enabled(), True)
+        self.assertIs(await flag.ais_enabled(), False)
+        self.assertIs(flag._cache_lock.locked(), False)
+
+        # Empty cache and another thread computes the first value -> compute without waiting:
+        flag._cache_from = None
+        with flag._cache_lock:
+            self.assertIs(await flag.ais_enabled(), False)
+
+    async def test_cache_refresh_without_lock(self):
+        now = 100.0
+        flag = FeatureFlag(
+            cache_key='async-refresh',
+            human_name='Async refresh',
+            initial_enabled=True,
+            cache_duration=datetime.timedelta(seconds=60),
+        )
+        flag._cache_time_func = lambda: now
+        checks = []
+
+        async def acompute_is_enabled():
+            # A sync check in the same thread would deadlock, if the lock is held across the await:
+            self.assertIs(flag._cache_lock.locked(), False)
+            if flag._cache_from is not None:
+                checks.append(flag.is_enabled)  # The stale value is used in the meantime
+            return not now % 2
+
+        with mock.patch.object(flag, '_acompute_is_enabled', acompute_is_enabled):
+            self.assertIs(await flag.ais_enabled(), True)  # Empty cache
+
+            now = 161.0
+            self.assertIs(await flag.ais_enabled(), False)  # Expired cache
+            self.assertEqual(checks, [True])
+
+        # A failed refresh will be retried on the next check:
+        now = 222.0
+        with (
+            mock.patch.object(flag, '_acompute_is_enabled', side_effect=ZeroDivisionError),
+            self.assertRaises(ZeroDivisionError),
+        ):
+            await flag.ais_enabled()
+        self.assertIs(await flag.ais_enabled(), True)
+
+    async def test_snapshot(self):
+        FeatureFlag.registry.enable_snapshot(duration=datetime.timedelta(seconds=30), cache_alias='default')
+        await FeatureFlagModel.objects.acreate(cache_key='feature-flags-async-disabled', state=State.ENABLED)
+
+        self.assertIs(await self.enabled_flag.ais_enabled(), True)
+        self.assertIs(await self.disabled_flag.ais_enabled(), True)
+
+        # The states are stored in the cache:
+        version = await cache.aget(VERSION_CACHE_KEY)
+        self.assertEqual(await cache.aget(f'feature-flags-async-enabled-v{version}'), -1)  # Not stored
+        self.assertEqual(await cache.aget(f'feature-flags-async-disabled-v{version}'), State.ENABLED)
+
+        # Another process loads the states from the cache:
+        FeatureFlag.registry.invalidate_snapshot()
+        await FeatureFlagModel.objects.all().adelete()
+        self.assertIs(await self.disabled_flag.ais_enabled(), True)
+
+        # After a version bump, the states are reloaded from the database:
+        FeatureFlag.registry.invalidate_snapshot()
+        await cache.aincr(VERSION_CACHE_KEY)
+        self.assertIs(await self.disabled_flag.ais_enabled(), False)
+
+    async def test_if_feature(self):
+        @if_feature(self.enabled_flag)
+        async def enabled():
+            return 'enabled'
+
+        @if_feature(self.disabled_flag, retval_factory=lambda: 'default')
+        async def disabled():
+            return 'disabled'
+
+        @if_feature(self.disabled_flag, raise_exception=True)
+        async def raising():
+            return 'raising'
+
+        self.assertEqual(await enabled(), 'enabled')
+        self.assertEqual(await disabled(), 'default')
+        with self.assertRaises(FeatureFlagDisabled):
+            await raising()
@@ -1,11 +1,17 @@
 import copy
 import datetime
+from io import StringIO
+import threading
+from unittest import mock
 
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
 
 from bx_django_utils.feature_flags.data_classes import FeatureFlag
 from bx_django_utils.feature_flags.exceptions import FeatureFlagDisabled, NotUniqueFlag
 from bx_django_utils.feature_flags.models import FeatureFlagModel
+from bx_django_utils.feature_flags.registry import VERSION_CACHE_KEY, FeatureFlagRegistry, pin_states
 from bx_django_utils.feature_flags.state import State
 from bx_django_utils.feature_flags.test_utils import FeatureFlagTestCaseMixin
 from bx_django_utils.feature_flags.utils import if_feature
@@ -96,6 +102,73 @@ class FeatureFlagsTestCase(FeatureFlagTestCaseMixin, TestCase):
         self.initial_enabled_test_flag.set_state(State.ENABLED)
         self.assertEqual(self.initial_enabled_test_flag.state, State.ENABLED)
 
+    def test_bulk_set_states(self):
+        cached_flag = FeatureFlag(
+            cache_key='test-cached',
+            human_name='A cached test flag',
+            initial_enabled=False,
+            cache_duration=datetime.timedelta(seconds=60),
+        )
+        self.assertIs(cached_flag.is_enabled, False)
+        self.initial_disabled_test_flag.enable()
+
+        with self.assertNumQueries(4):  # SAVEPOINT, SELECT, INSERT ... ON CONFLICT, RELEASE SAVEPOINT
+            changed = FeatureFlag.bulk_set_states(
+                {
+                    self.initial_enabled_test_flag: State.DISABLED,  # Not stored -> changed
+                    self.initial_disabled_test_flag: State.ENABLED,  # Unchanged
+                    cached_flag: State.ENABLED,  # Not stored -> changed
+                }
+            )
+        self.assertEqual(changed, {self.initial_enabled_test_flag, cached_flag})
+        self.assertEqual(
+            list(FeatureFlagModel.objects.order_by('cache_key').values_list('cache_key', 'state')),
+            [
+                ('feature-flags-test-cached', State.ENABLED),
+                ('feature-flags-test-initial_disabled', State.ENABLED),
+                ('feature-flags-test-initial_enabled', State.DISABLED),
+            ],
+        )
+        with self.assertNumQueries(0):
+            self.assertIs(cached_flag.is_enabled, True)  # In-process cache updated
+
+        instance = FeatureFlagModel.objects.get(cache_key='feature-flags-test-initial_enabled')
+        self.assertIsNotNone(instance.create_dt)
+        self.assertEqual(instance.create_dt, instance.update_dt)
+
+        # Store an initial state, that is not stored, yet: Not changed
+        self.initial_enabled_test_flag.reset()
+        changed = FeatureFlag.bulk_set_states(
+            {self.initial_enabled_test_flag: State.ENABLED, cached_flag: State.DISABLED},
+        )
+        self.assertEqual(changed, {cached_flag})
+        self.assertEqual(self.initial_enabled_test_flag.state, State.ENABLED)
+        self.assertEqual(cached_flag.state, State.DISABLED)
+        updated = FeatureFlagModel.objects.get(cache_key='feature-flags-test-cached')
+        self.assertGreater(updated.update_dt, updated.create_dt)
+
+        with self.assertNumQueries(3):  # SAVEPOINT, SELECT (nothing to store), RELEASE SAVEPOINT
+            self.assertEqual(FeatureFlag.bulk_set_states({cached_flag: State.DISABLED}), set())
+
+        with self.assertRaisesMessage(AssertionError, 'is not a State object!'):
+            FeatureFlag.bulk_set_states({cached_flag: True})
+
+    def test_bulk_set_states_version_bump(self):
+        FeatureFlag.registry.enable_snapshot(duration=datetime.timedelta(seconds=30), cache_alias='default')
+        with pin_states():
+            self.assertIs(self.initial_enabled_test_flag.is_enabled, True)
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                FeatureFlag.bulk_set_states(
+                    {self.initial_enabled_test_flag: State.DISABLED, self.initial_disabled_test_flag: State.ENABLED}
+                )
+            self.assertEqual(len(callbacks), 1)  # Only one version bump
+            # Pinned states and snapshot are updated:
+            self.assertIs(self.initial_enabled_test_flag.is_enabled, False)
+            self.assertIs(self.initial_disabled_test_flag.is_enabled, True)
+        with self.assertNumQueries(0):
+            self.assertIs(self.initial_enabled_test_flag.is_enabled, False)
+            self.assertIs(self.initial_disabled_test_flag.is_enabled, True)
+
     def test_enable_disable(self):
         self.assertEqual(self.initial_enabled_test_flag.state, State.ENABLED)
         self.initial_enabled_test_flag.disable()
@@ -199,6 +272,94 @@ class FeatureFlagsTestCase(FeatureFlagTestCaseMixin, TestCase):
         ff._cache_time_func = future
         self.assertFalse(ff)  # now it's disabled due to cache expiration
 
+    def test_cache_single_flight(self):
+        ff = FeatureFlag(
+            cache_key='single-flight',
+            human_name='Single Flight',
+            initial_enabled=True,
+            cache_duration=datetime.timedelta(seconds=60),
+        )
+        computing = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_compute():
+            calls.append(threading.current_thread().name)
+            computing.set()
+            release.wait(timeout=5)
+            return False
+
+        # Empty cache: The other thread waits for the first value:
+        with mock.patch.object(ff, '_compute_is_enabled', slow_compute):
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(ff.is_enabled)) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            self.assertTrue(computing.wait(timeout=5))
+            release.set()
+            for thread in threads:
+                thread.join(timeout=5)
+        self.assertEqual(results, [False, False, False])
+        self.assertEqual(len(calls), 1)
+
+        # Expired cache: Only one thread recomputes, the others use the stale value:
+        ff._cache_time_func = mock.Mock(return_value=ff._cache_from + 61)
+        computing.clear()
+        release.clear()
+        calls.clear()
+        with mock.patch.object(ff, '_compute_is_enabled', slow_compute):
+            results = []
+            thread = threading.Thread(target=lambda: results.append(ff.is_enabled))
+            thread.start()
+            self.assertTrue(computing.wait(timeout=5))
+            self.assertIs(ff.is_enabled, False)  # The stale value
+            release.set()
+            thread.join(timeout=5)
+        self.assertEqual(results, [False])
+        self.assertEqual(len(calls), 1)
+
+        # The lock is released on errors:
+        ff._cache_time_func.return_value += 61
+        with (
+            mock.patch.object(ff, '_compute_is_enabled', side_effect=ZeroDivisionError),
+            self.assertRaises(ZeroDivisionError),
+        ):
+            ff.is_enabled  # noqa B018
+        self.assertIs(ff._cache_lock.locked(), False)
+
+        # A copy has its own lock:
+        another_reference = copy.deepcopy(ff)
+        self.assertIsNot(another_reference._cache_lock, ff._cache_lock)
+
+    def test_cache_jitter(self):
+        with mock.patch('random.uniform', return_value=7.5) as uniform:
+            ff = FeatureFlag(
+                cache_key='jitter',
+                human_name='Jitter',
+                initial_enabled=True,
+                cache_duration=datetime.timedelta(seconds=60),
+                cache_jitter=datetime.timedelta(seconds=10),
+            )
+            uniform.assert_called_once_with(0, 10.0)
+            time_func = mock.Mock(return_value=100.0)
+            ff._cache_time_func = time_func
+            self.assertIs(ff.is_enabled, True)
+
+        with self.assertNumQueries(0):
+            time_func.return_value = 167.5
+            self.assertIs(ff.is_enabled, True)
+        with self.assertNumQueries(1):
+            time_func.return_value = 167.6
+            self.assertIs(ff.is_enabled, True)
+
+        no_jitter = FeatureFlag(
+            cache_key='no-jitter',
+            human_name='No Jitter',
+            initial_enabled=True,
+            cache_duration=datetime.timedelta(seconds=60),
+        )
+        self.assertEqual(no_jitter._cache_period, 60)
+
 
 class IsolatedFeatureFlagsTestCase(FeatureFlagTestCaseMixin, TestCase):
     """"""  # noqa - Don't add to README
@@ -218,6 +379,39 @@ class IsolatedFeatureFlagsTestCase(FeatureFlagTestCaseMixin, TestCase):
         # Reset again – should not error
         flag.reset()
 
+    def test_read_only(self):
+        flag = FeatureFlag(cache_key='read-only', human_name='Read only', initial_enabled=True)
+        with self.assertNumQueries(1):
+            self.assertIs(flag.is_enabled, True)
+        self.assertFalse(FeatureFlagModel.objects.filter(cache_key=flag.cache_key).exists())
+
+    def test_materialize_missing(self):
+        self.assertEqual(
+            FeatureFlag.registry.keys(), {'feature-flags-foo', 'feature-flags-bar'}
+        )
+        FeatureFlagModel.objects.all().delete()  # Created by the warm-up of FeatureFlagTestCaseMixin
+        FeatureFlagModel.objects.create(cache_key='feature-flags-foo', state=State.DISABLED)
+
+        with self.assertNumQueries(2):  # SELECT + INSERT
+            created = FeatureFlag.registry.materialize_missing()
+        self.assertEqual(created, ['feature-flags-bar'])
+        self.assertEqual(
+            dict(FeatureFlagModel.objects.values_list('cache_key', 'state')),
+            {'feature-flags-foo': State.DISABLED, 'feature-flags-bar': State.DISABLED},
+        )
+        instance = FeatureFlagModel.objects.get(cache_key='feature-flags-bar')
+        self.assertIsNotNone(instance.create_dt)
+        self.assertEqual(instance.create_dt, instance.update_dt)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(FeatureFlag.registry.materialize_missing(), [])
+
+        FeatureFlag(cache_key='new', human_name='New', initial_enabled=True)
+        stdout = StringIO()
+        call_command('materialize_feature_flags', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), " * 'feature-flags-new' created\n1 of 3 feature flags created.\n")
+        self.assertEqual(FeatureFlagModel.objects.get(cache_key='feature-flags-new').state, State.ENABLED)
+
     def test_str(self):
         flag = FeatureFlag(
             cache_key='be-wild',
@@ -251,3 +445,138 @@ class IsolatedFeatureFlagsTestCase(FeatureFlagTestCaseMixin, TestCase):
         # Cache should now be filled with the DB value (False) and not the initial state (True)
         self.assertIsNotNone(feature_flag._cache_from)
         self.assertEqual(feature_flag._cache_value, State.DISABLED)
+
+
+class FeatureFlagSnapshotTestCase(FeatureFlagTestCaseMixin, TestCase):
+    """"""  # noqa - Don't add to README
+
+    warum_up_feature_flag_cache = False
+
+    def setUp(self):
+        super().setUp()
+        FeatureFlag.registry.clear()
+        self.flags = [
+            FeatureFlag(cache_key=f'snapshot-{no}', human_name=f'Snapshot {no}', initial_enabled=bool(no % 2))
+            for no in range(12)
+        ]
+        FeatureFlagModel.objects.create(cache_key='feature-flags-snapshot-0', state=State.ENABLED)
+        FeatureFlagModel.objects.create(cache_key='feature-flags-snapshot-1', state=State.DISABLED)
+
+        self.now = 0.0
+        FeatureFlag.registry.snapshot_time_func = lambda: self.now
+        FeatureFlag.registry.enable_snapshot(duration=datetime.timedelta(seconds=30))
+
+    def test_snapshot(self):
+        self.assertIsInstance(FeatureFlag.registry, FeatureFlagRegistry)
+        expected_states = [True, False] + [bool(no % 2) for no in range(2, 12)]
+
+        # All flags are answered with one query:
+        with self.assertNumQueries(1):
+            self.assertEqual([flag.is_enabled for flag in self.flags], expected_states)
+        with self.assertNumQueries(0):
+            self.assertEqual([flag.is_enabled for flag in self.flags], expected_states)
+
+        # Missing entries are not created:
+        self.assertEqual(FeatureFlagModel.objects.count(), 2)
+
+        snapshot = FeatureFlag.registry.get_snapshot()
+        with self.assertRaises(TypeError):
+            snapshot['foo'] = State.ENABLED
+
+        # Changes in this process are applied to the snapshot:
+        self.flags[0].disable()
+        self.flags[2].enable()
+        with self.assertNumQueries(0):
+            self.assertIs(self.flags[0].is_enabled, False)
+            self.assertIs(self.flags[2].is_enabled, True)
+        self.flags[0].reset()
+        with self.assertNumQueries(0):
+            self.assertIs(self.flags[0].is_enabled, False)  # initial state
+
+        # Changes from other processes are visible after the snapshot expired:
+        FeatureFlagModel.objects.filter(cache_key='feature-flags-snapshot-1').update(state=State.ENABLED)
+        self.now = 30
+        with self.assertNumQueries(0):
+            self.assertIs(self.flags[1].is_enabled, False)
+        self.now = 31
+        with self.assertNumQueries(1):
+            self.assertIs(self.flags[1].is_enabled, True)
+            self.assertIs(self.flags[2].is_enabled, True)
+
+    def test_deepcopy_and_disable(self):
+        self.assertIs(self.flags[1].is_enabled, False)
+        registry = copy.deepcopy(FeatureFlag.registry)
+        self.assertIsInstance(registry, FeatureFlagRegistry)
+        self.assertEqual(registry.keys(), FeatureFlag.registry.keys())
+        self.assertEqual(registry.snapshot_duration, datetime.timedelta(seconds=30))
+        self.assertIsNone(registry._snapshot)  # will be loaded on demand
+
+        FeatureFlag.registry.disable_snapshot()
+        with self.assertNumQueries(1):
+            self.assertIs(self.flags[2].is_enabled, False)
+        self.assertEqual(FeatureFlagModel.objects.count(), 2)
+
+    def test_shared_cache(self):
+        FeatureFlag.registry.enable_snapshot(duration=datetime.timedelta(seconds=30), cache_alias='default')
+        expected_states = [True, False] + [bool(no % 2) for no in range(2, 12)]
+
+        # Simulate other processes with own registries:
+        registry2 = copy.deepcopy(FeatureFlag.registry)
+        registry3 = copy.deepcopy(FeatureFlag.registry)
+
+        # The first process loads the states from the database and fill the cache:
+        with self.assertNumQueries(1):
+            self.assertEqual([flag.is_enabled for flag in self.flags], expected_states)
+        version = cache.get(VERSION_CACHE_KEY)
+        self.assertIsInstance(version, int)
+        self.assertEqual(cache.get(f'feature-flags-snapshot-0-v{version}'), State.ENABLED)
+        self.assertEqual(cache.get(f'feature-flags-snapshot-2-v{version}'), -1)  # Not stored in database
+
+        # Other processes get all states from the cache:
+        with self.assertNumQueries(0):
+            self.assertEqual([bool(registry2.get_state(flag)) for flag in self.flags], expected_states)
+
+        # Revalidate after the snapshot expired: Only the version will be fetched from the cache:
+        self.now = 31
+        with (
+            self.assertNumQueries(0),
+            mock.patch.object(cache, 'get_many', side_effect=AssertionError) as get_many_mock,
+        ):
+            self.assertEqual([flag.is_enabled for flag in self.flags], expected_states)
+            self.assertEqual([bool(registry2.get_state(flag)) for flag in self.flags], expected_states)
+        get_many_mock.assert_not_called()
+
+        # Change a state: The version will be increased after commit:
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.flags[2].enable()
+            self.assertEqual(cache.get(VERSION_CACHE_KEY), version)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(cache.get(VERSION_CACHE_KEY), version + 1)
+        self.assertIs(self.flags[2].is_enabled, True)  # Current process is up-to-date
+
+        # Other processes see the old state until their snapshot expired:
+        self.assertIs(registry2.get_state(self.flags[2]), State.DISABLED)
+        self.now = 62
+        expected_states[2] = True
+
+        # The first process, that revalidate, fetch the states from the database:
+        with self.assertNumQueries(1):
+            self.assertEqual([bool(registry2.get_state(flag)) for flag in self.flags], expected_states)
+        # ...all others from the cache:
+        with self.assertNumQueries(0):
+            self.assertEqual([bool(registry3.get_state(flag)) for flag in self.flags], expected_states)
+            self.assertEqual([flag.is_enabled for flag in self.flags], expected_states)
+
+        # A reset is also shared:
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flags[0].reset()
+        self.assertEqual(cache.get(VERSION_CACHE_KEY), version + 2)
+        self.now = 93
+        with self.assertNumQueries(1):
+            self.assertIs(registry3.get_state(self.flags[0]), State.DISABLED)  # initial state
+
+        # The version key was removed from the cache:
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertIs(registry2.get_state(self.flags[0]), State.DISABLED)
+        self.assertIsInstance(cache.get(VERSION_CACHE_KEY), int)
@@ -0,0 +1,118 @@
+import datetime
+from unittest import mock
+
+from django.template.defaulttags import CsrfTokenNode
+from django.test import TestCase
+
+from bx_django_utils.feature_flags.data_classes import FeatureFlag, PercentageFeatureFlag
+from bx_django_utils.feature_flags.metrics import FlagMetrics, InMemoryMetricsSink, MetricsSink
+from bx_django_utils.feature_flags.registry import pin_states
+from bx_django_utils.feature_flags.test_utils import FeatureFlagTestCaseMixin
+from bx_django_utils.test_utils.users import make_test_user
+
+
+class FeatureFlagMetricsTestCase(FeatureFlagTestCaseMixin, TestCase):
+    """"""  # noqa - Don't add to README
+
+    warum_up_feature_flag_cache = False
+
+    def setUp(self):
+        super().setUp()
+        FeatureFlag.registry.clear()
+        self.sink = InMemoryMetricsSink()
+        FeatureFlag.metrics_sink = self.sink
+        self.addCleanup(setattr, FeatureFlag, 'metrics_sink', None)
+
+        self.uncached = FeatureFlag(cache_key='uncached', human_name='Uncached', initial_enabled=True)
+        self.cached = FeatureFlag(
+            cache_key='cached',
+            human_name='Cached',
+            initial_enabled=False,
+            cache_duration=datetime.timedelta(seconds=60),
+        )
+
+    def test_metrics(self):
+        self.assertIsNone(self.sink.get_metrics(self.uncached))
+
+        for _ in range(3):
+            self.assertIs(self.uncached.is_enabled, True)
+        for _ in range(5):
+            self.assertIs(self.cached.is_enabled, False)
+
+        metrics = self.sink.get_metrics(self.uncached)
+        self.assertEqual((metrics.evaluations, metrics.db_loads), (3, 3))
+        self.assertGreater(metrics.load_time_max, 0)
+        self.assertGreaterEqual(metrics.load_time_total, metrics.load_time_max)
+        self.assertAlmostEqual(metrics.load_time_mean, metrics.load_time_total / 3)
+        self.assertEqual(self.sink.get_metrics(self.uncached).cache_hits, 0)
+
+        cached_metrics = self.sink.get_metrics(self.cached)
+        self.assertEqual(cached_metrics.evaluations, 5)
+        self.assertEqual(cached_metrics.db_loads, 1)
+        self.assertEqual(cached_metrics.cache_hits, 4)
+
+        # Loading the pinned states is recorded for the flag that triggered it:
+        with pin_states():
+            self.assertIs(self.uncached.is_enabled, True)
+            self.assertIs(self.uncached.is_enabled, True)
+            self.assertIs(self.cached.is_enabled, False)
+        self.assertEqual(self.sink.get_metrics(self.uncached).evaluations, 5)
+        self.assertEqual(self.sink.get_metrics(self.uncached).db_loads, 4)
+        self.assertEqual(self.sink.get_metrics(self.cached).db_loads, 1)
+
+        self.sink.reset()
+        self.assertEqual(self.sink.metrics, {})
+        self.assertEqual(FlagMetrics().load_time_mean, 0.0)
+
+    def test_snapshot(self):
+        FeatureFlag.registry.enable_snapshot(duration=datetime.timedelta(seconds=0))
+        time_func = mock.Mock(return_value=100.0)
+        FeatureFlag.registry.snapshot_time_func = time_func
+        with self.assertNumQueries(5):
+            for _ in range(5):
+                time_func.return_value += 1  # Expire the snapshot
+                self.assertIs(self.uncached.is_enabled, True)
+        metrics = self.sink.get_metrics(self.uncached)
+        self.assertEqual((metrics.evaluations, metrics.db_loads, metrics.cache_hits), (5, 5, 0))
+        self.assertGreater(metrics.load_time_max, 0)
+
+        with self.assertNumQueries(0):
+            self.assertIs(self.uncached.is_enabled, True)
+            self.assertIs(self.cached.is_enabled, False)
+        self.assertEqual(self.sink.get_metrics(self.uncached).cache_hits, 1)
+        self.assertEqual(self.sink.get_metrics(self.cached).cache_hits, 1)
+
+    def test_pinned_percentage(self):
+        flag = PercentageFeatureFlag(
+            cache_key='rollout', human_name='Rollout', initial_enabled=True, initial_percentage=20
+        )
+
+        # Loading the pinned states is recorded, if the percentage is read first:
+        with self.assertNumQueries(1), pin_states():
+            self.assertEqual(flag.percentage, 20)
+            self.assertIs(self.uncached.is_enabled, True)
+        self.assertEqual(self.sink.get_metrics(flag).db_loads, 1)
+        self.assertEqual(self.sink.get_metrics(self.uncached).db_loads, 0)
+
+        # The snapshot load, too:
+        FeatureFlag.registry.enable_snapshot(duration=datetime.timedelta(seconds=30))
+        with self.assertNumQueries(1), pin_states():
+            self.assertEqual(flag.percentage, 20)
+        with self.assertNumQueries(0), pin_states():
+            self.assertEqual(flag.percentage, 20)
+        self.assertEqual(self.sink.get_metrics(flag).db_loads, 2)
+
+    def test_base_sink(self):
+        FeatureFlag.metrics_sink = MetricsSink()
+        self.assertIs(self.uncached.is_enabled, True)
+        self.assertIsNone(FeatureFlag.metrics_sink.get_metrics(self.uncached))
+
+    def test_admin_view(self):
+        self.assertIs(self.uncached.is_enabled, True)
+
+        self.client.force_login(make_test_user(username='test-superuser', is_superuser=True))
+        with mock.patch.object(CsrfTokenNode, 'render', return_value='MockedCsrfTokenNode'):
+            response = self.client.get('/admin/feature_flags/manage/')
+        self.assertContains(response, 'Evaluations: 3')  # The view itself evaluates the flag two times
+        metrics = [feature_flag['metrics'] for feature_flag in response.context['feature_flags']]
+        self.assertEqual([(m.evaluations, m.cache_hits, m.db_loads) for m in metrics], [(3, 0, 3), (2, 1, 1)])
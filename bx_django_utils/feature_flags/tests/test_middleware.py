@@ -0,0 +1,112 @@
+import datetime
+
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from bx_django_utils.feature_flags.data_classes import FeatureFlag
+from bx_django_utils.feature_flags.middleware import FeatureFlagMiddleware
+from bx_django_utils.feature_flags.models import FeatureFlagModel
+from bx_django_utils.feature_flags.registry import get_pinned_states, pin_states
+from bx_django_utils.feature_flags.state import State
+from bx_django_utils.feature_flags.test_utils import FeatureFlagTestCaseMixin
+from bx_django_utils.models.manipulate import create_or_update2
+
+
+class FeatureFlagMiddlewareTestCase(FeatureFlagTestCaseMixin, TestCase):
+    """"""  # noqa - Don't add to README
+
+    warum_up_feature_flag_cache = False
+
+    def setUp(self):
+        super().setUp()
+        FeatureFlag.registry.clear()
+        self.flags = [
+            FeatureFlag(cache_key=f'pinned-{no}', human_name=f'Pinned {no}', initial_enabled=bool(no % 2))
+            for no in range(12)
+        ]
+        FeatureFlagModel.objects.create(cache_key='feature-flags-pinned-0', state=State.ENABLED)
+
+    def toggle_in_other_process(self, flag):
+        create_or_update2(ModelClass=FeatureFlagModel, lookup={'cache_key': flag.cache_key}, state=flag.opposite_state)
+
+    def test_pin_states(self):
+        self.assertIsNone(get_pinned_states())
+        expected_states = [True] + [bool(no % 2) for no in range(1, 12)]
+        with self.assertNumQueries(1), pin_states():
+            for _ in range(3):
+                self.assertEqual([flag.is_enabled for flag in self.flags], expected_states)
+        self.assertIsNone(get_pinned_states())
+
+        with pin_states():
+            self.assertIs(self.flags[0].is_enabled, True)
+
+            # A change by another process is not visible:
+            self.toggle_in_other_process(self.flags[0])
+            self.assertIs(self.flags[0].is_enabled, True)
+
+            # But changes in the current context are applied:
+            self.flags[1].disable()
+            self.assertIs(self.flags[1].is_enabled, False)
+            self.flags[0].reset()
+            self.assertIs(self.flags[0].is_enabled, False)  # initial state
+
+        self.assertIs(self.flags[1].is_enabled, False)
+
+    def test_consistent_states(self):
+        cached_flag = FeatureFlag(
+            cache_key='pinned-cached',
+            human_name='Pinned cached',
+            initial_enabled=False,
+            cache_duration=datetime.timedelta(hours=1),
+        )
+        self.assertIs(cached_flag.is_enabled, False)
+        self.toggle_in_other_process(cached_flag)
+        self.assertIs(cached_flag.is_enabled, False)  # The in-process cache is outdated
+
+        # All pinned states are loaded at the same time, so they are consistent:
+        with self.assertNumQueries(1), pin_states():
+            self.assertIs(cached_flag.is_enabled, True)
+            self.assertIs(self.flags[0].is_enabled, True)
+
+    def test_snapshot(self):
+        FeatureFlag.registry.enable_snapshot(duration=datetime.timedelta(seconds=60))
+        with self.assertNumQueries(1):
+            self.assertIs(self.flags[0].is_enabled, True)  # Load the registry snapshot
+        with self.assertNumQueries(0), pin_states():
+            self.assertIs(self.flags[0].is_enabled, True)
+            self.assertIs(self.flags[1].is_enabled, True)
+
+    def test_sync_middleware(self):
+        def get_response(request):
+            with self.assertNumQueries(0):
+                states = [flag.is_enabled for flag in self.flags]
+            self.toggle_in_other_process(self.flags[0])
+            with self.assertNumQueries(0):
+                self.assertEqual([flag.is_enabled for flag in self.flags], states)
+                self.assertIs(bool(self.flags[0]), True)
+            return HttpResponse('OK')
+
+        middleware = FeatureFlagMiddleware(get_response)
+        with self.assertNumQueries(3):  # Load all states + toggle in the view (SELECT, UPDATE)
+            response = middleware(RequestFactory().get('/'))
+        self.assertEqual(response.content, b'OK')
+        self.assertIsNone(get_pinned_states())
+        self.assertIs(self.flags[0].is_enabled, False)
+
+    def test_async_middleware(self):
+        async def get_response(request):
+            # A sync database query would raise SynchronousOnlyOperation here:
+            states = [flag.is_enabled for flag in self.flags]
+            self.assertEqual([await flag.ais_enabled() for flag in self.flags], states)
+            self.assertIs(bool(self.flags[0]), True)
+            await FeatureFlagModel.objects.filter(cache_key='feature-flags-pinned-0').aupdate(state=State.DISABLED)
+            self.assertEqual([await flag.ais_enabled() for flag in self.flags], states)
+            return HttpResponse('OK')
+
+        middleware = FeatureFlagMiddleware(get_response)
+        # The async ORM runs in this thread, so all queries of the request are captured:
+        with self.assertNumQueries(2):  # Load all states + UPDATE in the view
+            response = async_to_sync(middleware)(RequestFactory().get('/'))
+        self.assertEqual(response.content, b'OK')
+        self.assertIsNone(get_pinned_states())
@@ -0,0 +1,181 @@
+import datetime
+import time
+from unittest import mock, skipIf, skipUnless
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from bx_django_utils.feature_flags import notify
+from bx_django_utils.feature_flags.data_classes import FeatureFlag
+from bx_django_utils.feature_flags.models import FeatureFlagModel
+from bx_django_utils.feature_flags.state import State
+from bx_django_utils.feature_flags.test_utils import FeatureFlagTestCaseMixin
+
+
+def wait_for(condition, timeout=5.0):
+    end_time = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end_time:
+            raise AssertionError('Timeout')
+        time.sleep(0.01)
+
+
+class FeatureFlagApplyChangesTestCase(FeatureFlagTestCaseMixin, TestCase):
+    """"""  # noqa - Don't add to README
+
+    warum_up_feature_flag_cache = False
+
+    def setUp(self):
+        super().setUp()
+        FeatureFlag.registry.clear()
+        self.cached_flag = FeatureFlag(
+            cache_key='cached',
+            human_name='Cached',
+            initial_enabled=True,
+            cache_duration=datetime.timedelta(hours=1),
+        )
+        self.other_flag = FeatureFlag(cache_key='other', human_name='Other', initial_enabled=False)
+
+    def test_parse_payload(self):
+        self.assertEqual(
+            notify.parse_payload('{"feature-flags-cached": 0, "feature-flags-other": null}'),
+            {'feature-flags-cached': State.DISABLED, 'feature-flags-other': None},
+        )
+        self.assertIsNone(notify.parse_payload(notify.RELOAD_ALL))
+
+    def test_invalid_payloads(self):
+        listener = notify.FeatureFlagListener(registry=FeatureFlag.registry, channel='test_feature_flags')
+        with self.assertLogs('bx_django_utils.feature_flags.notify', level='WARNING') as logs:
+            for payload in ('not json', '[1]', '"foo"', '{"feature-flags-cached": 5}', '{"feature-flags-cached": []}'):
+                listener.handle_payload(payload)
+        self.assertEqual(len(logs.output), 5)
+        self.assertEqual(
+            logs.output[0],
+            "WARNING:bx_django_utils.feature_flags.notify:Ignore invalid feature flag notification: 'not json'",
+        )
+
+        listener.handle_payload('{"feature-flags-cached": 0}')
+        with self.assertNumQueries(0):
+            self.assertIs(self.cached_flag.is_enabled, False)
+
+    def test_apply_changes(self):
+        registry = FeatureFlag.registry
+        registry.enable_snapshot(duration=datetime.timedelta(hours=1))
+        self.assertIs(self.other_flag.is_enabled, False)
+        self.assertIs(self.cached_flag.is_enabled, True)
+
+        with self.assertNumQueries(0):
+            registry.apply_changes({'feature-flags-cached': State.DISABLED, 'feature-flags-other': State.ENABLED})
+            self.assertIs(self.cached_flag.is_enabled, False)
+            self.assertIs(self.other_flag.is_enabled, True)
+
+            # Reset -> initial state:
+            registry.apply_changes({'feature-flags-cached': None, 'feature-flags-other': None})
+            self.assertIs(self.cached_flag.is_enabled, True)
+            self.assertIs(self.other_flag.is_enabled, False)
+
+            registry.apply_changes({'feature-flags-unknown': State.ENABLED})
+
+        # Reload all:
+        FeatureFlagModel.objects.create(cache_key='feature-flags-other', state=State.ENABLED)
+        registry.apply_changes(None)
+        with self.assertNumQueries(1):
+            self.assertIs(self.other_flag.is_enabled, True)
+            self.assertIs(self.cached_flag.is_enabled, True)
+
+    @skipIf(connection.vendor == 'postgresql', 'Test for other database backends')
+    def test_other_backends(self):
+        with self.assertLogs('bx_django_utils.feature_flags.notify', level='INFO') as logs:
+            FeatureFlag.registry.enable_notifications()
+        self.assertEqual(
+            logs.output,
+            [
+                (
+                    'INFO:bx_django_utils.feature_flags.notify:'
+                    'Feature flag notifications are only supported with PostgreSQL: Use polling'
+                )
+            ],
+        )
+        self.assertIsNone(FeatureFlag.registry._listener)
+        with self.assertNumQueries(2):  # Only SELECT + INSERT of create_or_update2()
+            self.other_flag.enable()
+        FeatureFlag.registry.disable_notifications()
+        self.assertIsNone(FeatureFlag.registry.notify_channel)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'LISTEN/NOTIFY needs PostgreSQL')
+class FeatureFlagNotifyTestCase(FeatureFlagTestCaseMixin, TransactionTestCase):
+    """"""  # noqa - Don't add to README
+
+    warum_up_feature_flag_cache = False
+
+    def setUp(self):
+        super().setUp()
+        FeatureFlag.registry.clear()
+        self.flag = FeatureFlag(
+            cache_key='notified',
+            human_name='Notified',
+            initial_enabled=False,
+            cache_duration=datetime.timedelta(hours=1),
+        )
+        FeatureFlag.registry.enable_notifications(channel='test_feature_flags')
+        self.addCleanup(FeatureFlag.registry.disable_notifications)
+        self.assertTrue(FeatureFlag.registry._listener.listening.wait(timeout=5))
+
+    def test_notify(self):
+        self.assertIs(self.flag.is_enabled, False)
+
+        # Another process changes the state:
+        with transaction.atomic():
+            FeatureFlagModel.objects.create(cache_key='feature-flags-notified', state=State.ENABLED)
+            notify.send_notification(channel='test_feature_flags', changes={'feature-flags-notified': State.ENABLED})
+            time.sleep(0.1)
+            self.assertIs(self.flag.is_enabled, False)  # Not committed, yet
+
+        wait_for(lambda: self.flag._cache_value == State.ENABLED)
+        with self.assertNumQueries(0):
+            self.assertIs(self.flag.is_enabled, True)
+
+        # Changes in this process are sent, too:
+        self.flag._cache_value = State.ENABLED
+        with mock.patch.object(FeatureFlag, '_set_cache_value', autospec=True) as set_cache_value:
+            self.flag.reset()
+            wait_for(lambda: set_cache_value.called)
+        set_cache_value.assert_called_once_with(self.flag, State.DISABLED)  # initial state
+
+    def test_invalid_payload(self):
+        self.assertIs(self.flag.is_enabled, False)
+        with self.assertLogs('bx_django_utils.feature_flags.notify', level='WARNING') as logs:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify('test_feature_flags', 'foreign payload')")
+            notify.send_notification(channel='test_feature_flags', changes={'feature-flags-notified': State.ENABLED})
+            wait_for(lambda: self.flag._cache_value == State.ENABLED)
+        self.assertEqual(
+            logs.output,
+            [
+                (
+                    'WARNING:bx_django_utils.feature_flags.notify:'
+                    "Ignore invalid feature flag notification: 'foreign payload'"
+                )
+            ],
+        )
+        self.assertTrue(FeatureFlag.registry._listener.listening.is_set())  # Still the first connection
+
+    def test_reload_all(self):
+        self.assertIs(self.flag.is_enabled, False)
+        FeatureFlagModel.objects.create(cache_key='feature-flags-notified', state=State.ENABLED)
+        with mock.patch.object(notify, 'MAX_PAYLOAD_SIZE', 10):
+            notify.send_notification(channel='test_feature_flags', changes={'feature-flags-notified': State.ENABLED})
+        wait_for(lambda: self.flag._cache_from == float('-inf'))
+        self.assertIs(self.flag.is_enabled, True)
+
+
+class FeatureFlagNotifyOldPsycopgTestCase(FeatureFlagNotifyTestCase):
+    """"""  # noqa - Don't add to README
+
+    def setUp(self):
+        # psycopg < 3.2: Connection.notifies() has no timeout
+        patcher = mock.patch.object(notify, '_has_notifies_timeout', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
@@ -0,0 +1,246 @@
+import copy
+import datetime
+from unittest import mock
+
+from django.contrib.admin.models import LogEntry
+from django.core.cache import cache
+from django.template.defaulttags import CsrfTokenNode
+from django.test import TestCase
+
+from bx_django_utils.feature_flags import notify
+from bx_django_utils.feature_flags.data_classes import FeatureFlag, PercentageFeatureFlag, get_rollout_bucket
+from bx_django_utils.feature_flags.models import FeatureFlagModel
+from bx_django_utils.feature_flags.registry import VERSION_CACHE_KEY, pin_states
+from bx_django_utils.feature_flags.state import State
+from bx_django_utils.feature_flags.test_utils import FeatureFlagTestCaseMixin
+from bx_django_utils.test_utils.html_assertion import HtmlAssertionMixin
+from bx_django_utils.test_utils.users import make_test_user
+
+
+class PercentageFeatureFlagTestCase(FeatureFlagTestCaseMixin, HtmlAssertionMixin, TestCase):
+    """"""  # noqa - Don't add to README
+
+    warum_up_feature_flag_cache = False
+
+    def setUp(self):
+        super().setUp()
+        FeatureFlag.registry.clear()
+        self.flag = PercentageFeatureFlag(
+            cache_key='rollout',
+            human_name='Rollout',
+            initial_enabled=True,
+            initial_percentage=25,
+        )
+
+    def test_rollout_bucket(self):
+        self.assertEqual(get_rollout_bucket(key=123, seed=0), get_rollout_bucket(key='123', seed=0))
+        self.assertEqual(get_rollout_bucket(key=123, seed=0), get_rollout_bucket(key=b'123', seed=0))
+        self.assertEqual(get_rollout_bucket(key=123, seed=0), 22)  # Stable between processes
+        self.assertNotEqual(get_rollout_bucket(key=123, seed=1), 22)
+
+        buckets = [get_rollout_bucket(key=user_id, seed=self.flag.seed) for user_id in range(10_000)]
+        self.assertEqual(min(buckets), 0)
+        self.assertEqual(max(buckets), 99)
+        self.assertAlmostEqual(sum(bucket < 25 for bucket in buckets), 2500, delta=150)
+
+    def test_is_enabled_for(self):
+        self.assertEqual(
+            repr(self.flag),
+            (
+                "PercentageFeatureFlag(cache_key='rollout', human_name='Rollout',"
+                " initial_enabled=True, initial_percentage=25)"
+            ),
+        )
+
+        with self.assertNumQueries(1), pin_states():
+            # The states and the percentages are pinned with one query
+            enabled = {user_id for user_id in range(1000) if self.flag.is_enabled_for(user_id)}
+        self.assertAlmostEqual(len(enabled), 250, delta=50)
+
+        # Same keys are enabled, if the percentage is increased:
+        self.flag.set_percentage(50)
+        self.assertEqual(
+            dict(FeatureFlagModel.objects.values_list('cache_key', 'percentage')),
+            {'feature-flags-rollout': 50},
+        )
+        more_enabled = {user_id for user_id in range(1000) if self.flag.is_enabled_for(user_id)}
+        self.assertAlmostEqual(len(more_enabled), 500, delta=50)
+        self.assertLess(enabled, more_enabled)
+
+        self.flag.set_percentage(100)
+        self.assertTrue(all(self.flag.is_enabled_for(user_id) for user_id in range(100)))
+
+        # The state is a "kill switch" for all keys:
+        self.flag.disable()
+        self.assertFalse(any(self.flag.is_enabled_for(user_id) for user_id in range(100)))
+        self.assertEqual(self.flag.percentage, 100)
+
+        self.flag.reset()
+        self.assertIs(self.flag.is_enabled, True)
+        self.assertEqual(self.flag.percentage, 25)
+
+    def test_percentage_cache(self):
+        time_func = mock.Mock(return_value=100.0)
+        self.flag._percentage_time_func = time_func
+
+        FeatureFlagModel.objects.create(cache_key='feature-flags-rollout', state=State.ENABLED, percentage=10)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.flag.percentage, 10)
+            self.assertEqual(self.flag.percentage, 10)
+
+        # Changed by another process:
+        FeatureFlagModel.objects.update(percentage=20)
+        time_func.return_value = 130.0
+        with self.assertNumQueries(0):
+            self.assertEqual(self.flag.percentage, 10)
+
+        time_func.return_value = 130.1
+        with self.assertNumQueries(1):
+            self.assertEqual(self.flag.percentage, 20)
+
+    def test_pinned_percentage(self):
+        flag = PercentageFeatureFlag(
+            cache_key='uncached',
+            human_name='Uncached',
+            initial_enabled=True,
+            initial_percentage=10,
+            percentage_cache_duration=datetime.timedelta(seconds=0),
+        )
+        FeatureFlagModel.objects.create(cache_key='feature-flags-uncached', state=State.ENABLED, percentage=20)
+        with pin_states():
+            with self.assertNumQueries(0):
+                enabled = [flag.is_enabled_for(123), flag.is_enabled_for(456), flag.is_enabled_for(789)]
+                self.assertEqual(flag.percentage, 20)
+            self.assertEqual(enabled, [False, True, False])
+
+            # A change by another process is not visible, but changes in the current context are applied:
+            FeatureFlagModel.objects.update(percentage=30)
+            self.assertEqual(flag.percentage, 20)
+        with pin_states():
+            flag.set_percentage(40)
+            self.assertEqual(flag.percentage, 40)
+            flag.reset()
+            self.assertEqual(flag.percentage, 10)
+
+    def test_snapshot(self):
+        FeatureFlag.registry.enable_snapshot(duration=datetime.timedelta(seconds=30), cache_alias='default')
+        FeatureFlagModel.objects.create(cache_key='feature-flags-rollout', state=State.ENABLED, percentage=10)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.flag.percentage, 10)
+            self.assertIs(self.flag.is_enabled, True)
+
+        version = cache.get(VERSION_CACHE_KEY)
+        self.assertEqual(cache.get(f'feature-flags-rollout-percentage-v{version}'), 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flag.set_percentage(20)
+        self.assertEqual(cache.get(VERSION_CACHE_KEY), version + 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.flag.percentage, 20)
+
+        # Another process fetches the percentage from the cache:
+        FeatureFlag.registry.invalidate_snapshot()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.flag.percentage, 20)
+        FeatureFlag.registry.invalidate_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.flag.percentage, 20)
+
+        self.flag.reset()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.flag.percentage, 25)
+
+    def test_set_percentage(self):
+        # A missing entry is created with the initial state:
+        self.flag.set_percentage(10)
+        instance = FeatureFlagModel.objects.get()
+        self.assertEqual((instance.state, instance.percentage), (State.ENABLED, 10))
+        self.assertIsNotNone(instance.create_dt)
+
+        self.flag.disable()
+        self.flag.set_percentage(0)
+        self.assertEqual(
+            list(FeatureFlagModel.objects.values_list('cache_key', 'state', 'percentage')),
+            [('feature-flags-rollout', State.DISABLED, 0)],
+        )
+        with self.assertRaisesMessage(Exception, 'Ensure this value is less than or equal to 100.'):
+            self.flag.set_percentage(101)
+
+        # One upsert, that updates only the percentage, so concurrent state changes are not overwritten:
+        with self.assertNumQueries(1) as queries:
+            self.flag.set_percentage(50)
+        self.assertIn(
+            'DO UPDATE SET "percentage" = EXCLUDED."percentage", "update_dt" = EXCLUDED."update_dt"',
+            queries.captured_queries[0]['sql'],
+        )
+        self.assertEqual(
+            list(FeatureFlagModel.objects.values_list('cache_key', 'state', 'percentage')),
+            [('feature-flags-rollout', State.DISABLED, 50)],
+        )
+
+        with mock.patch.object(notify, 'send_notification') as send_notification_mock:
+            FeatureFlag.registry.notify_channel = 'test'
+            try:
+                self.flag.set_percentage(60)
+            finally:
+                FeatureFlag.registry.notify_channel = None
+        send_notification_mock.assert_called_once_with(channel='test', changes=None)
+
+    def test_admin_view(self):
+        superuser = make_test_user(username='test-superuser', is_superuser=True)
+        self.client.force_login(superuser)
+
+        with mock.patch.object(CsrfTokenNode, 'render', return_value='MockedCsrfTokenNode'):
+            response = self.client.get('/admin/feature_flags/manage/')
+        self.assert_html_parts(
+            response,
+            parts=(
+                '<p>Rollout percentage: <strong>25%</strong></p>',
+                '<input type="number" name="percentage" min="0" max="100" value="25" required>',
+            ),
+        )
+
+        response = self.client.post(
+            '/admin/feature_flags/manage/',
+            data={'cache_key': 'feature-flags-rollout', 'percentage': '60'},
+        )
+        self.assertRedirects(response, expected_url='/admin/feature_flags/manage/', fetch_redirect_response=False)
+        self.assert_messages(
+            response,
+            expected_messages=[
+                'Set "Rollout" rollout percentage to 60% (will take up to 30 seconds to take full effect)'
+            ],
+        )
+        self.assertEqual(self.flag.percentage, 60)
+        log_entry = LogEntry.objects.get()
+        self.assertEqual(log_entry.object_id, 'feature-flags-rollout')
+        self.assertEqual(log_entry.change_message, 'Changed feature flag "Rollout"')
+
+        response = self.client.post(
+            '/admin/feature_flags/manage/',
+            data={'cache_key': 'feature-flags-rollout', 'percentage': '101'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_html_parts(response, parts=('<li>Ensure this value is less than or equal to 100.</li>',))
+
+    def test_percentage_on_normal_flag(self):
+        FeatureFlag(cache_key='normal', human_name='Normal', initial_enabled=True)
+        self.client.force_login(make_test_user(username='test-superuser', is_superuser=True))
+        response = self.client.post(
+            '/admin/feature_flags/manage/',
+            data={'cache_key': 'feature-flags-normal', 'percentage': '10'},
+        )
+        self.assert_messages(response, expected_messages=['"Normal" has no rollout percentage'])
+        self.assertEqual(LogEntry.objects.count(), 0)
+
+        response = self.client.post('/admin/feature_flags/manage/', data={'cache_key': 'feature-flags-normal'})
+        self.assertEqual(response.status_code, 200)
+        self.assert_html_parts(response, parts=('<li>Either a new state or a percentage is required.</li>',))
+
+    def test_deepcopy(self):
+        registry = FeatureFlag.registry
+        FeatureFlag.registry = copy.deepcopy(registry)
+        flag = FeatureFlag.get_by_cache_key('feature-flags-rollout')
+        self.assertIsInstance(flag, PercentageFeatureFlag)
+        self.assertIsNot(flag, self.flag)
+        self.assertEqual(flag.seed, self.flag.seed)
+        self.assertEqual(flag.percentage, 25)
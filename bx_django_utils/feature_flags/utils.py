@@ -2,6 +2,8 @@ from collections.abc import Callable
 import functools
 from typing import TYPE_CHECKING, Any
 
+from asgiref.sync import iscoroutinefunction
+
 from bx_django_utils.feature_flags.exceptions import FeatureFlagDisabled
 
 
@@ -16,6 +18,7 @@ def if_feature(
 ):
     """
     A decorator that only executes the decorated function if the given feature flag is enabled.
+    Coroutine functions are supported: Then the flag is checked via FeatureFlag.ais_enabled()
 
     :param feature_flag: The feature flag to consider.
     :param retval_factory: A factory that returns the value to be returned when the feature flag is disabled.
@@ -25,6 +28,20 @@ def if_feature(
         raise ValueError('raise_exception=True and retval_factory are mutually exclusive')
 
     def decorator(func):
+        if iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not await feature_flag.ais_enabled():
+                    if raise_exception:
+                        raise FeatureFlagDisabled(feature_flag)
+                    if retval_factory is not None:
+                        return retval_factory()
+                    return
+                return await func(*args, **kwargs)
+
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             if not feature_flag.is_enabled:
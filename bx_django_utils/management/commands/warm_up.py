@@ -0,0 +1,45 @@
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bx_django_utils.warmup import warm_up
+
+
+class Command(BaseCommand):
+    """
+    Manage command "warm_up": Run warm_up() and print the duration of every step.
+
+    Note: The command runs in its own process. So it only warms-up shared caches (e.g.: Django's cache
+    or the database) and never the in-memory caches of the running server processes!
+    Those must call warm_up() themselves, e.g.: in wsgi.py or AppConfig.ready() (see register_warm_up()).
+    Use the command to check the steps and their durations, e.g.: in a deployment.
+    """
+
+    help = (
+        'Run all warm-up steps (feature flags, content types, version, registered callbacks) and print their durations.'
+        ' Note: Only shared caches are warmed-up, not the in-memory caches of running server processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'modules',
+            nargs='*',
+            help='Modules to import, that register warm-up callbacks (if they are not imported at startup)',
+        )
+        parser.add_argument('-r', '--raise-error', action='store_true', help='Stop on the first failing step')
+
+    def handle(self, *args, modules, raise_error, **options):
+        for module in modules:
+            import_module(module)
+
+        steps = warm_up(raise_errors=raise_error)
+        for step in steps:
+            line = f' * {step.name}: {step.duration * 1000:.1f} ms'
+            if step.error:
+                line += f' (failed: {step.error!r})'
+            self.stdout.write(line)
+
+        total = sum(step.duration for step in steps)
+        self.stdout.write(f'{len(steps)} warm-up steps in {total * 1000:.1f} ms')
+        if failed := [step.name for step in steps if step.error]:
+            raise CommandError(f'Warm-up steps failed: {", ".join(failed)}')
@@ -3,21 +3,32 @@
     e.g.:
         create/update/delete model entries etc.
 """
-from collections.abc import Callable
+from collections.abc import Callable, Iterable, Iterator, Sequence
 import dataclasses
+import functools
+from itertools import islice
+import operator
+import time
 from typing import Any
 from uuid import UUID
 import warnings
 
+from asgiref.sync import sync_to_async
 from django.core.exceptions import FieldDoesNotExist, ValidationError
-from django.db import models
+from django.db import DataError, IntegrityError, NotSupportedError, connections, models, router, transaction
 from django.db.models.options import Options
+from django.utils import timezone
+
+from bx_django_utils.models.timetracking import TimetrackingBaseModel
 
 
 STORE_BEHAVIOR_IGNORE = "i"  # Ignore the value completely
 STORE_BEHAVIOR_SET_IF_EMPTY = "e"  # Use the value only if we currently have no one.
 STORE_BEHAVIOR_SKIP_EMPTY = "s"  # Don't store empty values (and maybe overwrite existing one)
 
+MODE_SELECT = 'select'  # SELECT the existing instance and INSERT or UPDATE it via save()
+MODE_UPSERT = 'upsert'  # One "INSERT ... ON CONFLICT ... DO UPDATE" statement (PostgreSQL only)
+
 
 class InvalidStoreBehavior(FieldDoesNotExist):
     """
@@ -30,15 +41,59 @@ def full_clean(
     instance: models.Model,
     lookup: None | dict,
     validate_unique=False,
+    exclude: Iterable[str] | None = None,
 ) -> None:
     try:
-        instance.full_clean(validate_unique=validate_unique)
+        instance.full_clean(exclude=exclude, validate_unique=validate_unique)
     except ValidationError as err:
         opts: Options = instance._meta
         err.add_note(f'model={opts.app_label}.{opts.object_name} {lookup=}')
         raise
 
 
+def clean_fields(
+    *,
+    instance: models.Model,
+    lookup: dict | None,
+    field_names: Iterable[str],
+    validate_unique=False,
+) -> None:
+    """
+    Incremental variant of full_clean(): Validate only the given fields (names or attnames).
+    The model clean() and the validation of all other fields (e.g.: ForeignKey existence queries) are skipped.
+    """
+    opts: Options = instance._meta
+    field_names = set(field_names)
+    exclude = {
+        field.name
+        for field in opts.concrete_fields
+        if field.name not in field_names and field.attname not in field_names
+    }
+
+    errors = {}
+    try:
+        instance.clean_fields(exclude=exclude)
+    except ValidationError as err:
+        errors = err.update_error_dict(errors)
+
+    # Don't run unique checks and constraints on fields that already have an error:
+    exclude.update(errors)
+    if validate_unique:
+        try:
+            instance.validate_unique(exclude=exclude)
+        except ValidationError as err:
+            errors = err.update_error_dict(errors)
+    try:
+        instance.validate_constraints(exclude=exclude)
+    except ValidationError as err:
+        errors = err.update_error_dict(errors)
+
+    if errors:
+        err = ValidationError(errors)
+        err.add_note(f'model={opts.app_label}.{opts.object_name} {lookup=}')
+        raise err
+
+
 def create(*, ModelClass: type[models.Model], call_full_clean=True, save_kwargs=None, validate_unique=False, **values):
     """
     Create a new model instance with optional validate before create.
@@ -53,7 +108,24 @@ def create(*, ModelClass: type[models.Model], call_full_clean=True, save_kwargs=
     return instance
 
 
-@dataclasses.dataclass
+async def acreate(
+    *, ModelClass: type[models.Model], call_full_clean=True, save_kwargs=None, validate_unique=False, **values
+):
+    """
+    Async variant of create()
+    """
+    instance = ModelClass(**values)
+    if call_full_clean:
+        # Don't create non-valid instances
+        # Note: full_clean() may query the database (e.g.: ForeignKey or unique checks)
+        await sync_to_async(full_clean)(instance=instance, lookup=None, validate_unique=validate_unique)
+    if save_kwargs is None:
+        save_kwargs = {}
+    await instance.asave(force_insert=True, **save_kwargs)
+    return instance
+
+
+@dataclasses.dataclass(slots=True)
 class FieldUpdate:
     """
     Information about updated model field values. Used for CreateOrUpdateResult.update_info
@@ -64,34 +136,80 @@ class FieldUpdate:
     new_value: Any
 
 
-@dataclasses.dataclass
+class _LazyList:
+    """
+    Wraps a slot of CreateOrUpdateResult: The list will be created on first access.
+    So no lists are allocated for results that are never read.
+    """
+
+    def __init__(self, member):
+        self.member = member  # The slot descriptor
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self.member.__get__(instance, owner)
+        if value is None:
+            value = []
+            self.member.__set__(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        self.member.__set__(instance, value)
+
+    def is_empty(self, instance) -> bool:
+        return not self.member.__get__(instance)
+
+
+@dataclasses.dataclass(slots=True)
 class CreateOrUpdateResult:
     """
     Result object returned by create_or_update2() with all information about create/save a model.
     Contains:
         Model instance, that is created or updated.
         List of model field names that are: Updated / ignored / not overwritten
+    The lists are allocated on first access.
     """
     # Model instance object that was created or updated:
-    instance: models.Model = None
+    instance: models.Model | None = None
 
     # If True: new instance was created else: existing was updated:
     created: bool = False
 
     # Fields that are updated (Empty list if model was created!):
-    updated_fields: list = dataclasses.field(default_factory=list)
+    updated_fields: list[str] | None = None
 
     # Old and new values if a existing instance was updates (Empty if new instance created):
-    update_info: list[FieldUpdate] = dataclasses.field(default_factory=list)
+    update_info: list[FieldUpdate] | None = None
 
     # Field names that ignored by "STORE_BEHAVIOR_IGNORE":
-    ignored_fields: list = dataclasses.field(default_factory=list)
+    ignored_fields: list[str] | None = None
 
     # Field names that are not overwritten (STORE_BEHAVIOR_SET_IF_EMPTY):
-    not_overwritten_fields: list = dataclasses.field(default_factory=list)
+    not_overwritten_fields: list[str] | None = None
 
     # Field names that are not filles with empty value (STORE_BEHAVIOR_SKIP_EMPTY):
-    skip_empty_values: list = dataclasses.field(default_factory=list)
+    skip_empty_values: list[str] | None = None
+
+    # If False: FieldUpdate instances are not collected in "update_info":
+    collect_update_info: bool = dataclasses.field(default=True, repr=False, compare=False)
+
+    def has_updates(self) -> bool:
+        """
+        Are there updated fields? Same as bool(result.updated_fields), but doesn't allocate the list.
+        """
+        return not CreateOrUpdateResult.updated_fields.is_empty(self)
+
+
+for _field_name in (
+    'updated_fields',
+    'update_info',
+    'ignored_fields',
+    'not_overwritten_fields',
+    'skip_empty_values',
+):
+    setattr(CreateOrUpdateResult, _field_name, _LazyList(CreateOrUpdateResult.__dict__[_field_name]))
+del _field_name
 
 
 def update_model_field(*, instance, field_name, old_value, new_value, result: CreateOrUpdateResult):
@@ -108,8 +226,406 @@ def update_model_field(*, instance, field_name, old_value, new_value, result: Cr
     # Expand the list of updated fields, used for result and save() call:
     result.updated_fields.append(field_name)
 
-    # Store update information:
-    result.update_info.append(FieldUpdate(field_name=field_name, old_value=old_value, new_value=new_value))
+    if result.collect_update_info:
+        # Store update information:
+        result.update_info.append(FieldUpdate(field_name=field_name, old_value=old_value, new_value=new_value))
+
+
+@dataclasses.dataclass(frozen=True)
+class UpdatePlan:
+    """
+    Precomputed model field information and store behaviors used by create_or_update2() and co.
+    Created and cached by get_update_plan()
+    """
+
+    # All field names + relations etc. that are allowed in "store_behavior":
+    all_field_names: frozenset[str]
+
+    # Field names with STORE_BEHAVIOR_IGNORE / STORE_BEHAVIOR_SET_IF_EMPTY / STORE_BEHAVIOR_SKIP_EMPTY:
+    ignore_fields: frozenset[str]
+    set_if_empty_fields: frozenset[str]
+    skip_empty_fields: frozenset[str]
+
+    # Names/attnames of concrete fields that store UUIDs and all other names/attnames of concrete fields:
+    uuid_fields: frozenset[str]
+    concrete_fields: frozenset[str]
+
+    # Mapping of concrete field names (and "pk") to the attribute names, e.g.: "foo" -> "foo_id"
+    attnames: dict[str, str]
+
+
+@functools.lru_cache(maxsize=256)
+def _get_update_plan(ModelClass: type[models.Model], store_behavior: frozenset) -> UpdatePlan:
+    opts = ModelClass._meta
+    all_field_names = {
+        # Note: We collect intentionally all fields + relations etc.
+        # Maybe relations will be handled in external code parts ;)
+        field.name
+        for field in opts.get_fields(include_parents=True, include_hidden=True)
+    }
+
+    to_be_ignore_fields = set()  # Fields that should be ignored.
+    to_be_set_if_empty_fields = set()  # Fields that should are set only when empty.
+    to_be_skiped_if_empty = set()  # Fields that should not filled with empty values
+    for field_name, behavior in sorted(store_behavior):
+        if field_name not in all_field_names:
+            raise InvalidStoreBehavior(
+                f'store_behavior field name {field_name!r}'
+                f' is not one of: {sorted(all_field_names)}'
+            )
+
+        if behavior == STORE_BEHAVIOR_IGNORE:
+            # Values for this field should be completely ignored
+            to_be_ignore_fields.add(field_name)
+        elif behavior == STORE_BEHAVIOR_SET_IF_EMPTY:
+            # Field values should be only stored, if existing field is empty
+            to_be_set_if_empty_fields.add(field_name)
+        elif behavior == STORE_BEHAVIOR_SKIP_EMPTY:
+            # Fields that should not filled with empty values
+            to_be_skiped_if_empty.add(field_name)
+        else:
+            raise KeyError(f'Unknown store behavior: {behavior!r} !')
+
+    uuid_fields = set()
+    concrete_fields = set()
+    attnames = {'pk': opts.pk.attname}
+    for field in opts.concrete_fields:
+        attnames[field.name] = field.attname
+        concrete_fields.update((field.name, field.attname))
+        if field.is_relation:
+            # Only the attname (e.g.: "foo_id") contains the UUID, the name returns the related instance
+            if field.target_field.get_internal_type() == 'UUIDField':
+                uuid_fields.add(field.attname)
+        elif field.get_internal_type() == 'UUIDField':
+            uuid_fields.add(field.name)
+
+    return UpdatePlan(
+        all_field_names=frozenset(all_field_names),
+        ignore_fields=frozenset(to_be_ignore_fields),
+        set_if_empty_fields=frozenset(to_be_set_if_empty_fields),
+        skip_empty_fields=frozenset(to_be_skiped_if_empty),
+        uuid_fields=frozenset(uuid_fields),
+        concrete_fields=frozenset(concrete_fields),
+        attnames=attnames,
+    )
+
+
+def get_update_plan(*, ModelClass: type[models.Model], store_behavior: dict | None = None) -> UpdatePlan:
+    """
+    Returns the cached UpdatePlan for the given model and "store_behavior"
+    """
+    return _get_update_plan(ModelClass, frozenset(store_behavior.items()) if store_behavior else frozenset())
+
+
+def _filter_ignored_values(*, values: dict, plan: UpdatePlan, result: CreateOrUpdateResult) -> dict:
+    if not plan.ignore_fields:
+        return values
+
+    # Just filter every field values that we should ignore:
+    filtered_values = {}
+    for key, value in values.items():
+        if key in plan.ignore_fields:
+            result.ignored_fields.append(key)
+        else:
+            filtered_values[key] = value
+    return filtered_values
+
+
+def _clean_updated(
+    *,
+    instance: models.Model,
+    lookup: dict,
+    validate_unique: bool,
+    incremental_clean: bool,
+    always_clean_fields: Iterable[str],
+    result: CreateOrUpdateResult,
+) -> None:
+    if incremental_clean:
+        clean_fields(
+            instance=instance,
+            lookup=lookup,
+            field_names=[*result.updated_fields, *always_clean_fields],
+            validate_unique=validate_unique,
+        )
+    else:
+        full_clean(instance=instance, lookup=lookup, validate_unique=validate_unique)
+
+
+def _store_values(
+    *,
+    instance: models.Model,
+    values: dict,
+    plan: UpdatePlan,
+    update_model_field_callback: Callable,
+    result: CreateOrUpdateResult,
+) -> None:
+    """
+    Apply the given values to an existing model instance by respecting the store behaviors.
+    """
+    for field_name, value in values.items():
+        if not value and field_name in plan.skip_empty_fields:
+            # We should not store empty value (and maybe overwrite existing one):
+            result.skip_empty_values.append(field_name)
+            continue
+
+        old_value = getattr(instance, field_name)
+
+        if (
+            (field_name in plan.uuid_fields or field_name not in plan.concrete_fields)
+            and isinstance(old_value, UUID)
+            and not isinstance(value, UUID)
+        ):
+            # Special case: Model field is a UUID but given values is a string.
+            # Important: Convert the database value and *not* the given value!
+            # In case of a non-UUID string a normal ValueError will be raised.
+            old_value = str(old_value)
+
+        if old_value and field_name in plan.set_if_empty_fields:
+            # We should not overwrite this existing field value!
+            result.not_overwritten_fields.append(field_name)
+            continue
+
+        update_model_field_callback(
+            instance=instance,
+            field_name=field_name,
+            old_value=old_value,
+            new_value=value,
+            result=result,
+        )
+
+
+def _get_lookup_field(opts: Options, field_name: str) -> models.Field:
+    if field_name == 'pk':
+        return opts.pk
+    return opts.get_field(field_name)
+
+
+def _get_conflict_fields(*, ModelClass: type[models.Model], lookup: dict) -> list[models.Field]:
+    """
+    Returns the model fields of the lookup, if they are covered by one unique constraint.
+    """
+    opts = ModelClass._meta
+    fields = [_get_lookup_field(opts, field_name) for field_name in lookup]
+    field_names = {field.name for field in fields}
+
+    unique_field_sets = [{field.name} for field in opts.local_concrete_fields if field.unique]
+    unique_field_sets += [set(unique_together) for unique_together in opts.unique_together]
+    unique_field_sets += [set(constraint.fields) for constraint in opts.total_unique_constraints]
+    if field_names not in unique_field_sets:
+        raise ValueError(f'Lookup fields {sorted(field_names)} are not covered by one unique constraint!')
+    return fields
+
+
+def _convert_db_row(*, ModelClass: type[models.Model], fields: list[models.Field], row, using: str) -> models.Model:
+    """
+    Create a model instance from a raw database row, in the same way as a QuerySet.
+    """
+    connection = connections[using]
+    values = []
+    for field, value in zip(fields, row, strict=True):
+        expression = field.get_col(ModelClass._meta.db_table)
+        for converter in connection.ops.get_db_converters(expression) + field.get_db_converters(connection):
+            value = converter(value, expression, connection)
+        values.append(value)
+    return ModelClass.from_db(using, [field.attname for field in fields], values)
+
+
+def _get_upsert_sql(
+    *,
+    instance: models.Model,
+    conflict_fields: list[models.Field],
+    update_fields: dict[str, models.Field],
+    is_timetracking: bool,
+    connection,
+) -> tuple[str, list, list[models.Field]]:
+    """
+    Returns the SQL, the parameters and the fields of the returned rows for _upsert()
+    Every returned row starts with "is new", ends with "created" and contains the values of all fields.
+    """
+    opts = instance._meta
+    fields = list(opts.local_concrete_fields)
+    insert_fields = []
+    insert_params = []
+    for field in fields:
+        value = field.pre_save(instance, add=True)
+        if value is None and field.primary_key and field.db_returning:
+            # Let the database generate the primary key
+            continue
+        insert_fields.append(field)
+        insert_params.append(field.get_db_prep_save(value, connection))
+
+    qn = connection.ops.quote_name
+    table = qn(opts.db_table)
+    all_columns = ', '.join(qn(field.column) for field in fields)
+    conflict_params = [insert_params[insert_fields.index(field)] for field in conflict_fields]
+    old_where = ' AND '.join(f'{qn(field.column)} = %s' for field in conflict_fields)
+    conflict_columns = ', '.join(qn(field.column) for field in conflict_fields)
+
+    if update_fields:
+        set_columns = [qn(field.column) for field in update_fields.values()]
+        set_sql = ', '.join(f'{column} = EXCLUDED.{column}' for column in set_columns)
+        if is_timetracking and 'update_dt' not in update_fields:
+            column = qn('update_dt')
+            set_sql += f', {column} = EXCLUDED.{column}'
+        current = ', '.join(f'{table}.{column}' for column in set_columns)
+        excluded = ', '.join(f'EXCLUDED.{column}' for column in set_columns)
+        on_conflict = f'DO UPDATE SET {set_sql} WHERE ROW({current}) IS DISTINCT FROM ROW({excluded})'
+    else:
+        on_conflict = 'DO NOTHING'
+
+    sql = (
+        f'WITH old AS (SELECT {all_columns} FROM {table} WHERE {old_where}),'
+        f' new AS ('
+        f'INSERT INTO {table} ({", ".join(qn(field.column) for field in insert_fields)})'
+        f' VALUES ({", ".join(["%s"] * len(insert_fields))})'
+        f' ON CONFLICT ({conflict_columns}) {on_conflict}'
+        f' RETURNING {all_columns}, (xmax = 0) AS created'
+        f')'
+        f' SELECT true, new.* FROM new'
+        f' UNION ALL SELECT false, old.*, NULL FROM old'
+    )
+    return sql, [*conflict_params, *insert_params], fields
+
+
+def _upsert_full_clean(*, instance: models.Model, lookup: dict, validate_unique: bool) -> None:
+    """
+    full_clean() of an instance, that may already exist: The unique checks and unique constraints
+    must not report the existing row as a duplicate of itself. So they run with the primary key
+    of the existing row (fetched via the lookup), in the same way as for an update in MODE_SELECT.
+    """
+    opts = instance._meta
+    pk_value = instance.pk
+    if pk_value is None and (
+        validate_unique or any(isinstance(constraint, models.UniqueConstraint) for constraint in opts.constraints)
+    ):
+        try:
+            existing_pk = opts.base_manager.filter(**lookup).values_list('pk', flat=True).first()
+        except (ValidationError, ValueError, TypeError):
+            existing_pk = None  # A non-valid lookup value: full_clean() will report it
+        if existing_pk is not None:
+            instance.pk = existing_pk
+            instance._state.adding = False
+    try:
+        full_clean(instance=instance, lookup=lookup, validate_unique=validate_unique)
+    finally:
+        instance.pk = pk_value
+        instance._state.adding = True
+
+
+def _upsert(
+    *,
+    ModelClass: type[models.Model],
+    lookup: dict,
+    values: dict,
+    call_full_clean: bool,
+    validate_unique: bool,
+    plan: UpdatePlan,
+    result: CreateOrUpdateResult,
+) -> None:
+    """
+    Insert or update a model instance with one "INSERT ... ON CONFLICT ... DO UPDATE" statement.
+
+    The old values are fetched in the same statement via a CTE, the new values via "RETURNING".
+    Unchanged rows are not rewritten, because of the "IS DISTINCT FROM" guard.
+    """
+    opts = ModelClass._meta
+    if opts.parents:
+        raise NotSupportedError(f'Upsert of models with parents is not supported: {opts.label}')
+    conflict_fields = _get_conflict_fields(ModelClass=ModelClass, lookup=lookup)
+
+    using = router.db_for_write(ModelClass)
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        raise NotSupportedError(f'Upsert is not supported for database vendor: {connection.vendor!r}')
+
+    # Fields that should be updated, if the instance already exists:
+    update_fields = {}
+    for field_name, value in values.items():
+        if not value and field_name in plan.skip_empty_fields:
+            # We should not store empty value (and maybe overwrite existing one):
+            result.skip_empty_values.append(field_name)
+            continue
+        field = opts.get_field(field_name)
+        if field not in conflict_fields:
+            update_fields[field_name] = field
+
+    instance = ModelClass(**lookup, **values)
+    is_timetracking = isinstance(instance, TimetrackingBaseModel)
+    if is_timetracking:
+        # The row may be inserted, and only "update_dt" is updated on conflict:
+        _set_timetracking(instances=[instance], now=timezone.now(), created=True)
+
+    insert_error = None
+    if call_full_clean:
+        # We don't know, if the row will be inserted or updated: Validate all fields, but errors
+        # of the fields that are not stored on conflict only matter, if the row is inserted.
+        try:
+            _upsert_full_clean(instance=instance, lookup=lookup, validate_unique=validate_unique)
+        except ValidationError as err:
+            stored_field_names = {field.name for field in [*conflict_fields, *update_fields.values()]}
+            if not hasattr(err, 'error_dict') or stored_field_names & err.error_dict.keys():
+                raise
+            insert_error = err
+
+    sql, params, fields = _get_upsert_sql(
+        instance=instance,
+        conflict_fields=conflict_fields,
+        update_fields=update_fields,
+        is_timetracking=is_timetracking,
+        connection=connection,
+    )
+    with connection.cursor() as cursor:
+        if insert_error is None:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        else:
+            with transaction.atomic(using=using):
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+                if any(is_new and row[-1] for is_new, *row in rows):
+                    # A non-valid row was inserted: Roll it back
+                    raise insert_error
+
+    old_instance = new_instance = None
+    created = False
+    for is_new, *row in rows:
+        row_instance = _convert_db_row(ModelClass=ModelClass, fields=fields, row=row[:-1], using=using)
+        if is_new:
+            new_instance = row_instance
+            created = row[-1]
+        else:
+            old_instance = row_instance
+
+    if created:
+        result.created = True
+        result.skip_empty_values = None  # Only filled on updates
+        result.instance = new_instance
+        return
+
+    if new_instance is None:
+        # Existing instance is unchanged
+        result.instance = old_instance
+        return
+
+    for field_name, field in update_fields.items():
+        # Note: Compare the raw values, to avoid fetching related objects:
+        old_value = None if old_instance is None else getattr(old_instance, field.attname)
+        new_value = getattr(new_instance, field.attname)
+        if old_value != new_value:
+            result.updated_fields.append(field_name)
+            if result.collect_update_info:
+                result.update_info.append(
+                    FieldUpdate(field_name=field_name, old_value=old_value, new_value=new_value)
+                )
+
+    result.instance = new_instance
+
+
+def _check_upsert_args(*, plan: UpdatePlan, save_kwargs: dict, update_model_field_callback: Callable) -> None:
+    if plan.set_if_empty_fields:
+        raise NotSupportedError('STORE_BEHAVIOR_SET_IF_EMPTY is not supported in upsert mode!')
+    if save_kwargs or update_model_field_callback is not update_model_field:
+        raise NotSupportedError('save_kwargs and update_model_field_callback are not supported in upsert mode!')
 
 
 def create_or_update2(
@@ -121,6 +637,10 @@ def create_or_update2(
     store_behavior: dict | None = None,
     save_kwargs: dict | None = None,
     update_model_field_callback: Callable = update_model_field,
+    mode: str = MODE_SELECT,
+    incremental_clean: bool = False,
+    always_clean_fields: Iterable[str] = (),
+    collect_update_info: bool = True,
     **values,
 ) -> CreateOrUpdateResult:
     """
@@ -146,52 +666,45 @@ def create_or_update2(
       - STORE_BEHAVIOR_IGNORE........: Never store a given value to the model field
       - STORE_BEHAVIOR_SET_IF_EMPTY..: Store given value only if current field value is empty
       - STORE_BEHAVIOR_SKIP_EMPTY....: Don't store empty values to the field (protect existing)
+
+     "mode" is one of:
+      - MODE_SELECT..: Fetch the existing instance and insert/update it via save() (default)
+      - MODE_UPSERT..: Use one "INSERT ... ON CONFLICT ... DO UPDATE" statement (PostgreSQL only)
+                       The lookup must match a unique constraint and save() is not called.
+                       Changed relations are reported with their primary key values.
+                       STORE_BEHAVIOR_SET_IF_EMPTY, "save_kwargs" and callbacks are not supported.
+                       All fields are validated: Errors of not passed fields are only raised (and
+                       the insert is rolled back), if the row doesn't exist, same as in MODE_SELECT.
+                       Unique checks need the primary key of an existing row: With a non-pk lookup
+                       it's fetched with one extra query before the upsert.
+
+     "incremental_clean" validates an updated instance only with the changed fields and "always_clean_fields"
+     via clean_fields() instead of full_clean(): The model clean() and e.g. ForeignKey queries of unchanged
+     fields are skipped. New instances are always validated via full_clean().
+
+     "collect_update_info=False" skips collecting the old/new values (FieldUpdate) in "update_info".
     """
+    if mode not in (MODE_SELECT, MODE_UPSERT):
+        raise ValueError(f'Unknown mode: {mode!r}')
     if save_kwargs is None:
         save_kwargs = {}
-    result = CreateOrUpdateResult()
-
-    to_be_ignore_fields = set()  # Fields that should be ignored.
-    to_be_set_if_empty_fields = set()  # Fields that should are set only when empty.
-    to_be_skiped_if_empty = set()  # Fields that should not filled with empty values
-
-    if store_behavior:
-        opts = ModelClass._meta
-        all_field_names = {
-            # Note: We collect intentionally all fields + relations etc.
-            # Maybe relations will be handled in external code parts ;)
-            field.name
-            for field in opts.get_fields(include_parents=True, include_hidden=True)
-        }
-        for field_name, behavior in store_behavior.items():
-            if field_name not in all_field_names:
-                raise InvalidStoreBehavior(
-                    f'store_behavior field name {field_name!r}'
-                    f' is not one of: {sorted(all_field_names)}'
-                )
+    result = CreateOrUpdateResult(collect_update_info=collect_update_info)
 
-            if behavior == STORE_BEHAVIOR_IGNORE:
-                # Values for this field should be completely ignored
-                to_be_ignore_fields.add(field_name)
-            elif behavior == STORE_BEHAVIOR_SET_IF_EMPTY:
-                # Field values should be only stored, if existing field is empty
-                to_be_set_if_empty_fields.add(field_name)
-            elif behavior == STORE_BEHAVIOR_SKIP_EMPTY:
-                # Fields that should not filled with empty values
-                to_be_skiped_if_empty.add(field_name)
-            else:
-                raise KeyError(f'Unknown store behavior: {behavior!r} !')
+    plan = get_update_plan(ModelClass=ModelClass, store_behavior=store_behavior)
+    filtered_values = _filter_ignored_values(values=values, plan=plan, result=result)
 
-    if not to_be_ignore_fields:
-        filtered_values = values
-    else:
-        # Just filter every field values that we should ignore:
-        filtered_values = {}
-        for key, value in values.items():
-            if key in to_be_ignore_fields:
-                result.ignored_fields.append(key)
-            else:
-                filtered_values[key] = value
+    if mode == MODE_UPSERT and lookup is not None:
+        _check_upsert_args(plan=plan, save_kwargs=save_kwargs, update_model_field_callback=update_model_field_callback)
+        _upsert(
+            ModelClass=ModelClass,
+            lookup=lookup,
+            values=filtered_values,
+            call_full_clean=call_full_clean,
+            validate_unique=validate_unique,
+            plan=plan,
+            result=result,
+        )
+        return result
 
     if lookup is None:
         # Create a new object
@@ -220,46 +733,514 @@ def create_or_update2(
         return result
 
     # Store values:
+    _store_values(
+        instance=instance,
+        values=filtered_values,
+        plan=plan,
+        update_model_field_callback=update_model_field_callback,
+        result=result,
+    )
 
-    for field_name, value in filtered_values.items():
-        if not value and field_name in to_be_skiped_if_empty:
-            # We should not store empty value (and maybe overwrite existing one):
-            result.skip_empty_values.append(field_name)
-            continue
+    if result.has_updates():
+        if call_full_clean:
+            # Don't save new non-valid values
+            _clean_updated(
+                instance=instance,
+                lookup=lookup,
+                validate_unique=validate_unique,
+                incremental_clean=incremental_clean,
+                always_clean_fields=always_clean_fields,
+                result=result,
+            )
 
-        old_value = getattr(instance, field_name)
+        instance.save(update_fields=result.updated_fields, **save_kwargs)
 
-        if isinstance(old_value, UUID) and not isinstance(value, UUID):
-            # Special case: Model field is a UUID but given values is a string.
-            # Important: Convert the database value and *not* the given value!
-            # In case of a non-UUID string a normal ValueError will be raised.
-            old_value = str(old_value)
+    result.instance = instance
 
-        if old_value and field_name in to_be_set_if_empty_fields:
-            # We should not overwrite this existing field value!
-            result.not_overwritten_fields.append(field_name)
-            continue
+    return result
 
-        update_model_field_callback(
-            instance=instance,
-            field_name=field_name,
-            old_value=old_value,
-            new_value=value,
+
+async def acreate_or_update2(
+    *,
+    ModelClass: type[models.Model],
+    lookup: dict | None = None,
+    call_full_clean: bool = True,
+    validate_unique: bool = False,
+    store_behavior: dict | None = None,
+    save_kwargs: dict | None = None,
+    update_model_field_callback: Callable = update_model_field,
+    mode: str = MODE_SELECT,
+    incremental_clean: bool = False,
+    always_clean_fields: Iterable[str] = (),
+    collect_update_info: bool = True,
+    **values,
+) -> CreateOrUpdateResult:
+    """
+    Async variant of create_or_update2() with the same arguments and CreateOrUpdateResult.
+    Use the async ORM methods (e.g.: afirst(), asave()) and run only the validation
+    and the upsert statement via sync_to_async().
+    """
+    if mode not in (MODE_SELECT, MODE_UPSERT):
+        raise ValueError(f'Unknown mode: {mode!r}')
+    if save_kwargs is None:
+        save_kwargs = {}
+    result = CreateOrUpdateResult(collect_update_info=collect_update_info)
+
+    plan = get_update_plan(ModelClass=ModelClass, store_behavior=store_behavior)
+    filtered_values = _filter_ignored_values(values=values, plan=plan, result=result)
+
+    if mode == MODE_UPSERT and lookup is not None:
+        _check_upsert_args(plan=plan, save_kwargs=save_kwargs, update_model_field_callback=update_model_field_callback)
+        await sync_to_async(_upsert)(
+            ModelClass=ModelClass,
+            lookup=lookup,
+            values=filtered_values,
+            call_full_clean=call_full_clean,
+            validate_unique=validate_unique,
+            plan=plan,
             result=result,
         )
+        return result
+
+    if lookup is None:
+        # Create a new object
+        instance = await acreate(
+            ModelClass=ModelClass,
+            call_full_clean=call_full_clean,
+            save_kwargs=save_kwargs,
+            validate_unique=validate_unique,
+            **filtered_values,
+        )
+        result.instance = instance
+        result.created = True
+        return result
 
-    if result.updated_fields:
+    # Try to update a existing object
+    assert isinstance(lookup, dict)
+    instance = await ModelClass.objects.filter(**lookup).afirst()
+    if not instance:
+        instance = await acreate(
+            ModelClass=ModelClass,
+            call_full_clean=call_full_clean,
+            validate_unique=validate_unique,
+            save_kwargs=save_kwargs,
+            **lookup,
+            **filtered_values,
+        )
+        result.instance = instance
+        result.created = True
+        return result
+
+    # Store values:
+    store_values_kwargs = {
+        'instance': instance,
+        'values': filtered_values,
+        'plan': plan,
+        'update_model_field_callback': update_model_field_callback,
+        'result': result,
+    }
+    if any(plan.attnames.get(field_name, field_name) != field_name for field_name in filtered_values):
+        # The old value of a relation by name is the related instance, that may be fetched from the database:
+        await sync_to_async(_store_values)(**store_values_kwargs)
+    else:
+        _store_values(**store_values_kwargs)
+
+    if result.has_updates():
         if call_full_clean:
             # Don't save new non-valid values
-            full_clean(instance=instance, lookup=lookup, validate_unique=validate_unique)
+            await sync_to_async(_clean_updated)(
+                instance=instance,
+                lookup=lookup,
+                validate_unique=validate_unique,
+                incremental_clean=incremental_clean,
+                always_clean_fields=always_clean_fields,
+                result=result,
+            )
 
-        instance.save(update_fields=result.updated_fields, **save_kwargs)
+        await instance.asave(update_fields=result.updated_fields, **save_kwargs)
 
     result.instance = instance
 
     return result
 
 
+def _lookup_key(*, lookup_fields: Sequence[models.Field], lookup_values: Iterable) -> tuple:
+    """
+    Build a hashable key for a lookup, that is comparable with the values of a fetched model instance.
+    """
+    key = []
+    for field, value in zip(lookup_fields, lookup_values, strict=True):
+        if isinstance(value, models.Model):
+            value = value.pk
+        key.append(field.to_python(value))
+    return tuple(key)
+
+
+def _get_row_lookup(*, opts: Options, row: dict, lookup_fields: Sequence[str]) -> dict:
+    """
+    Returns the lookup of a row dict. A missing or non-valid lookup value is a ValidationError of the row.
+    """
+    lookup = {}
+    for field_name in lookup_fields:
+        if field_name not in row:
+            raise ValidationError({field_name: ValidationError('Missing lookup field.', code='required')})
+        value = lookup[field_name] = row[field_name]
+        try:
+            _lookup_key(lookup_fields=[_get_lookup_field(opts, field_name)], lookup_values=[value])
+        except ValidationError as err:
+            raise ValidationError({field_name: err.error_list}) from err
+    return lookup
+
+
+def _iter_batches(iterable: Iterable, batch_size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def _set_timetracking(*, instances: Iterable[models.Model], now, created: bool) -> None:
+    """
+    bulk_create() and bulk_update() doesn't call save(), so set the TimetrackingBaseModel fields here.
+    "create_dt" is only set for new instances, because it's not in the "update_fields" of existing ones.
+    """
+    for instance in instances:
+        instance.update_dt = now
+        if created and instance.create_dt is None:
+            instance.create_dt = now
+
+
+def _iter_bulk_results(
+    *,
+    ModelClass: type[models.Model],
+    rows: Iterable[dict],
+    lookup_fields: Sequence[str],
+    batch_size: int,
+    call_full_clean: bool,
+    validate_unique: bool,
+    store_behavior: dict | None,
+    update_model_field_callback: Callable,
+    incremental_clean: bool,
+    always_clean_fields: Iterable[str],
+    collect_update_info: bool,
+    dry_run: bool,
+) -> Iterator[list[CreateOrUpdateResult]]:
+    """
+    Implementation of bulk_create_or_update2() and plan_create_or_update2(): Yields the results of every batch.
+    With "dry_run" nothing will be written to the database, so the planned instances are kept
+    to compare later rows with the same lookup against the planned values instead of the stored ones.
+    """
+    assert lookup_fields, 'No lookup fields given!'
+    assert batch_size > 0, f'Invalid batch size: {batch_size!r}'
+
+    opts = ModelClass._meta
+    fields = [_get_lookup_field(opts, field_name) for field_name in lookup_fields]
+    plan = get_update_plan(ModelClass=ModelClass, store_behavior=store_behavior)
+    is_timetracking = issubclass(ModelClass, TimetrackingBaseModel)
+    using = router.db_for_write(ModelClass)
+    planned = {}  # Only used in dry run: The created/updated instances by lookup key
+
+    for batch in _iter_batches(rows, batch_size):
+        results = []
+        lookups = []
+        keys = {}  # Use dict as ordered set
+        for row in batch:
+            lookup = {field_name: row[field_name] for field_name in lookup_fields}
+            key = _lookup_key(lookup_fields=fields, lookup_values=lookup.values())
+            if key in keys:
+                raise ValueError(f'Lookup {lookup!r} is used more than once in one batch!')
+            lookups.append(lookup)
+            keys[key] = None
+
+        # Fetch all existing instances of this batch with one query:
+        if len(fields) == 1:
+            queryset = ModelClass.objects.filter(**{f'{fields[0].name}__in': [key[0] for key in keys]})
+        else:
+            queryset = ModelClass.objects.filter(
+                functools.reduce(
+                    operator.or_,
+                    (models.Q(**dict(zip([field.name for field in fields], key, strict=True))) for key in keys),
+                )
+            )
+        existing = {}
+        for instance in queryset.using(using):
+            key = tuple(getattr(instance, plan.attnames[field_name]) for field_name in lookup_fields)
+            existing[key] = instance
+        if planned:
+            existing.update((key, planned[key]) for key in keys if key in planned)
+
+        to_create = []
+        to_update = []
+        update_fields = set()
+        for row, lookup, key in zip(batch, lookups, keys, strict=True):
+            result = CreateOrUpdateResult(collect_update_info=collect_update_info)
+            values = {field_name: value for field_name, value in row.items() if field_name not in lookup}
+            filtered_values = _filter_ignored_values(values=values, plan=plan, result=result)
+
+            instance = existing.get(key)
+            if instance is None:
+                instance = ModelClass(**lookup, **filtered_values)
+                if call_full_clean:
+                    # Don't create non-valid instances
+                    full_clean(instance=instance, lookup=None, validate_unique=validate_unique)
+                to_create.append(instance)
+                result.created = True
+            else:
+                _store_values(
+                    instance=instance,
+                    values=filtered_values,
+                    plan=plan,
+                    update_model_field_callback=update_model_field_callback,
+                    result=result,
+                )
+                if result.has_updates():
+                    if call_full_clean:
+                        # Don't save new non-valid values
+                        _clean_updated(
+                            instance=instance,
+                            lookup=lookup,
+                            validate_unique=validate_unique,
+                            incremental_clean=incremental_clean,
+                            always_clean_fields=always_clean_fields,
+                            result=result,
+                        )
+                    to_update.append(instance)
+                    update_fields.update(result.updated_fields)
+
+            result.instance = instance
+            results.append(result)
+
+        if dry_run:
+            planned.update(
+                (key, result.instance)
+                for key, result in zip(keys, results, strict=True)
+                if result.created or result.has_updates()
+            )
+        if dry_run or (not to_create and not to_update):
+            # Nothing to write in this batch
+            yield results
+            continue
+
+        if is_timetracking:
+            now = timezone.now()
+            _set_timetracking(instances=to_create, now=now, created=True)
+            _set_timetracking(instances=to_update, now=now, created=False)
+            if to_update:
+                update_fields.add('update_dt')
+
+        with transaction.atomic(using=using):
+            if to_create:
+                ModelClass.objects.using(using).bulk_create(to_create, batch_size=batch_size)
+            if to_update:
+                ModelClass.objects.using(using).bulk_update(
+                    to_update, fields=sorted(update_fields), batch_size=batch_size
+                )
+        yield results
+
+
+def bulk_create_or_update2(
+    *,
+    ModelClass: type[models.Model],
+    rows: Iterable[dict],
+    lookup_fields: Sequence[str],
+    batch_size: int = 1000,
+    call_full_clean: bool = True,
+    validate_unique: bool = False,
+    store_behavior: dict | None = None,
+    update_model_field_callback: Callable = update_model_field,
+    incremental_clean: bool = False,
+    always_clean_fields: Iterable[str] = (),
+    collect_update_info: bool = True,
+) -> list[CreateOrUpdateResult]:
+    """
+    Create new or update existing model instances in batches and returns a CreateOrUpdateResult per row.
+    Same as create_or_update2() but needs only one SELECT, one bulk_create() and one bulk_update() per batch.
+
+    Every row is a dict with the values, that must contain all "lookup_fields", e.g.:
+
+        results = bulk_create_or_update2(
+            ModelClass=Product,
+            rows=[{'gtin': '4260...', 'name': 'Foo'}, ...],
+            lookup_fields=('gtin',),
+        )
+
+    Note:
+     * save() is not called and no signals are sent, because of bulk_create() and bulk_update()
+     * "create_dt" and "update_dt" of TimetrackingBaseModel will be set.
+     * The same lookup must not appear twice in one batch.
+     * "incremental_clean", "always_clean_fields" and "collect_update_info" work the same as in create_or_update2()
+    """
+    results = []
+    for batch_results in _iter_bulk_results(
+        ModelClass=ModelClass,
+        rows=rows,
+        lookup_fields=lookup_fields,
+        batch_size=batch_size,
+        call_full_clean=call_full_clean,
+        validate_unique=validate_unique,
+        store_behavior=store_behavior,
+        update_model_field_callback=update_model_field_callback,
+        incremental_clean=incremental_clean,
+        always_clean_fields=always_clean_fields,
+        collect_update_info=collect_update_info,
+        dry_run=False,
+    ):
+        results.extend(batch_results)
+    return results
+
+
+def plan_create_or_update2(
+    *,
+    ModelClass: type[models.Model],
+    rows: Iterable[dict],
+    lookup_fields: Sequence[str],
+    batch_size: int = 1000,
+    call_full_clean: bool = True,
+    validate_unique: bool = False,
+    store_behavior: dict | None = None,
+    update_model_field_callback: Callable = update_model_field,
+    incremental_clean: bool = False,
+    always_clean_fields: Iterable[str] = (),
+    collect_update_info: bool = True,
+) -> Iterator[CreateOrUpdateResult]:
+    """
+    Dry-run of bulk_create_or_update2(): Yields the CreateOrUpdateResult per row without any database writes.
+    Needs only one SELECT per batch and the results are not collected, so it can preview huge imports, e.g.:
+
+        changes = collections.Counter()
+        for result in plan_create_or_update2(ModelClass=Product, rows=read_csv_rows(), lookup_fields=('gtin',)):
+            if result.created:
+                changes['created'] += 1
+            changes.update(result.updated_fields)
+
+    Note:
+     * The model instances in the results are not saved. New instances have maybe no primary key.
+     * "create_dt" and "update_dt" of TimetrackingBaseModel will not be set.
+     * With "call_full_clean" the first non-valid row raises the ValidationError, as a real import would do.
+     * A lookup that appears again in a later batch is compared against the planned values,
+       so all created and updated instances are kept in memory until the iterator is exhausted.
+    """
+    for batch_results in _iter_bulk_results(
+        ModelClass=ModelClass,
+        rows=rows,
+        lookup_fields=lookup_fields,
+        batch_size=batch_size,
+        call_full_clean=call_full_clean,
+        validate_unique=validate_unique,
+        store_behavior=store_behavior,
+        update_model_field_callback=update_model_field_callback,
+        incremental_clean=incremental_clean,
+        always_clean_fields=always_clean_fields,
+        collect_update_info=collect_update_info,
+        dry_run=True,
+    ):
+        yield from batch_results
+
+
+@dataclasses.dataclass
+class ChunkStats:
+    """
+    Statistics of one chunk processed by iter_create_or_update2()
+    """
+
+    chunk_no: int  # Starts with 1
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    duration: float = 0.0  # Seconds needed for the chunk (incl. the commit)
+    errors: list[tuple[int, dict | None, Exception]] = dataclasses.field(default_factory=list)  # (row no, lookup, exc)
+
+
+def iter_create_or_update2(
+    *,
+    ModelClass: type[models.Model],
+    rows: Iterable[dict],
+    lookup_fields: Sequence[str] | None,
+    chunk_size: int = 1000,
+    **kwargs,
+) -> Iterator[ChunkStats]:
+    """
+    Create or update model instances from a (maybe endless) iterable of row dicts and yields ChunkStats per chunk.
+    Every row is stored via create_or_update2() (incl. "full_clean()") and the "kwargs" are passed to it, e.g.:
+
+        for stats in iter_create_or_update2(
+            ModelClass=Product,
+            rows=read_csv_rows(),  # e.g.: A generator that yields {'gtin': '4260...', 'name': 'Foo'}
+            lookup_fields=('gtin',),
+            chunk_size=5000,
+            store_behavior={'name': STORE_BEHAVIOR_SKIP_EMPTY},
+        ):
+            logger.info('Chunk %i: %i created, %i failed', stats.chunk_no, stats.created, stats.failed)
+
+    Note:
+     * Every chunk is committed in one transaction.
+     * Every row is stored in a savepoint: A non-valid row is rolled back and counted as failed,
+       the other rows of the chunk are stored. The errors are collected in ChunkStats.errors
+       Row errors are: ROW_ERRORS, e.g.: a missing lookup field, non-valid values, IntegrityError
+       Other errors (e.g.: lost connection or wrong arguments) are raised.
+     * The rows and CreateOrUpdateResult instances are not collected.
+     * Without "lookup_fields" all rows will be created.
+    """
+    assert chunk_size > 0, f'Invalid chunk size: {chunk_size!r}'
+    yield from _iter_chunk_stats(
+        ModelClass=ModelClass,
+        numbered_rows=enumerate(rows, start=1),
+        lookup_fields=lookup_fields,
+        chunk_size=chunk_size,
+        kwargs=kwargs,
+    )
+
+
+# Errors caused by the data of one row. Other errors (e.g.: OperationalError because of a lost connection
+# or a TypeError because of a wrong argument) are not row failures and will be raised.
+ROW_ERRORS = (ValidationError, IntegrityError, DataError)
+
+
+def _iter_chunk_stats(
+    *,
+    ModelClass: type[models.Model],
+    numbered_rows: Iterable[tuple[int, dict]],
+    lookup_fields: Sequence[str] | None,
+    chunk_size: int,
+    kwargs: dict,
+) -> Iterator[ChunkStats]:
+    """
+    Implementation of iter_create_or_update2() that works with (row no, row) tuples.
+    """
+    opts = ModelClass._meta
+    using = router.db_for_write(ModelClass)
+    for chunk_no, chunk in enumerate(_iter_batches(numbered_rows, chunk_size), start=1):
+        stats = ChunkStats(chunk_no=chunk_no, rows=len(chunk))
+        start_time = time.monotonic()
+        with transaction.atomic(using=using):
+            for row_no, row in chunk:
+                lookup = None
+                try:
+                    if lookup_fields:
+                        lookup = _get_row_lookup(opts=opts, row=row, lookup_fields=lookup_fields)
+                        values = {field_name: value for field_name, value in row.items() if field_name not in lookup}
+                    else:
+                        values = row
+
+                    with transaction.atomic(using=using):  # Use a savepoint for every row
+                        result = create_or_update2(ModelClass=ModelClass, lookup=lookup, **kwargs, **values)
+                except ROW_ERRORS as err:
+                    stats.failed += 1
+                    stats.errors.append((row_no, lookup, err))
+                    continue
+
+                if result.created:
+                    stats.created += 1
+                elif result.has_updates():
+                    stats.updated += 1
+                else:
+                    stats.unchanged += 1
+
+        stats.duration = time.monotonic() - start_time
+        yield stats
+
+
 def create_or_update(
     *,
     ModelClass: type[models.Model],
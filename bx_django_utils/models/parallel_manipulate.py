@@ -0,0 +1,277 @@
+"""
+    Run create_or_update2() workloads in parallel in multiple processes.
+"""
+from collections.abc import Iterable, Iterator, Sequence
+import dataclasses
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import time
+import traceback
+import zlib
+
+from django.core.exceptions import ValidationError
+from django.db import NotSupportedError, connections, models, router
+
+from bx_django_utils.models.manipulate import (
+    ChunkStats,
+    _get_lookup_field,
+    _get_row_lookup,
+    _iter_chunk_stats,
+    _lookup_key,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class ImportSummary:
+    """
+    Merged ChunkStats of all chunks, returned by parallel_create_or_update2()
+    """
+
+    chunks: int = 0
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    duration: float = 0.0  # Wall-clock seconds of the whole import
+    errors: list[tuple[int, dict | None, Exception]] = dataclasses.field(default_factory=list)
+
+    def add(self, stats: ChunkStats, *, max_errors: int) -> None:
+        self.chunks += 1
+        self.rows += stats.rows
+        self.created += stats.created
+        self.updated += stats.updated
+        self.unchanged += stats.unchanged
+        self.failed += stats.failed
+        self.errors.extend(stats.errors[: max(max_errors - len(self.errors), 0)])
+
+
+def get_partition(*, lookup_fields: Sequence[models.Field], lookup_values: Iterable, partitions: int) -> int:
+    """
+    Returns the partition number for the given lookup values.
+    The values are normalized via the model fields, so e.g.: 1 and '1' of an IntegerField are in the same partition.
+    """
+    key = _lookup_key(lookup_fields=lookup_fields, lookup_values=lookup_values)
+    return zlib.crc32(repr(key).encode('utf-8')) % partitions
+
+
+def _picklable_error(error: Exception) -> Exception:
+    try:
+        pickle.dumps(error)
+    except Exception:  # noqa BLE001 Any exception can happen while pickling
+        return RuntimeError(f'{type(error).__name__}: {error}')
+    return error
+
+
+def _iter_queue(input_queue) -> Iterator[tuple[int, dict]]:
+    while (numbered_rows := input_queue.get()) is not None:
+        yield from numbered_rows
+
+
+def _worker(worker_no: int, input_queue, result_queue, ModelClass, lookup_fields, chunk_size, kwargs):
+    """
+    Runs in the forked process: Store all rows from "input_queue" and send the ChunkStats to "result_queue"
+    """
+    try:
+        for stats in _iter_chunk_stats(
+            ModelClass=ModelClass,
+            numbered_rows=_iter_queue(input_queue),
+            lookup_fields=lookup_fields,
+            chunk_size=chunk_size,
+            kwargs=kwargs,
+        ):
+            stats.errors = [(row_no, lookup, _picklable_error(err)) for row_no, lookup, err in stats.errors]
+            result_queue.put((worker_no, stats))
+    except BaseException:  # noqa BLE001 Send all errors to the parent process
+        result_queue.put((worker_no, traceback.format_exc()))
+    else:
+        result_queue.put((worker_no, None))  # Done
+    finally:
+        connections.close_all()
+
+
+class _Runner:
+    def __init__(self, *, ModelClass, lookup_fields, processes, chunk_size, max_errors, kwargs):
+        self.summary = ImportSummary()
+        self.max_errors = max_errors
+        self.running = set(range(processes))
+
+        context = multiprocessing.get_context('fork')
+        self.input_queues = [context.Queue(maxsize=2) for _ in range(processes)]
+        self.result_queue = context.Queue()
+        self.workers = [
+            context.Process(
+                target=_worker,
+                args=(worker_no, input_queue, self.result_queue, ModelClass, lookup_fields, chunk_size, kwargs),
+                name=f'parallel_create_or_update2-{worker_no}',
+                daemon=True,
+            )
+            for worker_no, input_queue in enumerate(self.input_queues)
+        ]
+
+    def start(self):
+        # The forked processes must not share the database connections of this process:
+        connections.close_all()
+        for worker in self.workers:
+            worker.start()
+
+    def handle_result(self, timeout):
+        worker_no, payload = self.result_queue.get(timeout=timeout)
+        if isinstance(payload, ChunkStats):
+            self.summary.add(payload, max_errors=self.max_errors)
+        elif payload is None:
+            self.running.discard(worker_no)
+        else:
+            self.terminate()
+            raise RuntimeError(f'Worker {worker_no} failed:\n{payload}')
+
+    def drain_results(self):
+        while True:
+            try:
+                self.handle_result(timeout=0)
+            except queue.Empty:
+                return
+
+    def send(self, worker_no, item):
+        input_queue = self.input_queues[worker_no]
+        while True:
+            try:
+                input_queue.put(item, timeout=0.1)
+            except queue.Full:
+                # Process the results, while the worker is busy and raise early if a worker failed:
+                self.drain_results()
+                if not self.workers[worker_no].is_alive():
+                    self.terminate()
+                    raise RuntimeError(f'Worker {worker_no} died unexpectedly!')
+            else:
+                return
+
+    def wait(self):
+        for worker_no in range(len(self.workers)):
+            self.send(worker_no, None)  # Signal: No more rows
+        while self.running:
+            try:
+                self.handle_result(timeout=1)
+            except queue.Empty:
+                for worker_no in self.running:
+                    if not self.workers[worker_no].is_alive():
+                        self.terminate()
+                        raise RuntimeError(f'Worker {worker_no} died unexpectedly!')
+        for worker in self.workers:
+            worker.join()
+
+    def terminate(self):
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
+
+
+def parallel_create_or_update2(
+    *,
+    ModelClass: type[models.Model],
+    rows: Iterable[dict],
+    lookup_fields: Sequence[str] | None,
+    processes: int | None = None,
+    chunk_size: int = 1000,
+    max_errors: int = 100,
+    **kwargs,
+) -> ImportSummary:
+    """
+    Create or update model instances from an iterable of row dicts in parallel and returns the merged ImportSummary.
+    Same as iter_create_or_update2() (see there), but the rows are processed by "processes" forked workers, e.g.:
+
+        summary = parallel_create_or_update2(
+            ModelClass=Product,
+            rows=read_csv_rows(),
+            lookup_fields=('gtin',),
+            processes=8,
+        )
+
+    Note:
+     * The rows are partitioned by the hash of the lookup values:
+       The same lookup is always stored by the same worker, so workers never race on the same row.
+     * Every worker uses its own database connections. Therefore, all database connections of the current
+       process will be closed before the workers are forked, and it can't be used in a transaction.
+     * Only the first "max_errors" errors are collected in ImportSummary.errors
+     * Needs the "fork" start method, so it's not available on Windows.
+     * processes=1 will not fork and store all rows in the current process.
+     * Multiple processes are only supported with PostgreSQL: On other database backends
+       "processes" defaults to 1.
+    """
+    assert chunk_size > 0, f'Invalid chunk size: {chunk_size!r}'
+    vendor = connections[router.db_for_write(ModelClass)].vendor
+    if processes is None:
+        processes = (os.cpu_count() or 1) if vendor == 'postgresql' else 1
+    assert processes > 0, f'Invalid processes count: {processes!r}'
+
+    start_time = time.monotonic()
+
+    if processes == 1:
+        summary = ImportSummary()
+        for stats in _iter_chunk_stats(
+            ModelClass=ModelClass,
+            numbered_rows=enumerate(rows, start=1),
+            lookup_fields=lookup_fields,
+            chunk_size=chunk_size,
+            kwargs=kwargs,
+        ):
+            summary.add(stats, max_errors=max_errors)
+        summary.duration = time.monotonic() - start_time
+        return summary
+
+    if any(connection.in_atomic_block for connection in connections.all(initialized_only=True)):
+        raise RuntimeError('parallel_create_or_update2() can not be used in a transaction!')
+    if vendor != 'postgresql':
+        # e.g.: With SQLite the workers would mostly fail with "database is locked"
+        raise NotSupportedError(f'Parallel workers are not supported for database vendor: {vendor!r}')
+
+    if lookup_fields:
+        opts = ModelClass._meta
+        fields = [_get_lookup_field(opts, field_name) for field_name in lookup_fields]
+
+    runner = _Runner(
+        ModelClass=ModelClass,
+        lookup_fields=lookup_fields,
+        processes=processes,
+        chunk_size=chunk_size,
+        max_errors=max_errors,
+        kwargs=kwargs,
+    )
+    runner.start()
+    logger.debug('Started %i worker processes', processes)
+    try:
+        buffers = [[] for _ in range(processes)]
+        for row_no, row in enumerate(rows, start=1):
+            if lookup_fields:
+                try:
+                    lookup = _get_row_lookup(opts=opts, row=row, lookup_fields=lookup_fields)
+                except ValidationError:
+                    # A missing or non-valid lookup value: The worker will count the row as failed
+                    worker_no = row_no % processes
+                else:
+                    worker_no = get_partition(lookup_fields=fields, lookup_values=lookup.values(), partitions=processes)
+            else:
+                worker_no = row_no % processes
+            buffer = buffers[worker_no]
+            buffer.append((row_no, row))
+            if len(buffer) >= chunk_size:
+                runner.send(worker_no, buffer)
+                buffers[worker_no] = []
+
+        for worker_no, buffer in enumerate(buffers):
+            if buffer:
+                runner.send(worker_no, buffer)
+        runner.wait()
+    except BaseException:
+        runner.terminate()
+        raise
+
+    summary = runner.summary
+    summary.duration = time.monotonic() - start_time
+    return summary
@@ -37,7 +37,7 @@ class TimetrackingBaseModel(models.Model):
 
     def save(self, update_dt=True, **kwargs):
         if update_dt:
-            if 'update_fields' in kwargs:
+            if kwargs.get('update_fields') is not None:  # Note: asave() passes update_fields=None
                 update_fields = list(kwargs['update_fields'])
             else:
                 update_fields = None
@@ -1,5 +1,7 @@
+import functools
 from importlib import import_module
 import inspect
+import linecache
 import os
 import sys
 
@@ -22,12 +24,80 @@ class StackTrace(list):
     pass
 
 
+@functools.lru_cache(maxsize=64)
+def _get_excluded_paths(excluded_modules: tuple[str, ...]) -> tuple[str, ...]:
+    """
+    Returns the path prefixes of the given modules. Resolved only once per modules tuple.
+    """
+    excluded_paths = []
+    for module in excluded_modules:
+        module = import_module(module)
+        source_path = inspect.getsourcefile(module)
+        if source_path.endswith('__init__.py'):
+            source_path = os.path.dirname(source_path)
+        excluded_paths.append(os.path.realpath(source_path))
+    return tuple(excluded_paths)
+
+
+def _exclude(file, excluded_modules):
+    # str.startswith() with a tuple checks all prefixes in one call:
+    return file.startswith(_get_excluded_paths(tuple(excluded_modules)))
+
+
+# The absolute paths of all code files (there are only a limited number of them):
+_realpath = functools.lru_cache(maxsize=4096)(os.path.realpath)
+
+
+_UNRESOLVED = object()
+
+
 class FrameInfo:
+    """
+    One frame of a StackTrace.
+    Captured lazily as code object and line number: The filename, the function name
+    and the source code line are resolved on first access, because most stack traces
+    are never displayed.
+    """
+
+    __slots__ = ('_code', '_code_object', '_filename', '_func', 'line')
+
     def __init__(self, filename, line, func, code):
-        self.filename = filename
+        self._code_object = None
         self.line = line
-        self.func = func
-        self.code = code
+        self._filename = filename
+        self._func = func
+        self._code = code
+
+    @classmethod
+    def from_code_object(cls, code_object, line):
+        frameinfo = cls.__new__(cls)
+        frameinfo._code_object = code_object
+        frameinfo.line = line
+        frameinfo._filename = frameinfo._func = frameinfo._code = _UNRESOLVED
+        return frameinfo
+
+    @property
+    def filename(self):
+        if self._filename is _UNRESOLVED:
+            self._filename = _realpath(self._code_object.co_filename)  # make it an absolute path
+        return self._filename
+
+    @property
+    def func(self):
+        if self._func is _UNRESOLVED:
+            self._func = self._code_object.co_name
+        return self._func
+
+    @property
+    def code(self):
+        if self._code is _UNRESOLVED:
+            code = linecache.getline(self._code_object.co_filename, self.line or 0)
+            self._code = code.strip() if code else None
+        return self._code
+
+    def __reduce__(self):
+        # Code objects can't be pickled: Resolve all values
+        return FrameInfo, (self.filename, self.line, self.func, self.code)
 
     def __str__(self):
         return f'{self.filename} {self.line} {self.func!r} {self.code!r}'
@@ -36,29 +106,19 @@ class FrameInfo:
         return f'<FrameInfo {self}>'
 
 
-def _exclude(file, excluded_modules):
-    excluded_paths = []
-    for module in excluded_modules:
-        module = import_module(module)
-        source_path = inspect.getsourcefile(module)
-        if source_path.endswith('__init__.py'):
-            source_path = os.path.dirname(source_path)
-        excluded_paths.append(os.path.realpath(source_path))
-
-    return any(file.startswith(excluded_path) for excluded_path in excluded_paths)
+def _iter_frames(frame):
+    """
+    Yields a lazy FrameInfo for the given frame and all outer frames.
+    """
+    from_code_object = FrameInfo.from_code_object
+    while frame:
+        yield from_code_object(frame.f_code, frame.f_lineno)
+        frame = frame.f_back
 
 
 def iter_frameinfo(start_no=1):
-    previous_frame = sys._getframe(start_no)
-    while previous_frame:
-        file, line, func, code, _ = inspect.getframeinfo(previous_frame, context=1)
-        file = os.path.realpath(file)  # make it an absolute path
-        if code and (code := code[0]):
-            code = code.strip()
-
-        yield (file, line, func, code)
-
-        previous_frame = previous_frame.f_back
+    for frameinfo in _iter_frames(sys._getframe(start_no)):
+        yield (frameinfo.filename, frameinfo.line, frameinfo.func, frameinfo.code)
 
 
 def get_stacktrace(tidy=True, exclude_modules=DEFAULT_EXCLUDED_MODULES):
@@ -70,12 +130,11 @@ def get_stacktrace(tidy=True, exclude_modules=DEFAULT_EXCLUDED_MODULES):
     Frames from modules in ``exclude_modules`` will we stripped if ``tidy`` is True.
     """
     stacktrace = StackTrace()
+    excluded_paths = _get_excluded_paths(tuple(exclude_modules)) if tidy else None
 
-    for file, line, func, code in iter_frameinfo():
-        if not tidy:
-            stacktrace.append(FrameInfo(file, line, func, code))
-        if tidy and not _exclude(file, exclude_modules):
-            stacktrace.append(FrameInfo(file, line, func, code))
+    for frameinfo in _iter_frames(sys._getframe()):
+        if not tidy or not frameinfo.filename.startswith(excluded_paths):
+            stacktrace.append(frameinfo)
 
     stacktrace.pop(0)
     stacktrace.reverse()
@@ -94,20 +153,23 @@ class StacktraceAfter:
 
     def __call__(self):
         stacktrace = StackTrace()
+        after_paths = _get_excluded_paths(tuple(self.after_modules))
 
         before = True  # before we visit self.after_modules modules code
         after = False  # after we left self.after_modules modules code
 
-        for file, line, func, code in iter_frameinfo(start_no=3):
-            if before and not _exclude(file, self.after_modules):
+        # Skip this frame and the frame of the caller (e.g.: RecordingCursorWrapper):
+        for frameinfo in _iter_frames(sys._getframe(2)):
+            file = frameinfo.filename
+            if before and not file.startswith(after_paths):
                 before = False
                 continue
 
-            if not after and not _exclude(file, self.after_modules):
+            if not after and not file.startswith(after_paths):
                 after = True
 
             if after:
-                stacktrace.append(FrameInfo(file, line, func, code))
+                stacktrace.append(frameinfo)
 
         stacktrace.reverse()
         return stacktrace
@@ -86,7 +86,7 @@ class AssertQueries(SQLQueryRecorder):
 
     def count_table_names(self):
         table_name_count = Counter()
-        for _db, query in self.logger._queries:
+        for _db, query in self.logger.queries:
             table_name = self.get_table_name(query)
             if table_name:
                 table_name_count[table_name] += 1
@@ -99,7 +99,7 @@ class AssertQueries(SQLQueryRecorder):
         """
         assert self.query_explain, 'Explain way not captured!'
 
-        for _db, query in self.logger._queries:
+        for _db, query in self.logger.queries:
             table_name = self.get_table_name(query)
             explain_str = '\n'.join(query['explain'])
 
@@ -120,7 +120,7 @@ class AssertQueries(SQLQueryRecorder):
         :return: Human readable information about the executed SQL queries
         """
         parts = []
-        for i, (_db, query) in enumerate(self.logger._queries, start=1):
+        for i, (_db, query) in enumerate(self.logger.queries, start=1):
             parts.append(f'{i:>3}. {query["sql"]}')
 
             if self.max_stacktrace:
@@ -260,8 +260,7 @@ class AssertQueries(SQLQueryRecorder):
         Check the total executed database query count.
         Similar to: self.assertNumQueries(num=123)
         """
-        captured_queries = self.logger._queries
-        queries_count = len(captured_queries)
+        queries_count = self.logger._num_queries
         if num != queries_count:
             raise AssertionError(
                 self.build_error_message(f'{queries_count} queries executed, {num} expected.')
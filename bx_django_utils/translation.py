@@ -503,8 +503,9 @@ def create_or_update_translation_callback(*, instance, field_name, old_value, ne
     # Expand the list of updated fields, used for result and save() call:
     result.updated_fields.append(field_name)
 
-    # Store update information:
-    result.update_info.append(FieldUpdate(field_name=field_name, old_value=old_value, new_value=merged_value))
+    if result.collect_update_info:
+        # Store update information:
+        result.update_info.append(FieldUpdate(field_name=field_name, old_value=old_value, new_value=merged_value))
 
 
 def remove_empty_translations(translations: dict | FieldTranslation) -> FieldTranslation:
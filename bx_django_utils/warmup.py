@@ -0,0 +1,102 @@
+"""
+    Warm-up process caches at startup, e.g.: before a pod passes the readiness probe.
+"""
+from collections.abc import Callable
+import dataclasses
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+_callbacks: dict[str, Callable[[], object]] = {}
+
+
+def register_warm_up(func: Callable[[], object] | None = None, *, name: str | None = None):
+    """
+    Register a callback for warm_up(), e.g.: in AppConfig.ready() or as decorator:
+
+        @register_warm_up
+        def load_my_cache():
+            ...
+    """
+
+    def decorator(func):
+        _callbacks[name or f'{func.__module__}.{func.__qualname__}'] = func
+        return func
+
+    if func is None:
+        return decorator
+    return decorator(func)
+
+
+@dataclasses.dataclass
+class WarmUpStep:
+    """
+    Result of one warm-up step, returned by warm_up()
+    """
+
+    name: str
+    duration: float  # seconds
+    error: Exception | None = None
+
+
+def warm_up_feature_flags() -> None:
+    from bx_django_utils.feature_flags.data_classes import FeatureFlag
+
+    FeatureFlag.registry.preload()
+
+
+def warm_up_content_types() -> None:
+    from django.contrib.contenttypes.models import ContentType
+
+    ContentType.objects.get_for_models(*apps.get_models())
+
+
+def warm_up_version() -> None:
+    from bx_django_utils.version import get_version
+
+    get_version()
+
+
+def get_default_steps() -> dict[str, Callable[[], object]]:
+    steps = {}
+    if apps.is_installed('bx_django_utils.feature_flags'):
+        steps['feature flags'] = warm_up_feature_flags
+    if apps.is_installed('django.contrib.contenttypes'):
+        steps['content types'] = warm_up_content_types
+    if hasattr(settings, 'BASE_DIR'):
+        steps['version'] = warm_up_version
+    return steps
+
+
+def warm_up(*, raise_errors: bool = False) -> list[WarmUpStep]:
+    """
+    Fill the caches of the current process and returns the duration of every step:
+     * Load the states of all registered feature flags with one query
+     * Fill the ContentType cache of all models
+     * Determine the application version (maybe via git)
+     * Call all callbacks registered via register_warm_up()
+
+    Call it in every server process, e.g.: in wsgi.py after get_wsgi_application() or in AppConfig.ready(),
+    because most of these caches are in-process memory.
+    Failing steps are logged and returned with the error, if "raise_errors" is not set.
+    """
+    steps = []
+    for name, func in {**get_default_steps(), **_callbacks}.items():
+        start_time = time.perf_counter()
+        error = None
+        try:
+            func()
+        except Exception as err:
+            if raise_errors:
+                raise
+            logger.exception('Warm-up step %r failed', name)
+            error = err
+        step = WarmUpStep(name=name, duration=time.perf_counter() - start_time, error=error)
+        logger.info('Warm-up step %r: %.1f ms', name, step.duration * 1000)
+        steps.append(step)
+    return steps
@@ -191,3 +191,12 @@ class PolymorphicCar(PolymorphicVehicle):
 
 class PolymorphicBike(PolymorphicVehicle):
     pass
+
+
+class UniqueKeyTestModel(TimetrackingBaseModel):
+    key = models.CharField(max_length=64, unique=True)
+    slug = models.SlugField(max_length=64)
+    name = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['slug'], name='unique_key_test_model_slug')]
@@ -1,9 +1,12 @@
+from unittest import mock
+
 from django.db import connections
 from django.db.backends.utils import CursorWrapper
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 from bx_django_utils.dbperf.cursor import RecordingCursorWrapper
-from bx_django_utils.dbperf.query_recorder import SQLQueryRecorder
+from bx_django_utils.dbperf.fingerprint import get_fingerprint
+from bx_django_utils.dbperf.query_recorder import Logger, QueryStats, SQLQueryRecorder
 from bx_django_utils_tests.test_app.models import CreateOrUpdateTestModel
 
 
@@ -34,12 +37,14 @@ class SQLQueryRecorderTestCase(TestCase):
             'queries_duplicated',
             'num_queries_similar',
             'num_queries_duplicated',
+            'fingerprint_stats',
         ))
         self.assertEqual(len(res['queries']), 1)
         self.assertGreater(res['sql_time'], 0)
         self.assertEqual(res['num_queries'], 1)
         self.assertEqual(len(res['queries_similar']), 1)
         self.assertEqual(len(res['queries_duplicated']), 1)
+        self.assertEqual(len(res['fingerprint_stats']), 1)
 
     def test_results_aggregation(self):
         with SQLQueryRecorder(databases=self.databases) as rec:
@@ -90,8 +95,149 @@ class SQLQueryRecorderTestCase(TestCase):
         # we ran it quadruply, twice with the same params
         # it should show as both similar and duplicated
         #
+        # Similar queries are grouped by the fingerprint:
+        fingerprint = 'SELECT "test_app_createorupdatetestmodel"."id" FROM "test_app_createorupdatetestmodel" WHERE "test_app_createorupdatetestmodel"."name" LIKE ? ESCAPE ?'  # noqa: E501
+        self.assertEqual(res['queries_similar']['default'][fingerprint], 4)
         query = 'SELECT "test_app_createorupdatetestmodel"."id" FROM "test_app_createorupdatetestmodel" WHERE "test_app_createorupdatetestmodel"."name" LIKE %s ESCAPE \'\\\''  # noqa: E501
-        self.assertEqual(res['queries_similar']['default'][query], 4)
         self.assertEqual(res['queries_duplicated']['default'][(query, "('foo',)")], 2)
         self.assertNotIn((query, "('bar',)"), res['queries_duplicated']['default'])
         self.assertNotIn((query, "('baz',)"), res['queries_duplicated']['default'])
+
+    def test_max_queries(self):
+        with SQLQueryRecorder(databases=self.databases, max_queries=2) as rec:
+            CreateOrUpdateTestModel.objects.count()
+            CreateOrUpdateTestModel.objects.count()
+            len(CreateOrUpdateTestModel.objects.filter(name='foo'))
+
+        res = rec.results()
+        self.assertEqual(len(res['queries']), 2)
+        self.assertIn('"name" = %s', res['queries'][1][1]['raw_sql'])  # The last query is retained
+        self.assertEqual(res['num_queries'], 3)
+        self.assertEqual(res['databases']['default']['num_queries'], 3)
+        self.assertEqual(rec.logger.num_dropped, 1)
+
+        # The aggregates contain the dropped query, too:
+        query = 'SELECT COUNT(*) AS "__count" FROM "test_app_createorupdatetestmodel"'
+        self.assertEqual(res['queries_similar']['default'][query], 2)
+        self.assertEqual(res['queries_duplicated']['default'][(query, '()')], 2)
+
+
+class LoggerTestCase(SimpleTestCase):
+    def record(self, logger, sql, duration):
+        logger.record(alias='default', raw_sql=sql, raw_params=None, duration=duration)
+
+    def test_keep_slowest(self):
+        logger = Logger(max_queries=2, keep_slowest=True)
+        self.record(logger, 'SELECT 1', duration=5)
+        self.record(logger, 'SELECT 2', duration=1)
+        self.record(logger, 'SELECT 3', duration=9)
+        self.record(logger, 'SELECT 1', duration=3)
+
+        # The slowest queries in execution order:
+        self.assertEqual([query['raw_sql'] for _alias, query in logger.queries], ['SELECT 1', 'SELECT 3'])
+        self.assertEqual(logger._queries, logger.queries)
+        self.assertEqual(logger.num_dropped, 2)
+
+        results = logger.dump()
+        self.assertEqual(results['num_queries'], 4)
+        self.assertEqual(results['sql_time'], 18)
+        self.assertEqual(results['databases'], {'default': {'time_spent': 18, 'num_queries': 4}})
+        self.assertEqual(results['queries_similar'], {'default': {'SELECT ?': 4}})
+        self.assertEqual(results['num_queries_duplicated'], 1)
+        self.assertEqual(
+            results['fingerprint_stats'],
+            [
+                {
+                    'alias': 'default',
+                    'fingerprint': 'SELECT ?',
+                    'num_queries': 4,
+                    'time_spent': 18,
+                    'mean': 4.5,
+                    'p95': 9,
+                },
+            ],
+        )
+
+    def test_bounded_duplicates(self):
+        logger = Logger(max_queries=10)
+        with mock.patch.object(Logger, 'MAX_DUPLICATE_KEYS', 100):
+            for number in range(2000):
+                self.record(logger, 'SELECT 1', duration=1)  # Recently executed, so it's never forgotten
+                self.record(logger, f'SELECT {number}', duration=1)
+        self.assertEqual(len(logger._duplicated['default']), 100)
+
+        results = logger.dump()
+        self.assertEqual(results['num_queries'], 4000)
+        self.assertEqual(results['queries_duplicated'], {'default': {('SELECT 1', '()'): 2001}})
+        self.assertEqual(results['queries_similar'], {'default': {'SELECT ?': 4000}})
+
+        # Without "max_queries" the duplicates are exact:
+        logger = Logger()
+        with mock.patch.object(Logger, 'MAX_DUPLICATE_KEYS', 100):
+            for number in range(200):
+                self.record(logger, f'SELECT {number}', duration=1)
+        self.assertEqual(len(logger._duplicated['default']), 200)
+
+    def test_without_duplicates(self):
+        logger = Logger(count_duplicates=False)
+        for _ in range(3):
+            self.record(logger, 'SELECT 1', duration=1)
+
+        results = logger.dump()
+        self.assertEqual(results['num_queries'], 3)
+        self.assertEqual(results['queries_duplicated'], {})
+        self.assertEqual(results['num_queries_duplicated'], 0)
+        self.assertEqual(results['queries_similar'], {'default': {'SELECT ?': 3}})
+
+    def test_unbounded(self):
+        logger = Logger()
+        for number in range(5):
+            self.record(logger, f'SELECT {number}', duration=number)
+        self.assertEqual(len(logger.queries), 5)
+        self.assertEqual(logger.num_dropped, 0)
+
+        logger = Logger(max_queries=0, keep_slowest=True)
+        self.record(logger, 'SELECT 1', duration=1)
+        self.assertEqual(logger.queries, [])
+        self.assertEqual(logger.num_dropped, 1)
+
+
+class FingerprintTestCase(SimpleTestCase):
+    def test_get_fingerprint(self):
+        self.assertEqual(
+            get_fingerprint('SELECT  "foo"."id"\nFROM "foo" WHERE "foo"."id" IN (%s, %s, %s) LIMIT 21'),
+            'SELECT "foo"."id" FROM "foo" WHERE "foo"."id" IN (...) LIMIT ?',
+        )
+        self.assertEqual(
+            get_fingerprint('SELECT "foo"."id" FROM "foo" WHERE "foo"."id" IN (%s) LIMIT 21'),
+            'SELECT "foo"."id" FROM "foo" WHERE "foo"."id" IN (...) LIMIT ?',
+        )
+        self.assertEqual(
+            get_fingerprint('''SELECT * FROM "t2" WHERE "name" = 'it''s' AND "x1" > -1.5 AND "y" = %(y)s'''),
+            'SELECT * FROM "t2" WHERE "name" = ? AND "x1" > ? AND "y" = ?',
+        )
+        self.assertEqual(
+            get_fingerprint('INSERT INTO "foo" ("a", "b") VALUES (%s, %s), (%s, %s), (%s, %s)'),
+            'INSERT INTO "foo" ("a", "b") VALUES (?, ?), ...',
+        )
+        self.assertEqual(get_fingerprint('SAVEPOINT "s1403_x17"'), 'SAVEPOINT ?')
+        self.assertEqual(get_fingerprint('RELEASE SAVEPOINT "s1403_x17"'), 'RELEASE SAVEPOINT ?')
+        self.assertEqual(get_fingerprint('ROLLBACK TO SAVEPOINT s1_x2'), 'ROLLBACK TO SAVEPOINT ?')
+
+    def test_query_stats(self):
+        stats = QueryStats()
+        for duration in range(1, 101):
+            stats.add(duration)
+        self.assertEqual(stats.num_queries, 100)
+        self.assertEqual(stats.time_spent, 5050)
+        self.assertEqual(stats.mean, 50.5)
+        self.assertEqual(stats.p95, 95)
+
+        # The samples are bounded:
+        with mock.patch.object(QueryStats, 'MAX_SAMPLES', 10):
+            stats = QueryStats()
+            for duration in range(1000):
+                stats.add(duration)
+        self.assertEqual(len(stats.samples), 10)
+        self.assertEqual(stats.num_queries, 1000)
+        self.assertEqual(stats.mean, 499.5)
@@ -0,0 +1,127 @@
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from bx_django_utils.dbperf.cursor import LightweightCursorWrapper
+from bx_django_utils.dbperf.middleware import QuerySamplingMiddleware
+from bx_django_utils.dbperf.query_recorder import Logger, SQLQueryRecorder
+from bx_django_utils.test_utils.assert_queries import AssertQueries
+from bx_django_utils_tests.test_app.models import CreateOrUpdateTestModel
+
+
+COUNT_SQL = 'SELECT COUNT(*) AS "__count" FROM "test_app_createorupdatetestmodel"'
+
+
+def fake_get_response(request):
+    for name in ('foo', 'bar', 'baz'):
+        CreateOrUpdateTestModel.objects.filter(name=name).count()
+    CreateOrUpdateTestModel.objects.count()
+    return HttpResponse('ok')
+
+
+class QuerySamplingMiddlewareTestCase(TestCase):
+    databases = {'default', 'second'}
+
+    def setUp(self):
+        super().setUp()
+        self.middleware = QuerySamplingMiddleware(get_response=fake_get_response)
+
+    def test_not_sampled(self):
+        with mock.patch.object(QuerySamplingMiddleware, 'SAMPLE_RATE', 0), self.assertNoLogs(
+            'bx_django_utils.dbperf.middleware'
+        ):
+            response = self.middleware(RequestFactory().get('/foo/'))
+        self.assertEqual(response.content, b'ok')
+
+        # Recording is skipped, if another recorder is active:
+        with mock.patch.object(QuerySamplingMiddleware, 'SAMPLE_RATE', 1), AssertQueries() as queries, (
+            self.assertNoLogs('bx_django_utils.dbperf.middleware')
+        ):
+            self.middleware(RequestFactory().get('/foo/'))
+        queries.assert_query_count(4)
+
+    def test_header_not_allowed(self):
+        request = RequestFactory().get('/foo/', headers={'X-Record-Queries': '1'})
+
+        # The header is opt-in:
+        with mock.patch.object(QuerySamplingMiddleware, 'SAMPLE_RATE', 0), override_settings(DEBUG=True), (
+            self.assertNoLogs('bx_django_utils.dbperf.middleware')
+        ):
+            self.middleware(request)
+
+        # ...and only honored with DEBUG or for staff users:
+        with mock.patch.object(QuerySamplingMiddleware, 'SAMPLE_RATE', 0), mock.patch.object(
+            QuerySamplingMiddleware, 'HEADER', 'X-Record-Queries'
+        ), self.assertNoLogs('bx_django_utils.dbperf.middleware'):
+            self.middleware(request)
+            request.user = AnonymousUser()
+            self.middleware(request)
+            request.user = User(username='foo', is_staff=False)
+            self.middleware(request)
+
+        request.user = User(username='foo', is_staff=True)
+        with mock.patch.object(QuerySamplingMiddleware, 'SAMPLE_RATE', 0), mock.patch.object(
+            QuerySamplingMiddleware, 'HEADER', 'X-Record-Queries'
+        ), self.assertLogs('bx_django_utils.dbperf.middleware', level='INFO'):
+            self.middleware(request)
+
+    @override_settings(DEBUG=True)
+    def test_header(self):
+        request = RequestFactory().get('/foo/', headers={'X-Record-Queries': '1'})
+        with mock.patch.object(QuerySamplingMiddleware, 'SAMPLE_RATE', 0), mock.patch.object(
+            QuerySamplingMiddleware, 'HEADER', 'X-Record-Queries'
+        ), mock.patch.object(Logger, '_duplicate_key') as duplicate_key_mock, self.assertLogs(
+            'bx_django_utils.dbperf.middleware', level='INFO'
+        ) as logs:
+            response = self.middleware(request)
+        self.assertEqual(response.content, b'ok')
+
+        # Duplicates are reported by fingerprint, so the duplicate counting is skipped:
+        duplicate_key_mock.assert_not_called()
+
+        summary = logs.records[0].query_summary
+        self.assertEqual(summary['method'], 'GET')
+        self.assertEqual(summary['path'], '/foo/')
+        self.assertEqual(summary['status_code'], 200)
+        self.assertEqual(summary['num_queries'], 4)
+        self.assertGreater(summary['sql_time'], 0)
+        self.assertEqual(
+            [(duplicate['fingerprint'], duplicate['num_queries']) for duplicate in summary['duplicates']],
+            [(f'{COUNT_SQL} WHERE "test_app_createorupdatetestmodel"."name" = ?', 3)],
+        )
+
+        # Fast queries are recorded without details:
+        self.assertEqual(len(summary['slowest']), 3)
+        for query in summary['slowest']:
+            self.assertIn(COUNT_SQL, query['sql'])
+            self.assertEqual(query['stacktrace'], [])
+
+        message = logs.output[0]
+        self.assertIn('GET /foo/ (200): 4 queries in ', message)
+        self.assertIn(' * 3x in ', message)
+        self.assertIn(' * slow ', message)
+
+    def test_slow_queries(self):
+        request = RequestFactory().get('/bar/')
+        with mock.patch.object(QuerySamplingMiddleware, 'SAMPLE_RATE', 1), mock.patch.object(
+            QuerySamplingMiddleware, 'SLOW_QUERY_THRESHOLD', 0
+        ), self.assertLogs('bx_django_utils.dbperf.middleware', level='INFO') as logs:
+            self.middleware(request)
+
+        summary = logs.records[0].query_summary
+        self.assertEqual(summary['num_queries'], 4)
+        for query in summary['slowest']:
+            self.assertNotIn('%s', query['sql'])  # The full SQL with parameters
+            self.assertEqual(len(query['stacktrace']), 3)
+
+    def test_lightweight_cursor_wrapper(self):
+        with SQLQueryRecorder(databases={'default'}, cursor_wrapper_class=LightweightCursorWrapper) as rec:
+            CreateOrUpdateTestModel.objects.filter(name='foo').count()
+
+        res = rec.results()
+        self.assertEqual(res['num_queries'], 1)
+        _alias, query = res['queries'][0]
+        self.assertEqual(sorted(query), ['duration', 'raw_params', 'raw_sql', 'vendor'])
+        self.assertEqual(query['raw_params'], ('foo',))
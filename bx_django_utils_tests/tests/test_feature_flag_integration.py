@@ -8,6 +8,7 @@ from django.template.defaulttags import CsrfTokenNode
 from django.test import TestCase
 from django.utils import timezone
 
+from bx_django_utils.feature_flags.data_classes import FeatureFlag
 from bx_django_utils.feature_flags.test_utils import (
     FeatureFlagTestCaseMixin,
     get_feature_flag_db_info,
@@ -146,13 +147,14 @@ class PersistentFeatureFlagTestCase(FeatureFlagTestCaseMixin, TestCase):
         # Check initial state of "Foo"-Flag:
         self.assertTrue(foo_feature_flag.is_enabled)  # Foo initial == enabled
 
-        # Check will persistent the current stage of the flag:
-        self.assertEqual(get_feature_flag_db_info(), {'feature-flags-foo': 1})
-
         # Check initial state of "Bar"-Flag:
         self.assertFalse(bar_feature_flag.is_enabled)  # Bar initial == disabled
 
-        # Now both are persistent:
+        # A check only reads the state:
+        self.assertEqual(get_feature_flag_db_info(), {})
+
+        # Persistent the initial states:
+        FeatureFlag.registry.materialize_missing()
         self.assertEqual(get_feature_flag_db_info(), {'feature-flags-bar': 0, 'feature-flags-foo': 1})
         # Check get_feature_flag_states():
         self.assertEqual(get_feature_flag_states(), {'feature-flags-bar': False, 'feature-flags-foo': True})
@@ -1,24 +1,39 @@
-from unittest import mock
+import dataclasses
+import tracemalloc
+from typing import Any
+from unittest import mock, skipUnless
 from uuid import UUID
 
 from bx_py_utils.test_utils.datetime import parse_dt
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_slug
+from django.db import NotSupportedError, OperationalError, connection
 from django.db.utils import IntegrityError
 from django.test import TestCase
 from django.utils import timezone
 from model_bakery import baker
 
+from bx_django_utils.models import manipulate
 from bx_django_utils.models.manipulate import (
+    MODE_UPSERT,
     STORE_BEHAVIOR_IGNORE,
     STORE_BEHAVIOR_SET_IF_EMPTY,
     STORE_BEHAVIOR_SKIP_EMPTY,
+    ChunkStats,
     CreateOrUpdateResult,
     FieldUpdate,
     InvalidStoreBehavior,
+    _get_upsert_sql,
+    acreate,
+    acreate_or_update2,
+    bulk_create_or_update2,
     create,
     create_or_update,
     create_or_update2,
+    get_update_plan,
+    iter_create_or_update2,
+    plan_create_or_update2,
+    update_model_field,
 )
 from bx_django_utils.test_utils.datetime import MockDatetimeGenerator
 from bx_django_utils.test_utils.model_clean_assert import AssertModelCleanCalled
@@ -28,6 +43,7 @@ from bx_django_utils_tests.test_app.models import (
     PolymorphicCar,
     StoreSaveModel,
     TimetrackingTestModel,
+    UniqueKeyTestModel,
 )
 
 
@@ -521,3 +537,752 @@ class ModelManipulateTestCase(TestCase):
 
         # This should not crash
         car.refresh_from_db()
+
+    @mock.patch.object(timezone, 'now', MockDatetimeGenerator())
+    def test_bulk_create_or_update2(self):
+        baker.make(CreateOrUpdateTestModel, id=1, name='foo', slug='foo', blank_field='existing')
+
+        with self.assertNumQueries(5):  # SELECT + SAVEPOINT + INSERT + UPDATE + RELEASE
+            results = bulk_create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                rows=[
+                    {'id': 1, 'name': 'new name', 'slug': 'foo', 'blank_field': 'ignored'},
+                    {'id': 2, 'name': 'bar', 'slug': 'bar', 'blank_field': 'ignored'},
+                    {'id': 3, 'name': 'baz', 'slug': 'baz', 'blank_field': 'ignored'},
+                ],
+                lookup_fields=('id',),
+                store_behavior={'blank_field': STORE_BEHAVIOR_IGNORE},
+            )
+        self.assertEqual([result.created for result in results], [False, True, True])
+        self.assertEqual([result.instance.pk for result in results], [1, 2, 3])
+        self.assertEqual(results[0].updated_fields, ['name'])
+        self.assertEqual(
+            results[0].update_info, [FieldUpdate(field_name='name', old_value='foo', new_value='new name')]
+        )
+        self.assertEqual([result.ignored_fields for result in results], [['blank_field']] * 3)
+        self.assertEqual(
+            list(CreateOrUpdateTestModel.objects.order_by('id').values_list('id', 'name', 'slug', 'blank_field')),
+            [(1, 'new name', 'foo', 'existing'), (2, 'bar', 'bar', ''), (3, 'baz', 'baz', '')],
+        )
+        instance = CreateOrUpdateTestModel.objects.get(id=1)
+        self.assertEqual(instance.create_dt, parse_dt('2001-01-01T00:00:00+0000'))
+        self.assertEqual(instance.update_dt, parse_dt('2002-01-01T00:00:00+0000'))
+        instance = CreateOrUpdateTestModel.objects.get(id=2)
+        self.assertEqual(instance.create_dt, parse_dt('2002-01-01T00:00:00+0000'))
+        self.assertEqual(instance.update_dt, parse_dt('2002-01-01T00:00:00+0000'))
+
+        # Nothing changed -> only one SELECT per batch:
+        with self.assertNumQueries(2):
+            results = bulk_create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                rows=[{'slug': 'foo', 'name': 'new name'}, {'slug': 'bar', 'name': 'bar'}],
+                lookup_fields=('slug',),
+                batch_size=1,
+            )
+        self.assertEqual([result.created for result in results], [False, False])
+        self.assertEqual([result.updated_fields for result in results], [[], []])
+
+        # Lookup with multiple fields:
+        results = bulk_create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            rows=[
+                {'name': 'bar', 'slug': 'bar', 'null_field': 'changed'},
+                {'id': 4, 'name': 'bar', 'slug': 'new', 'null_field': 'created'},
+            ],
+            lookup_fields=('name', 'slug'),
+        )
+        self.assertEqual([result.created for result in results], [False, True])
+        self.assertEqual(results[0].instance.pk, 2)
+        self.assertEqual(results[0].updated_fields, ['null_field'])
+        self.assertEqual(CreateOrUpdateTestModel.objects.get(slug='new').null_field, 'created')
+
+        # "create_dt" of updated instances is not changed, in memory and in the database:
+        CreateOrUpdateTestModel.objects.filter(id=4).update(create_dt=None)
+        results = bulk_create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            rows=[{'id': 4, 'name': 'updated'}],
+            lookup_fields=('id',),
+        )
+        self.assertEqual(results[0].updated_fields, ['name'])
+        self.assertIsNone(results[0].instance.create_dt)
+        self.assertIsNone(CreateOrUpdateTestModel.objects.get(id=4).create_dt)
+
+        # Non-valid values will not be stored:
+        msg = str(validate_slug.message)
+        with self.assertRaisesMessage(ValidationError, msg):
+            bulk_create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                rows=[{'id': 1, 'slug': 'foo-bar'}, {'id': 2, 'slug': 'this is no Slug !'}],
+                lookup_fields=('id',),
+            )
+        self.assertEqual(CreateOrUpdateTestModel.objects.get(id=1).slug, 'foo')
+
+        with self.assertRaisesMessage(ValueError, "Lookup {'id': '1'} is used more than once in one batch!"):
+            bulk_create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                rows=[{'id': 1, 'name': 'one'}, {'id': '1', 'name': 'two'}],
+                lookup_fields=('id',),
+            )
+
+    @mock.patch.object(timezone, 'now', MockDatetimeGenerator())
+    async def test_acreate_or_update2(self):
+        instance = await acreate(ModelClass=CreateOrUpdateTestModel, id=1, name='First', slug='first')
+        assert instance.create_dt == parse_dt('2001-01-01T00:00:00+0000')
+        assert await CreateOrUpdateTestModel.objects.acount() == 1
+
+        # Nothing changed:
+        result = await acreate_or_update2(
+            ModelClass=CreateOrUpdateTestModel, lookup={'id': 1}, name='First', slug='first'
+        )
+        self.assertIsInstance(result, CreateOrUpdateResult)
+        assert result.created is False
+        assert result.updated_fields == []
+
+        # Update with the same result information as create_or_update2():
+        related = await TimetrackingTestModel.objects.acreate()
+        result = await acreate_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            lookup={'id': 1},
+            store_behavior={'slug': STORE_BEHAVIOR_SET_IF_EMPTY},
+            name='New name',
+            slug='not-stored',
+            many2one_rel=related,
+        )
+        assert result.created is False
+        assert result.updated_fields == ['name', 'many2one_rel']
+        self.assertEqual(
+            result.update_info,
+            [
+                FieldUpdate(field_name='name', old_value='First', new_value='New name'),
+                FieldUpdate(field_name='many2one_rel', old_value=None, new_value=related),
+            ],
+        )
+        assert result.not_overwritten_fields == ['slug']
+        instance = await CreateOrUpdateTestModel.objects.aget(id=1)
+        assert instance.name == 'New name'
+        assert instance.slug == 'first'
+        assert instance.many2one_rel_id == related.pk
+        assert instance.update_dt == parse_dt('2003-01-01T00:00:00+0000')
+
+        # Create a new one:
+        result = await acreate_or_update2(
+            ModelClass=CreateOrUpdateTestModel, lookup={'id': 2}, name='Second', slug='second'
+        )
+        assert result.created is True
+        assert result.instance.pk == 2
+
+        # Validation:
+        with self.assertRaises(ValidationError) as cm:
+            await acreate_or_update2(ModelClass=CreateOrUpdateTestModel, lookup={'id': 2}, slug='not valid !')
+        self.assertEqual(cm.exception.__notes__, ["model=test_app.CreateOrUpdateTestModel lookup={'id': 2}"])
+        with self.assertRaises(ValidationError) as cm:
+            await acreate(ModelClass=CreateOrUpdateTestModel, name='', slug='foo')
+        self.assertEqual(cm.exception.__notes__, ['model=test_app.CreateOrUpdateTestModel lookup=None'])
+
+        with self.assertRaisesMessage(ValueError, "Unknown mode: 'foo'"):
+            await acreate_or_update2(ModelClass=CreateOrUpdateTestModel, mode='foo')
+
+    def test_compact_result(self):
+        result = CreateOrUpdateResult()
+        assert not hasattr(result, '__dict__')
+        assert not hasattr(FieldUpdate('foo', 1, 2), '__dict__')
+
+        # Lists are allocated on first access:
+        assert result.has_updates() is False
+        assert result.updated_fields == []
+        result.updated_fields.append('foo')
+        assert result.has_updates() is True
+        self.assertEqual(result, CreateOrUpdateResult(updated_fields=['foo']))
+        self.assertEqual(
+            repr(CreateOrUpdateResult(ignored_fields=['bar'])),
+            'CreateOrUpdateResult(instance=None, created=False, updated_fields=[], update_info=[],'
+            " ignored_fields=['bar'], not_overwritten_fields=[], skip_empty_values=[])",
+        )
+
+        # Skip collecting the old/new values:
+        CreateOrUpdateTestModel.objects.create(id=1, name='Name', slug='slug')
+        result = create_or_update2(
+            ModelClass=CreateOrUpdateTestModel, lookup={'id': 1}, collect_update_info=False, name='New name'
+        )
+        assert result.updated_fields == ['name']
+        assert result.update_info == []
+        result, = bulk_create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            rows=[{'id': 1, 'name': 'Other name'}],
+            lookup_fields=('id',),
+            collect_update_info=False,
+        )
+        assert result.updated_fields == ['name']
+        assert result.update_info == []
+
+    def test_compact_result_benchmark(self):
+        @dataclasses.dataclass
+        class OldCreateOrUpdateResult:
+            # The previous, non-slotted implementation with eager allocated lists
+            instance: Any = None
+            created: bool = False
+            updated_fields: list = dataclasses.field(default_factory=list)
+            update_info: list = dataclasses.field(default_factory=list)
+            ignored_fields: list = dataclasses.field(default_factory=list)
+            not_overwritten_fields: list = dataclasses.field(default_factory=list)
+            skip_empty_values: list = dataclasses.field(default_factory=list)
+
+        def measure(ResultClass):
+            tracemalloc.start()
+            try:
+                results = [ResultClass(created=True) for _ in range(10_000)]
+                size, _peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            assert len(results) == 10_000
+            return size
+
+        old_size = measure(OldCreateOrUpdateResult)
+        new_size = measure(CreateOrUpdateResult)
+        self.assertLess(new_size, old_size / 3, f'{new_size=} {old_size=}')
+
+        # Results without collected "update_info" need less memory, too:
+        CreateOrUpdateTestModel.objects.create(id=1, name='Name', slug='slug')
+
+        def measure_updates(collect_update_info):
+            instance = CreateOrUpdateTestModel.objects.get(id=1)
+            tracemalloc.start()
+            try:
+                results = []
+                for no in range(1000):
+                    result = CreateOrUpdateResult(collect_update_info=collect_update_info)
+                    update_model_field(
+                        instance=instance, field_name='name', old_value=no, new_value=no + 1, result=result
+                    )
+                    results.append(result)
+                size, _peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            return size
+
+        self.assertLess(measure_updates(collect_update_info=False), measure_updates(collect_update_info=True) / 1.5)
+
+    def test_incremental_clean(self):
+        related = baker.make(TimetrackingTestModel)
+        CreateOrUpdateTestModel.objects.create(id=1, name='Name', slug='slug', many2one_rel=related)
+
+        # full_clean() validates also the unchanged ForeignKey:
+        with self.assertNumQueries(3):  # SELECT instance + SELECT related + UPDATE
+            result = create_or_update2(ModelClass=CreateOrUpdateTestModel, lookup={'id': 1}, name='Name 1')
+        assert result.updated_fields == ['name']
+
+        # Validate only changed fields:
+        with (
+            mock.patch.object(CreateOrUpdateTestModel, 'clean') as clean_mock,
+            self.assertNumQueries(2),  # SELECT instance + UPDATE
+        ):
+            result = create_or_update2(
+                ModelClass=CreateOrUpdateTestModel, lookup={'id': 1}, incremental_clean=True, name='Name 2'
+            )
+        assert result.updated_fields == ['name']
+        clean_mock.assert_not_called()
+
+        # Fields that should always be validated:
+        with self.assertNumQueries(3):
+            create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                lookup={'id': 1},
+                incremental_clean=True,
+                always_clean_fields=('many2one_rel',),
+                name='Name 3',
+            )
+
+        # Non-valid values will be still found:
+        msg = str(validate_slug.message)
+        with self.assertRaises(ValidationError) as cm:
+            create_or_update2(
+                ModelClass=CreateOrUpdateTestModel, lookup={'id': 1}, incremental_clean=True, slug='not valid !'
+            )
+        err = cm.exception
+        self.assertEqual(err.message_dict, {'slug': [msg]})
+        self.assertEqual(err.__notes__, ["model=test_app.CreateOrUpdateTestModel lookup={'id': 1}"])
+
+        with self.assertRaises(ValidationError) as cm:
+            bulk_create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                rows=[{'id': 1, 'name': ''}],
+                lookup_fields=('id',),
+                incremental_clean=True,
+            )
+        self.assertEqual(cm.exception.message_dict, {'name': ['This field cannot be blank.']})
+
+        with mock.patch.object(CreateOrUpdateTestModel, 'clean') as clean_mock:
+            result, = bulk_create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                rows=[{'id': 1, 'name': 'Name 4'}],
+                lookup_fields=('id',),
+                incremental_clean=True,
+            )
+        assert result.updated_fields == ['name']
+        clean_mock.assert_not_called()
+        assert CreateOrUpdateTestModel.objects.get(id=1).name == 'Name 4'
+
+    def test_plan_create_or_update2(self):
+        CreateOrUpdateTestModel.objects.create(id=1, name='Unchanged', slug='unchanged')
+        CreateOrUpdateTestModel.objects.create(id=2, name='Old name', slug='old-slug', blank_field='keep')
+        CreateOrUpdateTestModel.objects.create(id=3, name='Name', slug='slug')
+
+        results_iterator = plan_create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            rows=[
+                {'id': 1, 'name': 'Unchanged', 'slug': 'unchanged'},
+                {'id': 2, 'name': 'New name', 'slug': 'not-stored', 'blank_field': ''},
+                {'id': 3, 'name': 'Name', 'slug': 'new-slug', 'null_field': 'set'},
+                {'id': 4, 'name': 'New', 'slug': 'new'},
+            ],
+            lookup_fields=('id',),
+            batch_size=2,
+            store_behavior={'slug': STORE_BEHAVIOR_SET_IF_EMPTY, 'blank_field': STORE_BEHAVIOR_SKIP_EMPTY},
+        )
+        with self.assertNumQueries(1):
+            result1 = next(results_iterator)
+        assert result1.created is False
+        assert result1.updated_fields == []
+
+        with self.assertNumQueries(0):
+            result2 = next(results_iterator)
+        assert result2.created is False
+        assert result2.updated_fields == ['name']
+        self.assertEqual(
+            result2.update_info, [FieldUpdate(field_name='name', old_value='Old name', new_value='New name')]
+        )
+        assert result2.not_overwritten_fields == ['slug']
+        assert result2.skip_empty_values == ['blank_field']
+
+        with self.assertNumQueries(1):
+            result3, result4 = results_iterator
+        assert result3.created is False
+        assert result3.updated_fields == ['null_field']
+        assert result4.created is True
+        assert result4.instance.name == 'New'
+
+        # Nothing was written:
+        self.assertQuerySetEqual(
+            CreateOrUpdateTestModel.objects.order_by('id').values_list('id', 'name', 'slug', 'null_field'),
+            [(1, 'Unchanged', 'unchanged', None), (2, 'Old name', 'old-slug', None), (3, 'Name', 'slug', None)],
+        )
+
+        # Non-valid values raise the ValidationError, as a real import would do:
+        with self.assertRaises(ValidationError) as cm:
+            list(
+                plan_create_or_update2(
+                    ModelClass=CreateOrUpdateTestModel,
+                    rows=[{'id': 1, 'slug': 'not valid !'}],
+                    lookup_fields=('id',),
+                )
+            )
+        self.assertEqual(cm.exception.__notes__, ["model=test_app.CreateOrUpdateTestModel lookup={'id': 1}"])
+
+    def test_plan_create_or_update2_repeated_lookups(self):
+        CreateOrUpdateTestModel.objects.create(id=1, name='Old name', slug='old')
+        rows = [
+            {'id': 1, 'name': 'New name'},
+            {'id': 2, 'name': 'Created', 'slug': 'created'},
+            {'id': 1, 'name': 'New name'},  # Same as planned in the first batch
+            {'id': 2, 'name': 'Renamed', 'slug': 'created'},
+            {'id': 1, 'name': 'Last name'},
+        ]
+        kwargs = {'ModelClass': CreateOrUpdateTestModel, 'rows': rows, 'lookup_fields': ('id',), 'batch_size': 2}
+        expected = [
+            (False, ['name']),
+            (True, []),
+            (False, []),
+            (False, ['name']),
+            (False, ['name']),
+        ]
+        planned = [(result.created, result.updated_fields) for result in plan_create_or_update2(**kwargs)]
+        self.assertEqual(planned, expected)
+        assert CreateOrUpdateTestModel.objects.count() == 1
+
+        # The real import has the same results:
+        results = bulk_create_or_update2(**kwargs)
+        self.assertEqual([(result.created, result.updated_fields) for result in results], expected)
+        self.assertQuerySetEqual(
+            CreateOrUpdateTestModel.objects.order_by('id').values_list('id', 'name'),
+            [(1, 'Last name'), (2, 'Renamed')],
+        )
+
+    def test_iter_create_or_update2(self):
+        CreateOrUpdateTestModel.objects.create(id=1, name='Unchanged', slug='unchanged')
+        CreateOrUpdateTestModel.objects.create(id=2, name='Old name', slug='updated')
+
+        def rows():
+            yield {'id': 1, 'name': 'Unchanged', 'slug': 'unchanged'}
+            yield {'id': 2, 'name': 'New name', 'slug': 'updated'}
+            yield {'id': 3, 'name': 'Not valid', 'slug': 'not valid !'}
+            yield {'id': 4, 'name': 'Created', 'slug': 'created'}
+            yield {'id': 5, 'name': 'Also created', 'slug': 'also-created'}
+
+        stats_iterator = iter_create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            rows=rows(),
+            lookup_fields=('id',),
+            chunk_size=3,
+            store_behavior={'slug': STORE_BEHAVIOR_SKIP_EMPTY},
+        )
+        stats1 = next(stats_iterator)
+        self.assertIsInstance(stats1, ChunkStats)
+        assert stats1.duration > 0
+        (row_no, lookup, err), = stats1.errors
+        assert row_no == 3
+        assert lookup == {'id': 3}
+        self.assertIsInstance(err, ValidationError)
+        self.assertEqual(err.__notes__, ['model=test_app.CreateOrUpdateTestModel lookup=None'])
+        self.assertEqual(
+            dataclasses.replace(stats1, duration=0, errors=[]),
+            ChunkStats(chunk_no=1, rows=3, created=0, updated=1, unchanged=1, failed=1),
+        )
+
+        # The first chunk is committed, the non-valid row is rolled back:
+        self.assertQuerySetEqual(
+            CreateOrUpdateTestModel.objects.order_by('id').values_list('id', 'name'),
+            [(1, 'Unchanged'), (2, 'New name')],
+        )
+
+        stats2, = stats_iterator
+        self.assertEqual(
+            dataclasses.replace(stats2, duration=0),
+            ChunkStats(chunk_no=2, rows=2, created=2),
+        )
+        self.assertQuerySetEqual(
+            CreateOrUpdateTestModel.objects.order_by('id').values_list('id', flat=True),
+            [1, 2, 4, 5],
+        )
+
+        # Without lookup fields, all rows are created:
+        stats, = iter_create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            rows=[{'id': 6, 'name': 'foo', 'slug': 'foo'}, {'id': 7, 'name': 'bar', 'slug': 'bar'}],
+            lookup_fields=None,
+        )
+        self.assertEqual(dataclasses.replace(stats, duration=0), ChunkStats(chunk_no=1, rows=2, created=2))
+        assert CreateOrUpdateTestModel.objects.count() == 6
+
+        # Bad data of one row doesn't abort the chunk:
+        stats, = iter_create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            rows=[
+                {'name': 'Missing lookup field', 'slug': 'missing'},
+                {'id': 'abc', 'name': 'Non-valid lookup', 'slug': 'non-valid'},
+                {'id': 8, 'name': 'Non-valid value', 'slug': 'this is no Slug !'},
+                {'id': 9, 'name': 'Stored', 'slug': 'stored'},
+            ],
+            lookup_fields=('id',),
+        )
+        self.assertEqual(
+            dataclasses.replace(stats, duration=0, errors=[]), ChunkStats(chunk_no=1, rows=4, created=1, failed=3)
+        )
+        self.assertEqual(
+            [(row_no, lookup, err.message_dict) for row_no, lookup, err in stats.errors],
+            [
+                (1, None, {'id': ['Missing lookup field.']}),
+                (2, None, {'id': ['“abc” value must be an integer.']}),
+                (3, {'id': 8}, {'slug': [validate_slug.message]}),
+            ],
+        )
+        assert CreateOrUpdateTestModel.objects.filter(id=9).exists()
+
+        # Wrong arguments are not row failures:
+        with self.assertRaisesMessage(TypeError, "got unexpected keyword arguments: 'store_behaviour'"):
+            list(
+                iter_create_or_update2(
+                    ModelClass=CreateOrUpdateTestModel,
+                    rows=[{'id': 10, 'name': 'foo', 'slug': 'foo'}],
+                    lookup_fields=('id',),
+                    store_behaviour={'name': STORE_BEHAVIOR_SKIP_EMPTY},
+                )
+            )
+
+        # Other database errors are not row failures:
+        with (
+            mock.patch.object(manipulate, 'create_or_update2', side_effect=OperationalError('database is locked')),
+            self.assertRaisesMessage(OperationalError, 'database is locked'),
+        ):
+            list(
+                iter_create_or_update2(
+                    ModelClass=CreateOrUpdateTestModel,
+                    rows=[{'id': 10, 'name': 'foo', 'slug': 'foo'}],
+                    lookup_fields=('id',),
+                )
+            )
+
+    def test_get_update_plan(self):
+        plan = get_update_plan(
+            ModelClass=CreateOrUpdateTestModel,
+            store_behavior={'name': STORE_BEHAVIOR_IGNORE, 'slug': STORE_BEHAVIOR_SKIP_EMPTY},
+        )
+        assert plan.ignore_fields == {'name'}
+        assert plan.set_if_empty_fields == frozenset()
+        assert plan.skip_empty_fields == {'slug'}
+        assert plan.uuid_fields == {'uuid_field'}
+        assert plan.attnames['pk'] == 'id'
+        assert plan.attnames['many2one_rel'] == 'many2one_rel_id'
+        assert 'createorupdatetestmodel_ptr' not in plan.all_field_names
+
+        # Equal store behaviors (independent of the order) return the same cached plan:
+        assert plan is get_update_plan(
+            ModelClass=CreateOrUpdateTestModel,
+            store_behavior={'slug': STORE_BEHAVIOR_SKIP_EMPTY, 'name': STORE_BEHAVIOR_IGNORE},
+        )
+        assert get_update_plan(ModelClass=CreateOrUpdateTestModel) is get_update_plan(
+            ModelClass=CreateOrUpdateTestModel, store_behavior={}
+        )
+        assert plan is not get_update_plan(ModelClass=CreateOrUpdateTestModel)
+
+        # create_or_update2() reuses the plan:
+        CreateOrUpdateTestModel.objects.create(id=1, name='Old name', slug='bar')
+        with mock.patch(
+            'bx_django_utils.models.manipulate.get_update_plan', wraps=get_update_plan
+        ) as get_update_plan_mock:
+            result = create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                lookup={'id': 1},
+                store_behavior={'name': STORE_BEHAVIOR_IGNORE, 'slug': STORE_BEHAVIOR_SKIP_EMPTY},
+                name='Not stored',
+                slug='foo',
+            )
+        assert get_update_plan_mock.call_count == 1
+        assert get_update_plan_mock.call_args.kwargs['ModelClass'] is CreateOrUpdateTestModel
+        assert result.ignored_fields == ['name']
+        assert result.updated_fields == ['slug']
+
+    def test_create_or_update2_upsert_checks(self):
+        with self.assertRaisesMessage(ValueError, "Unknown mode: 'foo'"):
+            create_or_update2(ModelClass=CreateOrUpdateTestModel, lookup={'id': 1}, mode='foo')
+
+        with self.assertRaisesMessage(ValueError, "Lookup fields ['slug'] are not covered by one unique constraint!"):
+            create_or_update2(ModelClass=CreateOrUpdateTestModel, lookup={'slug': 'foo'}, mode=MODE_UPSERT)
+
+        with self.assertRaisesMessage(NotSupportedError, 'STORE_BEHAVIOR_SET_IF_EMPTY is not supported'):
+            create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                lookup={'id': 1},
+                mode=MODE_UPSERT,
+                store_behavior={'name': STORE_BEHAVIOR_SET_IF_EMPTY},
+                name='foo',
+            )
+
+        with self.assertRaisesMessage(NotSupportedError, 'Upsert of models with parents is not supported'):
+            create_or_update2(ModelClass=PolymorphicBike, lookup={'license_plate': 'foo'}, mode=MODE_UPSERT)
+
+        if connection.vendor != 'postgresql':
+            with self.assertRaisesMessage(NotSupportedError, 'Upsert is not supported for database vendor'):
+                create_or_update2(ModelClass=CreateOrUpdateTestModel, lookup={'id': 1}, mode=MODE_UPSERT)
+
+    def test_upsert_sql(self):
+        # Runs with all database backends, the statement itself needs PostgreSQL:
+        instance = CreateOrUpdateTestModel(id=1, name='foo', slug='foo')
+        opts = CreateOrUpdateTestModel._meta
+        columns = (
+            '"id", "create_dt", "update_dt", "name", "slug",'
+            ' "many2one_rel_id", "blank_field", "null_field", "uuid_field"'
+        )
+        sql, params, fields = _get_upsert_sql(
+            instance=instance,
+            conflict_fields=[opts.get_field('id')],
+            update_fields={'name': opts.get_field('name'), 'update_dt': opts.get_field('update_dt')},
+            is_timetracking=True,
+            connection=connection,
+        )
+        self.assertEqual(
+            sql,
+            f'WITH old AS (SELECT {columns} FROM "test_app_createorupdatetestmodel" WHERE "id" = %s),'
+            f' new AS (INSERT INTO "test_app_createorupdatetestmodel" ({columns})'
+            ' VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)'
+            ' ON CONFLICT ("id") DO UPDATE SET "name" = EXCLUDED."name", "update_dt" = EXCLUDED."update_dt"'
+            ' WHERE ROW("test_app_createorupdatetestmodel"."name", "test_app_createorupdatetestmodel"."update_dt")'
+            ' IS DISTINCT FROM ROW(EXCLUDED."name", EXCLUDED."update_dt")'
+            f' RETURNING {columns}, (xmax = 0) AS created)'
+            ' SELECT true, new.* FROM new UNION ALL SELECT false, old.*, NULL FROM old',
+        )
+        self.assertEqual(params[:2], [1, 1])  # conflict + insert value of "id"
+        self.assertEqual(fields, list(opts.local_concrete_fields))
+
+        # "update_dt" is added to the SET clause and nothing is updated without update fields:
+        sql, params, fields = _get_upsert_sql(
+            instance=instance,
+            conflict_fields=[opts.get_field('id')],
+            update_fields={'name': opts.get_field('name')},
+            is_timetracking=True,
+            connection=connection,
+        )
+        self.assertIn(' DO UPDATE SET "name" = EXCLUDED."name", "update_dt" = EXCLUDED."update_dt" WHERE ', sql)
+        sql, params, fields = _get_upsert_sql(
+            instance=instance,
+            conflict_fields=[opts.get_field('id')],
+            update_fields={},
+            is_timetracking=True,
+            connection=connection,
+        )
+        self.assertIn(' ON CONFLICT ("id") DO NOTHING RETURNING ', sql)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Upsert mode needs PostgreSQL')
+    @mock.patch.object(timezone, 'now', MockDatetimeGenerator())
+    def test_create_or_update2_upsert(self):
+        # Create a new entry:
+        with self.assertNumQueries(1):
+            result = create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                lookup={'id': 1},
+                mode=MODE_UPSERT,
+                name='First entry',
+                slug='first',
+            )
+        self.assertIs(result.created, True)
+        instance = result.instance
+        self.assertIsInstance(instance, CreateOrUpdateTestModel)
+        self.assertEqual(instance.id, 1)
+        self.assertEqual(instance.slug, 'first')
+        self.assertEqual(instance.create_dt, parse_dt('2001-01-01T00:00:00+0000'))
+        self.assertEqual(instance.update_dt, parse_dt('2001-01-01T00:00:00+0000'))
+        self.assertEqual(result.updated_fields, [])
+        self.assertEqual(result.update_info, [])
+
+        # Change only 'slug':
+        with self.assertNumQueries(1):
+            result = create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                lookup={'id': 1},
+                mode=MODE_UPSERT,
+                name='First entry',
+                slug='change-value',
+            )
+        self.assertIs(result.created, False)
+        instance = result.instance
+        self.assertEqual(instance.slug, 'change-value')
+        self.assertEqual(instance.create_dt, parse_dt('2001-01-01T00:00:00+0000'))  # not changed!
+        self.assertEqual(instance.update_dt, parse_dt('2002-01-01T00:00:00+0000'))
+        self.assertEqual(result.updated_fields, ['slug'])
+        self.assertEqual(
+            result.update_info, [FieldUpdate(field_name='slug', old_value='first', new_value='change-value')]
+        )
+
+        # Nothing changed -> row is not rewritten:
+        result = create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            lookup={'id': 1},
+            mode=MODE_UPSERT,
+            name='First entry',
+            slug='change-value',
+        )
+        self.assertIs(result.created, False)
+        self.assertEqual(result.updated_fields, [])
+        self.assertEqual(result.instance.update_dt, parse_dt('2002-01-01T00:00:00+0000'))  # not changed!
+
+        # Skip empty values:
+        result = create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            lookup={'id': 1},
+            mode=MODE_UPSERT,
+            store_behavior={'name': STORE_BEHAVIOR_SKIP_EMPTY},
+            name='',
+            uuid_field='00000000-0000-0000-0000-000000000001',
+        )
+        self.assertEqual(result.skip_empty_values, ['name'])
+        self.assertEqual(result.updated_fields, ['uuid_field'])
+        self.assertEqual(
+            result.update_info,
+            [
+                FieldUpdate(
+                    field_name='uuid_field', old_value=None, new_value=UUID('00000000-0000-0000-0000-000000000001')
+                )
+            ],
+        )
+        instance = CreateOrUpdateTestModel.objects.get(id=1)
+        self.assertEqual(instance.name, 'First entry')
+        self.assertEqual(instance.uuid_field, UUID('00000000-0000-0000-0000-000000000001'))
+
+        # Non-valid values will not be stored:
+        with self.assertRaisesMessage(ValidationError, str(validate_slug.message)):
+            create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                lookup={'id': 1},
+                mode=MODE_UPSERT,
+                slug='this is no Slug !',
+            )
+        self.assertEqual(CreateOrUpdateTestModel.objects.get(id=1).slug, 'change-value')
+
+        # Required fields that are not passed are only validated, if the row is inserted:
+        with self.assertNumQueries(3):  # SAVEPOINT + INSERT ... ON CONFLICT + RELEASE
+            result = create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                lookup={'id': 1},
+                mode=MODE_UPSERT,
+                null_field='updated',
+            )
+        self.assertEqual(result.updated_fields, ['null_field'])
+        with self.assertRaisesMessage(ValidationError, 'This field cannot be blank.'):
+            create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                lookup={'id': 2},
+                mode=MODE_UPSERT,
+                null_field='not stored',
+            )
+        self.assertIs(CreateOrUpdateTestModel.objects.filter(id=2).exists(), False)
+
+        # A passed "update_dt" is stored (and not set twice):
+        result = create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            lookup={'id': 1},
+            mode=MODE_UPSERT,
+            name='First entry',
+            slug='change-value',
+            update_dt=parse_dt('2000-01-01T00:00:00+0000'),
+        )
+        self.assertEqual(result.updated_fields, ['update_dt'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Upsert mode needs PostgreSQL')
+    def test_create_or_update2_upsert_unique_lookup(self):
+        UniqueKeyTestModel.objects.create(key='first', slug='first', name='First entry')
+        UniqueKeyTestModel.objects.create(key='second', slug='second', name='Second entry')
+
+        # The existing row is not a duplicate of itself, neither for "unique=True" nor for a UniqueConstraint:
+        with self.assertNumQueries(4):  # SELECT pk + unique checks of "key" and "slug" + INSERT ... ON CONFLICT
+            result = create_or_update2(
+                ModelClass=UniqueKeyTestModel,
+                lookup={'key': 'first'},
+                mode=MODE_UPSERT,
+                validate_unique=True,
+                slug='first',
+                name='Changed',
+            )
+        self.assertIs(result.created, False)
+        self.assertEqual(result.updated_fields, ['name'])
+
+        result = create_or_update2(
+            ModelClass=UniqueKeyTestModel,
+            lookup={'slug': 'second'},
+            mode=MODE_UPSERT,
+            key='second',
+            name='Changed',
+        )
+        self.assertIs(result.created, False)
+        self.assertEqual(result.updated_fields, ['name'])
+
+        # Real duplicates are still found:
+        with self.assertRaisesMessage(ValidationError, 'Unique key test model with this Slug already exists.'):
+            create_or_update2(
+                ModelClass=UniqueKeyTestModel,
+                lookup={'key': 'first'},
+                mode=MODE_UPSERT,
+                slug='second',
+                name='Changed',
+            )
+        with self.assertRaisesMessage(ValidationError, 'Unique key test model with this Key already exists.'):
+            create_or_update2(
+                ModelClass=UniqueKeyTestModel,
+                lookup={'slug': 'third'},
+                mode=MODE_UPSERT,
+                validate_unique=True,
+                key='first',
+                name='New entry',
+            )
+        self.assertEqual(
+            list(UniqueKeyTestModel.objects.order_by('key').values_list('key', 'slug', 'name')),
+            [('first', 'first', 'Changed'), ('second', 'second', 'Changed')],
+        )
@@ -0,0 +1,166 @@
+import multiprocessing
+from unittest import mock, skipUnless
+
+from django.core.exceptions import ValidationError
+from django.db import NotSupportedError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from bx_django_utils.models import parallel_manipulate
+from bx_django_utils.models.manipulate import ChunkStats, _iter_batches
+from bx_django_utils.models.parallel_manipulate import ImportSummary, get_partition, parallel_create_or_update2
+from bx_django_utils_tests.test_app.models import CreateOrUpdateTestModel
+
+
+def get_rows(count, offset=0):
+    for no in range(offset + 1, offset + count + 1):
+        yield {'id': no, 'name': f'Name {no}', 'slug': f'slug-{no}'}
+
+
+class ParallelCreateOrUpdateTestCase(TestCase):
+    def test_get_partition(self):
+        fields = [CreateOrUpdateTestModel._meta.pk]
+        partitions = [get_partition(lookup_fields=fields, lookup_values=[no], partitions=4) for no in range(1, 101)]
+        assert set(partitions) == {0, 1, 2, 3}
+
+        # Stable and the values are normalized via the model fields:
+        assert get_partition(lookup_fields=fields, lookup_values=['23'], partitions=4) == partitions[22]
+        assert get_partition(lookup_fields=fields, lookup_values=[23], partitions=4) == partitions[22]
+
+    def test_inline(self):
+        CreateOrUpdateTestModel.objects.create(id=1, name='Old name', slug='slug-1')
+
+        rows = list(get_rows(count=5))
+        rows[2]['slug'] = 'Not valid!'
+        summary = parallel_create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            rows=rows,
+            lookup_fields=('id',),
+            processes=1,
+            chunk_size=2,
+        )
+        self.assertIsInstance(summary, ImportSummary)
+        assert summary.duration > 0
+        (row_no, lookup, err), = summary.errors
+        assert (row_no, lookup) == (3, {'id': 3})
+        self.assertIsInstance(err, ValidationError)
+        summary.duration = 0
+        summary.errors = []
+        self.assertEqual(
+            summary, ImportSummary(chunks=3, rows=5, created=3, updated=1, unchanged=0, failed=1)
+        )
+        self.assertQuerySetEqual(
+            CreateOrUpdateTestModel.objects.order_by('id').values_list('id', 'name'),
+            [(1, 'Name 1'), (2, 'Name 2'), (4, 'Name 4'), (5, 'Name 5')],
+        )
+
+    def test_in_transaction(self):
+        with self.assertRaisesMessage(RuntimeError, 'can not be used in a transaction'):
+            parallel_create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                rows=get_rows(count=5),
+                lookup_fields=('id',),
+                processes=2,
+            )
+
+
+class ParallelCreateOrUpdateVendorTestCase(TransactionTestCase):
+    @skipUnless(connection.vendor != 'postgresql', 'Test for other database backends')
+    def test_other_backends(self):
+        # No forked workers by default:
+        summary = parallel_create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            rows=get_rows(count=5),
+            lookup_fields=('id',),
+            chunk_size=2,
+        )
+        assert (summary.chunks, summary.created) == (3, 5)
+
+        with self.assertRaisesMessage(NotSupportedError, 'Parallel workers are not supported for database vendor'):
+            parallel_create_or_update2(
+                ModelClass=CreateOrUpdateTestModel,
+                rows=get_rows(count=5),
+                lookup_fields=('id',),
+                processes=2,
+            )
+        assert CreateOrUpdateTestModel.objects.count() == 5
+
+
+def fake_iter_chunk_stats(*, ModelClass, numbered_rows, lookup_fields, chunk_size, kwargs):
+    # Runs in the forked workers without database access:
+    for chunk_no, chunk in enumerate(_iter_batches(numbered_rows, chunk_size), start=1):
+        if any(row['name'] == 'crash' for _row_no, row in chunk):
+            raise ZeroDivisionError
+        yield ChunkStats(chunk_no=chunk_no, rows=len(chunk), created=len(chunk))
+
+
+@mock.patch.object(parallel_manipulate, '_iter_chunk_stats', fake_iter_chunk_stats)
+class ParallelRunnerTestCase(SimpleTestCase):
+    """"""  # noqa - Don't add to README
+
+    def setUp(self):
+        super().setUp()
+        if multiprocessing.current_process().daemon:
+            self.skipTest('Daemonic processes of the parallel test runner can not fork workers')
+
+    def get_runner(self):
+        return parallel_manipulate._Runner(
+            ModelClass=CreateOrUpdateTestModel,
+            lookup_fields=('id',),
+            processes=2,
+            chunk_size=3,
+            max_errors=1,
+            kwargs={},
+        )
+
+    def test_runner(self):
+        runner = self.get_runner()
+        runner.start()
+        rows = list(enumerate(get_rows(count=10), start=1))
+        runner.send(0, rows[:6])
+        runner.send(1, rows[6:])
+        runner.wait()
+        self.assertEqual(runner.summary, ImportSummary(chunks=4, rows=10, created=10))
+
+    def test_worker_error(self):
+        runner = self.get_runner()
+        runner.start()
+        runner.send(1, [(1, {'id': 1, 'name': 'crash'})])
+        with self.assertRaisesMessage(RuntimeError, 'Worker 1 failed:'):
+            runner.wait()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Forked workers need a database server')
+class ParallelCreateOrUpdateProcessesTestCase(TransactionTestCase):
+    def test_processes(self):
+        CreateOrUpdateTestModel.objects.create(id=1, name='Old name', slug='slug-1')
+        CreateOrUpdateTestModel.objects.create(id=2, name='Name 2', slug='slug-2')
+
+        def rows():
+            yield from get_rows(count=50)
+            yield {'id': 51, 'name': 'Not valid', 'slug': 'Not valid!'}
+            yield {'name': 'Missing lookup field', 'slug': 'missing'}
+            yield {'id': 'abc', 'name': 'Not valid lookup', 'slug': 'not-valid'}
+            yield from get_rows(count=49, offset=51)
+
+        summary = parallel_create_or_update2(
+            ModelClass=CreateOrUpdateTestModel,
+            rows=rows(),
+            lookup_fields=('id',),
+            processes=3,
+            chunk_size=10,
+            max_errors=10,
+        )
+        self.assertEqual(
+            sorted((row_no, lookup, type(err)) for row_no, lookup, err in summary.errors),
+            [(51, {'id': 51}, ValidationError), (52, None, ValidationError), (53, None, ValidationError)],
+        )
+        assert summary.chunks >= 10
+        assert summary.rows == 102
+        assert summary.created == 97
+        assert summary.updated == 1
+        assert summary.unchanged == 1
+        assert summary.failed == 3
+
+        assert CreateOrUpdateTestModel.objects.count() == 99
+        assert CreateOrUpdateTestModel.objects.get(id=1).name == 'Name 1'
+        assert not CreateOrUpdateTestModel.objects.filter(id=51).exists()
@@ -1,7 +1,20 @@
+import os
+import pickle
+from unittest import mock
+
 from bx_py_utils.test_utils.assertion import assert_equal
 from django.test import TestCase
 
-from bx_django_utils.stacktrace import get_stacktrace, iter_frameinfo
+import bx_django_utils
+from bx_django_utils import stacktrace as stacktrace_module
+from bx_django_utils.stacktrace import (
+    FrameInfo,
+    StacktraceAfter,
+    _exclude,
+    _get_excluded_paths,
+    get_stacktrace,
+    iter_frameinfo,
+)
 
 
 def foo():
@@ -54,3 +67,53 @@ class StacktraceTestCase(TestCase):
             ('foo', 'return get_stacktrace(exclude_modules=exclude_modules)'),
         ]
         assert_equal(current_info, expected)
+
+    def test_excluded_paths_cache(self):
+        package_path = os.path.realpath(os.path.dirname(bx_django_utils.__file__))
+        self.assertEqual(_get_excluded_paths(('bx_django_utils',)), (package_path,))
+
+        self.assertIs(_exclude(stacktrace_module.__file__, ['bx_django_utils', 'json']), True)
+        self.assertIs(_exclude(os.__file__, ('bx_django_utils', 'json')), False)
+
+        # The modules are resolved only once per tuple:
+        with mock.patch.object(stacktrace_module, 'import_module', side_effect=AssertionError):
+            self.assertIs(_exclude(os.__file__, ('bx_django_utils', 'json')), False)
+            get_stacktrace(exclude_modules=('bx_django_utils', 'json'))
+
+    def test_lazy_frameinfo(self):
+        with mock.patch.object(stacktrace_module.linecache, 'getline') as getline:
+            stacktrace = get_stacktrace(tidy=False)
+            getline.assert_not_called()
+
+        last_frame = stacktrace[-1]
+        self.assertIsInstance(last_frame, FrameInfo)
+        self.assertEqual(last_frame.filename, os.path.realpath(__file__))
+        self.assertEqual(last_frame.func, 'test_lazy_frameinfo')
+        self.assertEqual(last_frame.code, 'stacktrace = get_stacktrace(tidy=False)')
+        self.assertFalse(hasattr(last_frame, '__dict__'))
+
+        # The source line is resolved only once:
+        with mock.patch.object(stacktrace_module.linecache, 'getline') as getline:
+            self.assertEqual(last_frame.code, 'stacktrace = get_stacktrace(tidy=False)')
+            getline.assert_not_called()
+
+        # Code objects can't be pickled, so the resolved values are used:
+        frameinfo = pickle.loads(pickle.dumps(last_frame))
+        self.assertEqual(str(frameinfo), str(last_frame))
+
+        # The old constructor still works:
+        frameinfo = FrameInfo('/foo.py', 1, 'foo', 'pass')
+        self.assertEqual(repr(frameinfo), "<FrameInfo /foo.py 1 'foo' 'pass'>")
+
+    def test_stacktrace_after(self):
+        def record():  # e.g.: RecordingCursorWrapper._record()
+            return StacktraceAfter(after_modules=('bx_django_utils_tests',))()
+
+        def run_query():  # A frame in "after_modules"
+            return record()
+
+        stacktrace = run_query()
+        self.assertIsInstance(stacktrace[-1], FrameInfo)
+        funcs = [frameinfo.func for frameinfo in stacktrace]
+        self.assertNotIn('run_query', funcs)
+        self.assertNotIn('test_stacktrace_after', funcs)
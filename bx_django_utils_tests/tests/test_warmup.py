@@ -0,0 +1,88 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from bx_django_utils.feature_flags.data_classes import FeatureFlag
+from bx_django_utils.feature_flags.models import FeatureFlagModel
+from bx_django_utils.feature_flags.state import State
+from bx_django_utils.feature_flags.test_utils import FeatureFlagTestCaseMixin
+from bx_django_utils.warmup import _callbacks, register_warm_up, warm_up
+
+
+class WarmUpTestCase(FeatureFlagTestCaseMixin, TestCase):
+    warum_up_feature_flag_cache = False
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(_callbacks, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+        @register_warm_up
+        def callback():
+            self.calls.append('callback')
+
+        register_warm_up(lambda: self.calls.append('lambda'), name='named')
+
+    def test_warm_up(self):
+        flag = FeatureFlag(
+            cache_key='warm-up',
+            human_name='Warm-up',
+            initial_enabled=False,
+            cache_duration=datetime.timedelta(seconds=60),
+        )
+        FeatureFlagModel.objects.create(cache_key='feature-flags-warm-up', state=State.ENABLED)
+        ContentType.objects.clear_cache()
+
+        with self.assertLogs('bx_django_utils.warmup', level='INFO'):
+            steps = warm_up()
+        self.assertEqual(
+            [step.name for step in steps],
+            [
+                'feature flags',
+                'content types',
+                'version',
+                'bx_django_utils_tests.tests.test_warmup.WarmUpTestCase.setUp.<locals>.callback',
+                'named',
+            ],
+        )
+        self.assertTrue(all(step.duration >= 0 and step.error is None for step in steps))
+        self.assertEqual(self.calls, ['callback', 'lambda'])
+
+        with self.assertNumQueries(0):
+            self.assertIs(flag.is_enabled, True)
+            ContentType.objects.get_for_model(FeatureFlagModel)
+
+    def test_errors(self):
+        @register_warm_up(name='broken')
+        def broken():
+            raise ZeroDivisionError
+
+        with self.assertLogs('bx_django_utils.warmup', level='ERROR') as logs:
+            steps = warm_up()
+        self.assertIn("Warm-up step 'broken' failed", logs.output[0])
+        self.assertIsInstance(steps[-1].error, ZeroDivisionError)
+        self.assertEqual(self.calls, ['callback', 'lambda'])  # Other steps are not affected
+
+        with self.assertLogs('bx_django_utils.warmup'), self.assertRaises(ZeroDivisionError):
+            warm_up(raise_errors=True)
+
+        with self.assertLogs('bx_django_utils.warmup'), self.assertRaisesMessage(
+            CommandError, 'Warm-up steps failed: broken'
+        ):
+            call_command('warm_up', stdout=StringIO())
+
+    def test_command(self):
+        stdout = StringIO()
+        with self.assertLogs('bx_django_utils.warmup', level='INFO'):
+            call_command('warm_up', stdout=stdout)
+        output = stdout.getvalue()
+        self.assertRegex(output, r' \* feature flags: \d+\.\d ms\n')
+        self.assertRegex(output, r' \* named: \d+\.\d ms\n')
+        self.assertRegex(output, r'5 warm-up steps in \d+\.\d ms\n$')
+        self.assertEqual(self.calls, ['callback', 'lambda'])